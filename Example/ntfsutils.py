@@ -49,6 +49,25 @@ ATTRIBUTES_FIELDS = {
         ("FilenameNamespace", "Filename namespace"),
         ("Filename", "Filename"),
     ],
+    0x20: [
+        ("Entries", "Attribute list entries"),
+    ],
+    0x40: [
+        ("ObjectID", "Object Id"),
+        ("BirthVolumeID", "Birth volume Id"),
+        ("BirthObjectID", "Birth object Id"),
+        ("DomainID", "Domain Id"),
+    ],
+    0x80: [
+        ("Name", "Stream name"),
+        ("Size", "Size"),
+    ],
+    0x90: [
+        ("IndexedType", "Indexed attribute type"),
+        ("IndexRecordSize", "Index record size"),
+        ("LargeIndex", "Uses $INDEX_ALLOCATION"),
+        ("Entries", "Index entries"),
+    ],
 }
 
 
@@ -99,7 +118,11 @@ def pretty_print(v):
                 for v in attvars:
                     index, name = v
                     name = name.ljust(28)
-                    if hasattr(a[index], "__iter__"):
+                    if isinstance(a[index], list):
+                        print "        %s" % name
+                        for i in a[index]:
+                            print "            %s" % i
+                    elif hasattr(a[index], "__iter__"):
                         print "        %s" % name
                         for i in a[index]:
                             elem = "%s" % i
@@ -107,5 +130,9 @@ def pretty_print(v):
                             print "            %s%s" % (elem, a[index][i])
                     else:
                         print "        %s%s" % (name, a[index])
+            elif "DataRuns" in a:
+                print "        %s%s" % ("Real size".ljust(28), a["RealSize"])
+                for lcn, length in zip(*a["DataRuns"]):
+                    print "            %s%s" % (("%d" % lcn).ljust(24, "."), length)
             else:
                 print "    (not parsed)"
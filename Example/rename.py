@@ -32,6 +32,14 @@ validators = {
     '.xls': FileValidators.MSOLEValidator(),
     '.ppt': FileValidators.MSOLEValidator(),
     '.zip': FileValidators.ZIPValidator(),
+    '.docx': FileValidators.ZIPValidator(),
+    '.xlsx': FileValidators.ZIPValidator(),
+    '.pptx': FileValidators.ZIPValidator(),
+    '.odt': FileValidators.ZIPValidator(),
+    '.ods': FileValidators.ZIPValidator(),
+    '.odp': FileValidators.ZIPValidator(),
+    '.jar': FileValidators.ZIPValidator(),
+    '.apk': FileValidators.ZIPValidator(),
 }
 
 
@@ -102,10 +102,22 @@ validators = {
     '.xls': FileValidators.MSOLEValidator(),
     '.ppt': FileValidators.MSOLEValidator(),
     '.zip': FileValidators.ZIPValidator(),
+    '.docx': FileValidators.ZIPValidator(),
+    '.xlsx': FileValidators.ZIPValidator(),
+    '.pptx': FileValidators.ZIPValidator(),
+    '.odt': FileValidators.ZIPValidator(),
+    '.ods': FileValidators.ZIPValidator(),
+    '.odp': FileValidators.ZIPValidator(),
+    '.jar': FileValidators.ZIPValidator(),
+    '.apk': FileValidators.ZIPValidator(),
     '.ics': FileValidators.ICSValidator(),
-    '.EML': FileValidators.EMLValidator(),
+    '.eml': FileValidators.EMLValidator(),
 }
 
+# mailboxes are split and every message is logged on its own, as path:offset
+mailboxes = ('.mbox', '.mmdf')
+mbox_parser = FileValidators.MBoxParser()
+
 loggers = {
     'csv': CSVLogger,
     'html': HTMLogger,
@@ -155,7 +167,18 @@ def Validate(args):
     for root, dirs, files in os.walk(path):
         for filename in files:
             extension = os.path.splitext(filename)[1].lower()
-            if extension in validators.keys():
+            if extension in mailboxes:
+                fd = open(os.path.join(root, filename), "rb")
+                for message in mbox_parser.Parse(fd):
+                    fname = fname_base % filename + ":%d" % message.offset
+                    end = message.is_valid and not message.eof
+                    values = [fname, str(message.is_valid), str(message.eof), str(message.length),
+                              str(end)]
+                    logger.Log(values, message.is_valid)
+                    counter_valid += 1 * message.is_valid
+                    counter_invalid += 1 * (not message.is_valid)
+                fd.close()
+            elif extension in validators.keys():
                 fd = open(os.path.join(root, filename), "rb", 1048576)
                 v = validators[extension]
                 v.Validate(fd)
@@ -1,228 +1,538 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import binascii
 import email
-from email.header import decode_header
-import collections
-import imaplib
-import smtplib
-import inspect
-import struct
-
-
+import os
+import re
+
+from GIFValidator import GIFValidator
+from ICSValidator import ICSValidator
+from JPGValidator import JPGValidator
+from LNKValidator import LNKValidator
+from MSOLEValidator import MSOLEValidator
+from PNGValidator import PNGValidator
+from SQLiteValidator import SQLiteValidator
 from Validator import Validator
+from ZIPValidator import ZIPValidator
 
-class EMLValidator(Validator):
-
-       
-    def __init__(self):
 
+class EMLValidator(Validator):
+    """
+    Class that validates an object to determine if it is a valid EML (RFC 822/MIME message) file.
+
+    Validate scans the raw data once: the message is 7-bit, every header (of the message and of
+    its MIME parts) is one of valid_headers_list, and every multipart entity ends with its closing
+    boundary. Part bodies are skipped by searching for the next boundary, never line by line. The
+    message is only parsed with the email package when GetDetails is called.
+
+    With deep=True the body of every part is also decoded: base64 and quoted-printable bodies are
+    checked with a regular expression and decoded whole with binascii, and attachments are
+    validated with the validator registered for their extension, see RegisterValidator. A bad
+    encoding, an invalid attachment or one shorter than the size in its Content-Disposition makes
+    the message invalid.
+    """
+
+    def __init__(self, deep=False):
+        """
+        Calls Validator.__init__() and sets some internal attributes for the validation process.
+
+        :param deep: decode the body of every part and validate the attachments. (bool)
+        :var parts: the MIME parts found by the scan, the message first and every part before its
+            own parts, see _ScanMultipart. (list of tuples)
+        :var attachment_validators: validator of the attachments, by extension. Classes are only
+            instantiated the first time they are needed. (dict)
+        :var content_type_extensions: extension of the attachments without a file name, by
+            content type. (dict)
+        """
         super(EMLValidator, self).__init__()
-        self.data_mail = ""
-        self._data_str = []
-        self.filename = ""
-        self.body = ""
-        self.headers = []
-        self.valid_headers_list = {"ARC-Authentication","ARC-Authentication-Results", "ARC-Message-Signature",
-                                   "ARC-Seal", "Authentication-Results", "Bcc",
-                                   "Cc", "Comments","Content-Disposition", "Content-Transfer-Encoding",
-                                   "Content-Type", "DKIM-Signature", "Date", "Delivered-To",
-                                   "Feedback-ID", "From", "In-Reply-To", "Keywords",
-                                   "MIME-Version", "Message-ID", "Received", "Received-SPF",
-                                   "References", "Reply-To", "Resent-Bcc", "Resent-Cc",
-                                   "Resent-Date", "Resent-From", "Resent-Message-ID",
-                                   "Resent-Sender", "Resent-To", "Return-Path", "Sender","Subject", "To",
-                                   "X-Account-Notification-Type","X-Attachment-Id","X-Gm-Message-State",
-                                   "X-Google-DKIM-Signature", "X-Google-Smtp-Source", "X-Notifications", "X-Received"}
-
-        self.counter_read = 0
-        self.count_bytes = 0
-        self.boundary_mail = ""
-        self.list_invalid = []
-        self.deq = collections.deque()
-        self.var_valid = True
-        self.objects_found = []
-        self.show_details = False
-        file_data = []
-
-
+        self.deep = deep
+        self.valid_headers_list = {
+            "ARC-Authentication", "ARC-Authentication-Results", "ARC-Message-Signature",
+            "ARC-Seal", "Authentication-Results", "Bcc", "Cc", "Comments", "Content-Disposition",
+            "Content-Transfer-Encoding", "Content-Type", "DKIM-Signature", "Date", "Delivered-To",
+            "Feedback-ID", "From", "In-Reply-To", "Keywords", "MIME-Version", "Message-ID",
+            "Received", "Received-SPF", "References", "Reply-To", "Resent-Bcc", "Resent-Cc",
+            "Resent-Date", "Resent-From", "Resent-Message-ID", "Resent-Sender", "Resent-To",
+            "Return-Path", "Sender", "Subject", "To", "X-Account-Notification-Type",
+            "X-Attachment-Id", "X-Gm-Message-State", "X-Google-DKIM-Signature",
+            "X-Google-Smtp-Source", "X-Notifications", "X-Received",
+        }
+        # only these part headers are kept by the scan, with their names in lower case
+        self.part_fields = ("content-type", "content-transfer-encoding", "content-disposition")
+        self.max_depth = 32  # most nested multipart entities followed
+        self.re_extended = re.compile("[\x80-\xff]")
+        self.re_boundary = re.compile(r'boundary\s*=\s*(?:"([^"]*)"|([^\s;]+))', re.IGNORECASE)
+        self.re_filename = re.compile(r'(?:file)?name\s*=\s*(?:"([^"]*)"|([^\s;]+))', re.IGNORECASE)
+        self.re_size = re.compile(r'size\s*=\s*"?(\d+)', re.IGNORECASE)
+        self.re_base64_invalid = re.compile("[^A-Za-z0-9+/=\r\n\t ]")
+        # "=" must start an escaped byte or a soft line break
+        self.re_qp_invalid = re.compile("=(?![0-9A-Fa-f]{2}|[ \t]*(?:\r?\n|$))")
+        self.attachment_validators = {
+            ".jpg": JPGValidator, ".jpeg": JPGValidator, ".png": PNGValidator,
+            ".gif": GIFValidator, ".doc": MSOLEValidator, ".xls": MSOLEValidator,
+            ".ppt": MSOLEValidator, ".msg": MSOLEValidator, ".zip": ZIPValidator,
+            ".docx": ZIPValidator, ".xlsx": ZIPValidator, ".pptx": ZIPValidator,
+            ".odt": ZIPValidator, ".ods": ZIPValidator, ".odp": ZIPValidator,
+            ".jar": ZIPValidator, ".apk": ZIPValidator, ".ics": ICSValidator,
+            ".lnk": LNKValidator, ".sqlite": SQLiteValidator, ".db": SQLiteValidator,
+        }
+        self.content_type_extensions = {
+            "image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif",
+            "application/msword": ".doc", "application/vnd.ms-excel": ".xls",
+            "application/vnd.ms-powerpoint": ".ppt", "application/vnd.ms-outlook": ".msg",
+            "application/zip": ".zip", "application/x-zip-compressed": ".zip",
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+            "application/vnd.openxmlformats-officedocument.presentationml.presentation": ".pptx",
+            "application/vnd.oasis.opendocument.text": ".odt",
+            "application/java-archive": ".jar", "text/calendar": ".ics",
+        }
+        self.data = ""
+        self._Cleanup()
 
     def _Cleanup(self):
         """
         Cleans up the internal state of the validator.
         """
-        self.data_mail = ""
-        self._data_str = []
-        self.filename = ""
-        self.body = ""
-        self.headers = []
-        self.count_bytes = 0
-        self.boundary_mail = ""
-        self.list_invalid = []
-        self.deq = collections.deque()
+        self.is_valid = False
+        self.bytes_last_valid = 0
+        self.eof = False
+        self.end = False
+        self.data = ""
+        self.start = 0
+        self.stop = 0
         self.var_valid = True
+        self.list_invalid = []
+        self.diagnostics = []
         self.objects_found = []
-        self.is_valid = False
-        file_data = []
-
+        self.parts = []
+        self.attachments = []
+        self.counter_read = 0
+        self.details = None
+        self.data_mail = ""
+        self.headers = []
+        self.body = ""
+        self.filename = ""
 
+    def _Invalid(self, pos, rule):
+        """
+        Marks the message as invalid because of the line at an offset.
 
-    def ShowDetailsError(self,fd):
+        :param pos: offset of the line (int)
+        :param rule: name of the check that failed (string)
         """
-        shows details of where errors are found
+        self.var_valid = False
+        eol = self.data.find("\n", pos, self.stop)
+        line = self.data[pos: self.stop if eol < 0 else eol].rstrip("\r")
+        if len(self.list_invalid) < self.max_diagnostics:
+            self.list_invalid.append(line)
+        self._Diagnostic(pos - self.start, rule, line)
+
+    def _ScanHeaders(self, pos, top):
         """
-        self.show_details = True
-        self.Validate(fd)
+        Checks a block of header lines, up to the empty line that separates it from the body.
 
-    
-    def GetDetails(self):
+        :param pos: offset of the first header line (int)
+        :param top: True for the headers of the message, False for those of a MIME part (bool)
+        :return: offset of the body, and the unfolded values of the part_fields headers found
+            (tuple of (int, dict))
         """
-        Returns dictionary with import information from the recently-validated file.
+        data = self.data
+        stop = self.stop
+        fields = {}
+        name = ""
+        while pos < stop:
+            eol = data.find("\n", pos, stop)
+            next_pos = stop if eol < 0 else eol + 1
+            line = data[pos: next_pos].rstrip("\r\n")
+            if not line:
+                return next_pos, fields
+            if line[0] in " \t":
+                # a folded header goes on
+                if name in fields:
+                    fields[name] += line
+            else:
+                colon = line.find(":")
+                header = line[:colon] if colon > 0 else ""
+                if colon <= 0:
+                    self._Invalid(pos, "malformed_header")
+                elif header not in self.valid_headers_list:
+                    self._Invalid(pos, "unknown_header")
+                elif top:
+                    self.objects_found.append(header)
+                name = header.lower()
+                if name in self.part_fields:
+                    fields[name] = line[colon + 1:]
+            pos = next_pos
+        # headers only, no body
+        return stop, fields
+
+    def _Boundary(self, fields):
+        """
+        :param fields: part fields, as returned by _ScanHeaders (dict)
+        :return: the boundary of a multipart entity, None for other entities, "" for multipart
+            entities without one (string)
+        """
+        content_type = fields.get("content-type", "").strip()
+        if not content_type.lower().startswith("multipart/"):
+            return None
+        match = self.re_boundary.search(content_type)
+        if match is None:
+            return ""
+        return match.group(1) if match.group(1) is not None else match.group(2)
+
+    def _FindDelimiter(self, delimiter, pos):
+        """
+        Finds the next boundary delimiter line: the delimiter at the start of a line, followed by
+        "--" for the closing delimiter, whitespace or the end of the line.
 
-        :return: dictionary {
+        :param delimiter: "--" plus the boundary (string)
+        :param pos: where to start looking, the start of a line (int)
+        :return: offset of the delimiter line, -1 if there's none (int)
+        """
+        data = self.data
+        stop = self.stop
+        if data.startswith(delimiter, pos) and pos < stop:
+            found = pos
+        else:
+            found = data.find("\n" + delimiter, pos, stop)
+            if found < 0:
+                return -1
+            found += 1
+        while True:
+            after = data[found + len(delimiter): found + len(delimiter) + 1]
+            if after in ("", "-", " ", "\t", "\r", "\n"):
+                return found
+            found = data.find("\n" + delimiter, found, stop)
+            if found < 0:
+                return -1
+            found += 1
+
+    def _ScanMultipart(self, boundary, pos, depth):
+        """
+        Scans the body of a multipart entity: every part is checked by _ScanHeaders and added to
+        self.parts as (header offset, body offset, body end, part fields, depth), and nested
+        multipart entities are scanned in turn, their parts after them. Part bodies are skipped
+        with find.
+
+        :param boundary: boundary of the entity (string)
+        :param pos: offset of the body (int)
+        :param depth: nesting level of the entity, 0 for the message (int)
+        :return: offset after the closing delimiter line, -1 if it's missing (int)
+        """
+        data = self.data
+        stop = self.stop
+        delimiter = "--" + boundary
+        found = self._FindDelimiter(delimiter, pos)
+        while found >= 0:
+            eol = data.find("\n", found, stop)
+            next_pos = stop if eol < 0 else eol + 1
+            if data.startswith("--", found + len(delimiter)):
+                return next_pos
+            body_start, fields = self._ScanHeaders(next_pos, False)
+            search_from = body_start
+            # the part goes before its own parts, its end is only known after them
+            index = len(self.parts)
+            self.parts.append(None)
+            nested = self._Boundary(fields)
+            if nested == "":
+                self._Invalid(next_pos, "missing_boundary")
+            elif nested is not None and depth + 1 >= self.max_depth:
+                self._Invalid(next_pos, "nesting_too_deep")
+            elif nested is not None:
+                search_from = self._ScanMultipart(nested, body_start, depth + 1)
+                if search_from < 0:
+                    self.parts[index] = (next_pos, body_start, stop, fields, depth + 1)
+                    return -1
+            found = self._FindDelimiter(delimiter, search_from)
+            # the line break before the delimiter belongs to it
+            body_end = stop if found < 0 else found - 1
+            if found >= 0 and data[body_end - 1: body_end] == "\r":
+                body_end -= 1
+            self.parts[index] = (next_pos, body_start, max(body_start, body_end), fields, depth + 1)
+        return -1
+
+    def _Scan(self, start, stop):
+        """
+        Validates the message between two offsets of self.data.
 
-        }
+        :param start: offset of the message (int)
+        :param stop: end of the message (int)
         """
-        if self.var_valid == False:
-            print(self.list_invalid)
-        return {
-                "body": self.body,
-                "attached file": str(self.filename),
-                "objects": self.objects_found,
-                "lines": self.counter_read,
-            }
+        data = self.data
+        self.start = start
+        self.stop = stop
+        self.counter_read = data.count("\n", start, stop)
+        if stop > start and data[stop - 1] != "\n":
+            self.counter_read += 1
+        match = self.re_extended.search(data, start, stop)
+        if match is not None:
+            self._Invalid(data.rfind("\n", start, match.start()) + 1 or start, "extended_ascii")
+        body_start, fields = self._ScanHeaders(start, True)
+        boundary = self._Boundary(fields)
+        self.parts.append((start, body_start, stop, fields, 0))
+        if boundary == "":
+            self._Invalid(start, "missing_boundary")
+        elif boundary is not None and self._ScanMultipart(boundary, body_start, 0) < 0:
+            # the closing boundary never came, the message was cut short
+            self.var_valid = False
+            self.eof = True
+            self._Diagnostic(stop - start, "missing_closing_boundary")
+        if not self.objects_found:
+            self._Diagnostic(0, "no_headers")
+        if self.deep and self.var_valid:
+            self._CheckParts()
+        self.is_valid = self.var_valid and bool(self.objects_found)
+        if self.is_valid:
+            self._SetValidBytes(stop - start)
+            self.end = True
+
+    def RegisterValidator(self, extension, validator):
+        """
+        Sets the validator of the attachments with an extension, used with deep=True.
 
+        :param extension: extension, lower case and with the dot, e.g. ".pdf" (string)
+        :param validator: a validator instance, or its class (Validator)
+        """
+        self.attachment_validators[extension] = validator
 
-    def _InvalidByteWSHeader(self, element, counter):
-        """      
-        returns in which byte is the whitespace and where it can be observed
+    def _Filename(self, fields):
+        """
+        :param fields: part fields, as returned by _ScanHeaders (dict)
+        :return: file name of the part, from Content-Disposition or else Content-Type, "" if
+            there's none (string)
         """
-        string = list(element)
-        for byte in element:
-            if byte.isspace():
-                indx = string.index(byte)
-        invalid_byte = (counter + indx)
-        if self.show_details == True:
-            print ("\nByte number " + str(invalid_byte) + " it is a whitespace")
-            print ("\nIn: " + element)
+        for name in ("content-disposition", "content-type"):
+            match = self.re_filename.search(fields.get(name, ""))
+            if match is not None:
+                return match.group(1) if match.group(1) is not None else match.group(2)
+        return ""
 
+    def _Extension(self, fields, filename):
+        """
+        :param fields: part fields, as returned by _ScanHeaders (dict)
+        :param filename: file name of the part (string)
+        :return: extension of the part, from its file name or else its content type, "" if it's
+            not known (string)
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in self.attachment_validators:
+            return extension
+        content_type = fields.get("content-type", "").split(";", 1)[0].strip().lower()
+        return self.content_type_extensions.get(content_type, extension)
 
-    def _InvalidByteExtendedASCII(self,element,counter):
-        """            
-        returns that byte is an extended ASCII and where it is observed
+    def _DecodeBody(self, body_start, body_end, encoding):
+        """
+        Checks and decodes the body of a part. base64 and quoted-printable bodies are checked
+        with a single regular expression search and decoded whole by binascii; 7bit, 8bit and
+        binary bodies are taken as they are.
+
+        :param body_start: offset of the body (int)
+        :param body_end: end of the body (int)
+        :param encoding: Content-Transfer-Encoding of the part, lower case (string)
+        :return: the decoded body, or None and the offset of the error (tuple of (string, int))
         """
-        string = list(element)
-        for byte in element:
+        data = self.data
+        if encoding == "base64":
+            match = self.re_base64_invalid.search(data, body_start, body_end)
+            if match is not None:
+                return None, match.start()
+            chunk = "".join(data[body_start: body_end].split())
+            unpadded = chunk.rstrip("=")
+            if len(chunk) % 4 or "=" in unpadded or len(chunk) - len(unpadded) > 2:
+                return None, body_start
             try:
-                byte.decode('ascii')
-            except UnicodeDecodeError:
-                indx = string.index(byte)
-                invalid_byte = counter + indx
-        if self.show_details == True:
-            print ("\nByte number " + str(invalid_byte) + " belongs to extended ASCII")
-            print ("\nIn: " + element)
-
-    
-
+                return binascii.a2b_base64(chunk), body_start
+            except binascii.Error:
+                return None, body_start
+        if encoding == "quoted-printable":
+            match = self.re_qp_invalid.search(data, body_start, body_end)
+            if match is not None:
+                return None, match.start()
+            return binascii.a2b_qp(data[body_start: body_end]), body_start
+        return data[body_start: body_end], body_start
+
+    def _ValidateAttachment(self, extension, content):
+        """
+        Validates a decoded attachment with the validator registered for its extension.
+        Validators that fail with an exception on malformed data count as invalid.
 
+        :param extension: extension of the attachment, one of attachment_validators (string)
+        :param content: the decoded attachment (string)
+        :return: status of the validator, see Validator.GetStatus (tuple)
+        """
+        validator = self.attachment_validators[extension]
+        if isinstance(validator, type):
+            validator = validator()
+            self.attachment_validators[extension] = validator
+        try:
+            validator.Validate(content)
+        except Exception:
+            return False, False, 0, False
+        return validator.GetStatus()
+
+    def _CheckParts(self):
+        """
+        Decodes the body of every part that isn't a multipart entity, and validates the ones with
+        a registered validator. Results are kept in self.attachments.
+        """
+        for index, (header_start, body_start, body_end, fields, depth) in enumerate(self.parts):
+            if self._Boundary(fields) is not None:
+                continue
+            encoding = fields.get("content-transfer-encoding", "").strip().lower()
+            content, offset = self._DecodeBody(body_start, body_end, encoding)
+            if content is None:
+                self.var_valid = False
+                eol = self.data.find("\n", offset, body_end)
+                self._Diagnostic(offset - self.start, "bad_" + encoding.replace("-", "_"),
+                                 self.data[offset: body_end if eol < 0 else eol].rstrip("\r"))
+                continue
+            filename = self._Filename(fields)
+            extension = self._Extension(fields, filename)
+            if extension not in self.attachment_validators:
+                continue
+            is_valid, eof, bytes_last_valid, end = self._ValidateAttachment(extension, content)
+            # the attachment is all there, so running out of data means it's not valid: garbage
+            # that starts with a signature usually looks like a truncated file
+            is_valid = is_valid and not eof
+            match = self.re_size.search(fields.get("content-disposition", ""))
+            declared_size = int(match.group(1)) if match is not None else -1
+            self.attachments.append({
+                "part": index,
+                "filename": filename,
+                "extension": extension,
+                "size": len(content),
+                "declared_size": declared_size,
+                "is_valid": is_valid,
+                "eof": eof,
+                "bytes_last_valid": bytes_last_valid,
+            })
+            if len(content) < declared_size:
+                rule = "truncated_attachment"
+            elif not is_valid:
+                rule = "invalid_attachment"
+            else:
+                continue
+            self.var_valid = False
+            self._Diagnostic(header_start - self.start, rule, filename or extension)
 
-    def _Get_Body(self):
+    def _PartTree(self):
         """
-        extracts the body of the email
+        Builds the tree of MIME parts from self.parts.
+
+        :return: the message, as a dictionary of offset, body_offset, body_end, content_type,
+            encoding, filename and parts, the list of its parts as the same dictionaries; None if
+            nothing was scanned (dict)
         """
-        if self.data_mail.is_multipart():
-            for part in self.data_mail.walk():
-                ctype = part.get_content_type()
-                cdispo = str(part.get('Content-Disposition'))
-                # skip any text/plain (txt) attachments
-                if ctype == 'text/plain' and 'attachment' not in cdispo:
-                    self.body = part.get_payload(decode=True)  # decode Unicode
-                    break
-            if self.show_details == True:    
-                print ("\nBODY:\n")
-            # not multipart - i.e. plain text, no attachments
-        else:
-            self.body = self.data_mail.get_payload(decode=True)
-        
+        root = None
+        stack = []
+        for header_start, body_start, body_end, fields, depth in self.parts:
+            node = {
+                "offset": header_start - self.start,
+                "body_offset": body_start - self.start,
+                "body_end": body_end - self.start,
+                "content_type": fields.get("content-type", "text/plain").split(";", 1)[0].strip(),
+                "encoding": fields.get("content-transfer-encoding", "7bit").strip().lower(),
+                "filename": self._Filename(fields),
+                "parts": [],
+            }
+            while stack and stack[-1][0] >= depth:
+                stack.pop()
+            if stack:
+                stack[-1][1]["parts"].append(node)
+            else:
+                root = node
+            stack.append((depth, node))
+        return root
 
+    def ShowDetailsError(self, fd):
+        """
+        Validates a file-like object, printing the verdict and why it's not valid.
 
+        :param fd: file descriptor (file-like)
+        """
+        self.Validate(fd)
+        print ("Valid EML" if self.is_valid else "Invalid EML")
+        for offset, rule, excerpt in self.diagnostics:
+            print ("Byte %d: %s in: %s" % (offset, rule, excerpt))
 
-    def _Get_Headers(self):
+    def _BuildDetails(self):
         """
-        extracts all headers found in the file and verifies that they are correct
+        Parses the message with the email package and builds the details dictionary.
         """
-        var_aux = False
-        var_bound = True
-        var_bound_init = False
-        var_bound_end = False
-        var_content = False
-        parser = email.parser.HeaderParser()
-        self.headers = parser.parsestr(self.data_mail.as_string())
-        for element, length in self.data_str:
+        self.data_mail = email.message_from_string(self.data[self.start: self.stop])
+        self.headers = self.data_mail
+        for part in self.data_mail.walk():
+            disposition = str(part.get("Content-Disposition"))
+            if part.get_content_type() == "text/plain" and "attachment" not in disposition:
+                if not self.body:
+                    self.body = part.get_payload(decode=True)
+            elif "attachment" in disposition and not self.filename:
+                self.filename = part.get_filename() or ""
+        self.details = {
+            "body": self.body,
+            "attached file": str(self.filename),
+            "objects": self.objects_found,
+            "lines": self.counter_read,
+            "parts": self._PartTree(),
+            "attachments": self.attachments,
+            "diagnostics": self.diagnostics,
+        }
 
-            left_text_header = element.partition(" ")[0]
-            left_text_header_p = element.partition(":")[0]
-            self.counter_read = self.counter_read + 1
+    def GetDetails(self):
+        """
+        Returns dictionary with import information from the recently-validated file.
 
-            try:
-                _ = element.decode('ascii')
-            except UnicodeDecodeError:
-                self.var_valid = False
-                self._InvalidByteExtendedASCII(element,self.count_bytes)
-                self.list_invalid.append(element)
-                if self.show_details == True:
-                    print ("\nLine has ASCII characters extended in: " + element)
-
-            if "Content-Type: multipart" in element:
-                if "boundary=" in element:
-                    self.boundary_mail = element.partition("=")[2]
-                    self.boundary_mail = self.boundary_mail[1:-1]
-                    var_bound = True
-
-            if (left_text_header[2:] == self.boundary_mail) and (var_bound == True):
-                var_content = True
-            
-            if (left_text_header[2:] == self.boundary_mail + "--"):# and (var_bound == True):
-                var_content = False
-                var_bound_end = True                
-
-            if "Content-Disposition: attachment" in element:
-                if "filename=" in element:
-                    self.filename = element.partition("=")[2]
-                    self.filename = self.filename[1:-1]        
-                    
-            if (':' in left_text_header) and (left_text_header[:-1] in self.valid_headers_list):
-                var_aux = False
-            elif not left_text_header:
-                var_aux = False
-            elif (':' in element):
-                self.list_invalid.append(element)
-                self.var_valid = False
-                left_text_invalid = element.partition(":")[0]
-                if ' ' in left_text_invalid:
-                    self._InvalidByteWSHeader(left_text_invalid,self.count_bytes)            
-
-            self.count_bytes = self.count_bytes + length  # +CR LF 
-            
-        # endfor
-              
-        if self.var_valid == True:
-            if self.show_details == True:
-                print ("\nHEADERS:\n")
-                for h in self.headers.items():
-                    print (h)
-                    
-        if var_bound == False:
-            self.var_valid = False
-            if self.show_details == True:
-                print ("\n No boundary detected\n")
-            
-        if var_bound == True and var_bound_end == False:
-            self.var_valid = False
-            if self.show_details == True:
-                print ("\n No boundary ends detected\n")
-        
+        :return: dictionary {
+            * body (string) -- the first text/plain part that isn't an attachment
+            * attached file (string) -- file name of the first attachment
+            * objects (list of strings) -- headers of the message
+            * lines (int)
+            * parts (dict) -- the tree of MIME parts, see _PartTree. Offsets are relative to the
+              message
+            * attachments (list of dicts of part, filename, extension, size, declared_size,
+              is_valid, eof and bytes_last_valid) -- verdicts on the attachments, only with
+              deep=True. part is the index of the attachment in self.parts, declared_size the
+              size parameter of Content-Disposition, -1 if there's none. An attachment is only
+              valid when its validator didn't run out of data
+            * diagnostics (list of tuples of (offset, rule, excerpt)) -- why it's not valid, the
+              first max_diagnostics failed checks
+        }
+        """
+        if self.details is None:
+            self._BuildDetails()
+        return self.details
+
+    def ValidateSpan(self, data, start, stop):
+        """
+        Validates the message between two offsets of a bigger buffer, such as a mailbox, without
+        copying it. Offsets in self.parts are offsets in data, those in self.diagnostics and
+        bytes_last_valid are relative to start.
 
+        :param data: buffer that holds the message (string)
+        :param start: offset of the message (int)
+        :param stop: end of the message (int)
+        :return: True on valid EML, False otherwise (bool)
+        """
+        self._Cleanup()
+        self.data = data
+        self._Scan(start, stop)
+        return self.is_valid
 
-    
-    def Validate(self,fd):
+    def Validate(self, fd):
         """
         Validates a file-like object to determine if its a valid EML file.
 
@@ -230,42 +540,11 @@ class EMLValidator(Validator):
         :return: True on valid EML, False otherwise (bool)
         """
         self._Cleanup()
-        var_aux = False
-
         if type(fd) == file:
-            file_data = fd.read()
-            fd.seek(0)
-            self.data_str = [(l, len(k)) for l, k in zip(file_data.splitlines(), file_data.splitlines(True))]
-            self.data_mail = email.message_from_file(fd)
-            
+            self.data = fd.read()
         elif type(fd) == str:
-            self.data_mail = fd
+            self.data = fd
         else:
             raise Exception("Argument must be either a file or a string.")
-        self._Get_Headers()
-        self._Get_Body()
-        for h in self.headers.items():
-            if h[0] in self.valid_headers_list:
-                self.objects_found.append(h[0])
-                var_aux = True
-            else:
-                self.list_invalid.append(h)
-                self.var_valid = False
-        # endfor
-        
-        if self.var_valid == True:
-            print ("\nValid EML")
-            self.is_valid = True
-            if self.show_details == True:
-                self.show_details = False
-                     
-        elif self.var_valid == False:
-            print ("\nInvalid EML\n")
-            self.is_valid = False
-            if self.show_details == True:
-                self.show_details = False
-                print ("Invalid List Elements: \n")
-                print (self.list_invalid)
-                
-          
-       
+        self._Scan(0, len(self.data))
+        return self.is_valid
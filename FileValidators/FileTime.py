@@ -0,0 +1,102 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import array
+import datetime
+import struct
+
+
+class FileTime(object):
+    """
+    Converts MS FILETIMEs (64-bit counts of 100ns intervals since 1601-01-01 UTC) into raw ticks,
+    epoch floats or datetime objects, for the validators that parse Windows structures.
+
+    Datetimes are cached: the records of a single file system share a lot of timestamps. The cache
+    keeps two generations of dicts, when the newest one fills up the oldest is dropped, so it
+    behaves like an LRU cache of cache_size entries without any bookkeeping on hits.
+    """
+    # 100ns intervals between 1601-01-01 and 1970-01-01
+    epoch_delta = 116444736000000000
+    base = datetime.datetime(1601, 1, 1)
+
+    def __init__(self, cache_size=4096):
+        """
+        :param cache_size: most datetimes kept in the cache (int)
+        """
+        self.cache_size = cache_size
+        self.generation_size = max(1, cache_size / 2)
+        self.timedelta = datetime.timedelta
+        self.st_ticks = struct.Struct("<Q")
+        self.cache_new = {}
+        self.cache_old = {}
+
+    def ToTicks(self, raw, offset=0):
+        """
+        Unpacks a FILETIME from a buffer.
+
+        :param raw: buffer with the packed FILETIME (string)
+        :param offset: offset of the FILETIME in the buffer (int)
+        :return: ticks (int)
+        """
+        return self.st_ticks.unpack_from(raw, offset)[0]
+
+    def ToEpoch(self, ticks):
+        """
+        :param ticks: FILETIME (int)
+        :return: seconds since 1970-01-01 UTC, negative before that (float)
+        """
+        return (ticks - self.epoch_delta) / 10000000.0
+
+    def ToDatetime(self, ticks):
+        """
+        :param ticks: FILETIME (int)
+        :return: naive datetime in UTC, or None if it's past the year 9999 (datetime)
+        """
+        cache_new = self.cache_new
+        value = cache_new.get(ticks, self)
+        if value is not self:
+            return value
+        value = self.cache_old.get(ticks, self)
+        if value is self:
+            # the object itself is used as the "not found" marker, None is a valid value
+            try:
+                value = self.base + self.timedelta(0, 0, ticks // 10)
+            except OverflowError:
+                value = None
+        if len(cache_new) >= self.generation_size:
+            self.cache_old = cache_new
+            self.cache_new = cache_new = {}
+        cache_new[ticks] = value
+        return value
+
+    def ToEpochs(self, ticks):
+        """
+        Batched ToEpoch.
+
+        :param ticks: FILETIMEs (iterable of ints)
+        :return: seconds since 1970-01-01 UTC (array of doubles)
+        """
+        delta = self.epoch_delta
+        return array.array("d", [(t - delta) / 10000000.0 for t in ticks])
+
+    def ToDatetimes(self, ticks):
+        """
+        Batched ToDatetime. Every distinct value is converted once.
+
+        :param ticks: FILETIMEs (sequence of ints)
+        :return: datetimes, None for the values that are out of range (list)
+        """
+        converted = dict((t, self.ToDatetime(t)) for t in set(ticks))
+        return [converted[t] for t in ticks]
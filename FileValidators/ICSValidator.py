@@ -1,5 +1,6 @@
 import struct
 import collections
+import re
 
 from Validator import Validator
 
@@ -12,8 +13,9 @@ class ICSValidator(Validator):
         self.flag_begin = False
         self.flag_version = False
         self.flag_end = False
-        self.show_details = False
         self.counter_read = 0
+        self.re_extended = re.compile("[\x80-\xff]")
+        self.re_lower = re.compile("[a-z]")
         self.valid_objects_list = {  "ACTION","AUDIO","BEGIN","CALSCALE","CATEGORIES","CLASS","CONTACT","CREATED",
                                      "DESCRIPTION","DTEND","DTSTAMP","DTSTART","DURATION","END","EXDATE","FREEBUSY",
                                      "FREEBUSY","GEO","LAST-MODIFIED","LOCATION","METHOD","ORGANIZER","PRIORITY","PRODID",
@@ -36,8 +38,12 @@ class ICSValidator(Validator):
         self.flag_begin = False
         self.flag_version = False
         self.flag_end = False
-        self.show_details = False
+        self.is_valid = False
+        self.bytes_last_valid = 0
+        self.eof = False
+        self.end = False
         self.counter_read = 0
+        self.diagnostics = []
         self.last_valid_byte_min = 0
         self.last_valid_byte_max = 0
         self.count_bytes = 0
@@ -51,32 +57,29 @@ class ICSValidator(Validator):
 
         self.last_valid_byte_min = counter
         self.last_valid_byte_max = counter + length
-        print "\nThe error is between byte number: " + str(self.last_valid_byte_min) + " and: " + str(self.last_valid_byte_max)
-    
-
-    def _ByteLowerDetector(self,element,counter):
-        string = list(element)
-        for byte in element:
-            if byte.islower():
-                indx = string.index(byte)
-                invalid_byte = counter + indx
-                print "\nByte number " + str(invalid_byte) + " it is not uppercase"
-
-    
-    def _ByteExtendedASCIIDetector(self,element,counter):
-        string = list(element)
-        for byte in element:
-            try:
-                byte.decode('ascii')
-            except UnicodeDecodeError:
-                indx = string.index(byte)
-                invalid_byte = counter + indx
-                print "\nByte number " + str(invalid_byte) + " belongs to extended ASCII"
-    
+
+
+    def _Invalid(self,rule,element,length,match=None):
+        """
+        Records why the line being checked is not valid.
+
+        :param rule: name of the check that failed (string)
+        :param element: the line, or the part of it that failed (string)
+        :param length: length of the line, with its line break (int)
+        :param match: the byte that failed the check, if it's known (re.MatchObject)
+        """
+        offset = self.count_bytes
+        if match is not None:
+            offset += match.start()
+        self._Diagnostic(offset, rule, element)
+        self._ReadByteRange(self.count_bytes,length - 1)
+
 
     def ShowDetailsError(self,fd):
-        self.show_details = True
         self.Validate(fd)
+        print ("Valid iCalendar!" if self.is_valid else "Invalid iCalendar!")
+        for offset, rule, excerpt in self.diagnostics:
+            print ("Byte %d: %s in: %s" % (offset, rule, excerpt))
 
 
     def ShowDescription(self):
@@ -88,28 +91,45 @@ class ICSValidator(Validator):
 
 
     def GetDetails(self):
-        
+        """
+        Returns dictionary with import information from the recently-validated file.
+
+        :return: dictionary {
+            * objects (list of strings)
+            * description (list of strings)
+            * lines (int)
+            * diagnostics (list of tuples of (offset, rule, excerpt)) -- why it's not valid, the
+              first max_diagnostics failed checks
+        }
+        """
         return {
                 "objects": self.objects_found,
                 "description": self.list_description,
                 "lines": self.counter_read,
+                "diagnostics": self.diagnostics,
             }
 
     def Validate(self,fd):
+        """
+        Validates a file-like object to determine if its a valid iCalendar file. Nothing is
+        printed, see GetDetails()["diagnostics"] or ShowDetailsError.
 
+        :param fd: file descriptor (file-like)
+        :return: True on valid iCalendar, False otherwise (bool)
+        """
         var = True
         var_dif = 0
-    
+
+        self._Cleanup()
         if type(fd) == file:
-            
             file_data = fd.read()
-            self.data = [(l, len(k)) for l, k in zip(file_data.splitlines(), file_data.splitlines(True))]
-            tam_max = len(self.data)
-         
         elif type(fd) == str:
-            self.data = fd
+            file_data = fd
         else:
             raise Exception("Argument must be either a file or a string.")
+        lines = file_data.splitlines(True)
+        self.data = [(l, len(k)) for l, k in zip(file_data.splitlines(), lines)]
+        tam_max = len(self.data)
 
         for element, length in self.data:
          
@@ -125,14 +145,10 @@ class ICSValidator(Validator):
                 self.flag_end = True
                 self.end = True
 
-            try:
-                element.decode('ascii')
-            except UnicodeDecodeError:
+            match = self.re_extended.search(element)
+            if match is not None:
                 var = False
-                if self.show_details == True:
-                    print "\nLine has ASCII characters extended in: " + element
-                    self._ReadByteRange(self.count_bytes,length - 1)
-                    self._ByteExtendedASCIIDetector(element,self.count_bytes)
+                self._Invalid("extended_ascii",element,length,match)
 
             left_text_object = element.partition(":")[0]
             right_text_object = element.partition(":")[2]
@@ -145,12 +161,10 @@ class ICSValidator(Validator):
                 try:
                     if not(right_text_object == self.deq.pop()):
                         var = False
-                        if self.show_details == True:
-                            print "\nBegin no coincide con END en: " + right_text_object
-                except:
+                        self._Invalid("begin_end_mismatch",element,length)
+                except IndexError:
                     var = False
-                    if self.show_details == True:
-                        print "\nMayor cantidad de END que Begin"
+                    self._Invalid("end_without_begin",element,length)
 
 
             if left_text_object == "DESCRIPTION":
@@ -163,15 +177,11 @@ class ICSValidator(Validator):
                 
             if (len(element)+ var_dif) < length and var_description == False:
                 var = False
-                if self.show_details == True:
-                    print "\nThe length of a line in the file does not match the length of the string in it: " + element
-                    self._ReadByteRange(self.count_bytes,length - 1)
+                self._Invalid("line_break",element,length)
 
             if '  ' in element[2:]:
                 var = False
-                if self.show_details == True:
-                    print "\nLine has more than one consecutive blank space in: " + element
-                    self._ReadByteRange(self.count_bytes,length - 1)
+                self._Invalid("double_space",element,length)
 
             if left_text_object.isupper():
                 var_aux = True
@@ -182,10 +192,8 @@ class ICSValidator(Validator):
                     var_aux = True
                 elif var_description == False:
                     var = False
-                    if self.show_details == True:
-                        print "\nLine has a main object that is not uppercase in: " + left_text_object
-                        self._ReadByteRange(self.count_bytes,length - 1)
-                        self._ByteLowerDetector(left_text_object,self.count_bytes)
+                    self._Invalid("lowercase_name",element,length,
+                                  self.re_lower.search(left_text_object))
                     
             if left_text_object in self.valid_objects_list:
                 self.objects_found.append(left_text_object)
@@ -196,21 +204,19 @@ class ICSValidator(Validator):
                     var_aux = True
                 elif var_description == False:
                     var = False
-                    if self.show_details == True:
-                        print "\nThe object name is not valid: " + left_text_object
-                        self._ReadByteRange(self.count_bytes,length - 1)
+                    self._Invalid("unknown_object",element,length)
 
             self.count_bytes = self.count_bytes + length
 
+        if not self.flag_begin:
+            self._Diagnostic(0, "missing_begin")
+        if not self.flag_version:
+            self._Diagnostic(0, "missing_version")
+        if not self.flag_end:
+            self._Diagnostic(self.count_bytes, "missing_end")
         if var == True and self.flag_begin == True and self.flag_version == True and self.flag_end == True:
-            print("\nValid iCalendar!")
             self.is_valid = True
-            if self.show_details == True:
-                self.show_details = False
-            
+            self._SetValidBytes(self.count_bytes)
         else:
-            print("\nInvalid iCalendar!")
             self.is_valid = False
-            if self.show_details == True:
-                self.show_details = False
-        
+        return self.is_valid
@@ -0,0 +1,342 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import array
+import csv
+import json
+import struct
+
+from LNKValidator import GUID
+from LNKValidator import LNKValidator
+
+
+class LNKBulkParser(object):
+    """
+    Parses many LNK files into columns, for jump lists and mass triage.
+
+    Each LNK is validated with LNKValidator, and then only the fields listed in column_names are
+    read straight from the data, without building the details dictionary. The results are kept one
+    list (or array) per column, or written row by row to CSV or JSON Lines files.
+
+    FILETIMEs are kept as raw 100ns ticks since 1601-01-01, 0 when not set.
+    """
+
+    def __init__(self):
+        """
+        Sets the validator and the empty columns.
+
+        :var column_names: names of the columns, in the order they are written. (list of strings)
+        :var columns: the parsed values, one list or array per column, see _Cleanup. (dict)
+        """
+        self.validator = LNKValidator()
+        self.column_names = [
+            "source", "is_valid", "bytes_last_valid", "target_path", "volume_serial",
+            "drive_type", "volume_label", "netbios_name", "machine_id", "ctime", "atime", "wtime",
+            "file_size", "droid_volume", "droid_file", "birth_droid_volume", "birth_droid_file",
+        ]
+        self.st_linkinfo = struct.Struct("<LLLLLLL")
+        self.st_volumeid = struct.Struct("<LLLL")
+        self.st_cnrl = struct.Struct("<LLLLL")
+        self.st_ulong = struct.Struct("<L")
+        self.st_unicode_offsets = struct.Struct("<LL")
+        self.tracker_signature = "\x03\x00\x00\xa0"
+        self._Cleanup()
+
+    def _Cleanup(self):
+        """
+        Empties the columns. Small integer columns are arrays. Values that aren't in the LNK are -1
+        for integers and empty strings for text.
+        """
+        self.columns = {}
+        for name in self.column_names:
+            self.columns[name] = []
+        self.columns["bytes_last_valid"] = array.array("l")
+        self.columns["drive_type"] = array.array("l")
+
+    def _CString(self, data, pos, end):
+        """
+        Reads a NULL terminated ANSI string.
+
+        :param data: buffer (string)
+        :param pos: offset of the string (int)
+        :param end: the string can't go past this offset (int)
+        :return: the string (unicode)
+        """
+        if pos >= end:
+            return u""
+        stop = data.find("\x00", pos, end)
+        if stop < 0:
+            stop = end
+        return data[pos: stop].decode("cp1252", "replace")
+
+    def _UnicodeString(self, data, pos, end):
+        """
+        Reads a NULL terminated UTF-16LE string.
+
+        :param data: buffer (string)
+        :param pos: offset of the string (int)
+        :param end: the string can't go past this offset (int)
+        :return: the string (unicode)
+        """
+        if pos >= end:
+            return u""
+        stop = data.find("\x00\x00", pos, end)
+        while stop >= 0 and (stop - pos) % 2:
+            # the NULL must be a whole character, not the end of one and the start of the next
+            stop = data.find("\x00\x00", stop + 1, end)
+        if stop < 0:
+            stop = end - (end - pos) % 2
+        return data[pos: stop].decode("utf-16-le", "replace")
+
+    def _Row(self, source, data):
+        """
+        Validates one LNK and reads the fields of its row. netbios_name comes from the LinkInfo
+        and machine_id from the tracker data block, they are often different machines.
+
+        :param source: where the LNK came from, a path or a stream name (string)
+        :param data: the LNK (string)
+        :return: the row, in the order of column_names (list)
+        """
+        validator = self.validator
+        validator.Validate(data)
+        row = [source, validator.is_valid, validator.bytes_last_valid, u"", -1, -1, u"", u"", u"",
+               0, 0, 0, 0, "", "", "", ""]
+        header = validator.header
+        if header is None or not validator.is_valid:
+            return row
+        row[9: 13] = [header.ctime, header.atime, header.wtime, header.file_size]
+        pos = validator.linkinfo_offset
+        if pos >= 0:
+            row[3: 8] = self._LinkInfo(data, pos)
+        for pos, size in validator.extra_blocks:
+            if data[pos + 4: pos + 8] == self.tracker_signature:
+                machine_id = data[pos + 16: pos + 32]
+                row[8] = machine_id.split("\x00", 1)[0].decode("cp1252", "replace")
+                row[13: 17] = ["%r" % GUID(data[x: x + 16]) for x in xrange(pos + 32, pos + 96, 16)]
+                break
+        return row
+
+    def _LinkInfo(self, data, pos):
+        """
+        Reads the target path and volume fields from the LinkInfo structure, straight from the
+        buffer. Validate has already checked that the whole structure is there. The Unicode
+        versions of the strings are preferred when the structure has them.
+
+        :param data: the LNK (string)
+        :param pos: offset of the LinkInfo structure (int)
+        :return: target path, volume serial, drive type, volume label and NetBIOS name (list)
+        """
+        end = pos + struct.unpack_from("<L", data, pos)[0]
+        if end - pos < self.st_linkinfo.size:
+            return [u"", -1, -1, u"", u""]
+        size, header_size, flags, vid_offset, lbp_offset, cnrl_offset, cps_offset = \
+            self.st_linkinfo.unpack_from(data, pos)
+        # the Unicode offsets are only there with a header of 0x24 bytes or more
+        lbp_offset_unicode, cps_offset_unicode = 0, 0
+        if header_size >= 0x24 and size >= 0x24:
+            lbp_offset_unicode, cps_offset_unicode = \
+                self.st_unicode_offsets.unpack_from(data, pos + 0x1c)
+        if cps_offset_unicode:
+            suffix = self._UnicodeString(data, pos + cps_offset_unicode, end)
+        else:
+            suffix = self._CString(data, pos + cps_offset, end)
+        path, serial, drive_type, label, netname = u"", -1, -1, u"", u""
+        if flags & 0x00000001 and vid_offset + self.st_volumeid.size <= size:
+            vid_size, drive_type, serial, label_offset = \
+                self.st_volumeid.unpack_from(data, pos + vid_offset)
+            if label_offset != 0x14:
+                label = self._CString(data, pos + vid_offset + label_offset, end)
+            elif vid_offset + 0x14 <= size:
+                # the offset of the Unicode label follows
+                label_offset, = self.st_ulong.unpack_from(data, pos + vid_offset + 0x10)
+                label = self._UnicodeString(data, pos + vid_offset + label_offset, end)
+            if lbp_offset_unicode:
+                path = self._UnicodeString(data, pos + lbp_offset_unicode, end)
+            else:
+                path = self._CString(data, pos + lbp_offset, end)
+        if flags & 0x00000002 and cnrl_offset + self.st_cnrl.size <= size:
+            cnrl_size, cnrl_flags, nn_offset, dn_offset, provider = \
+                self.st_cnrl.unpack_from(data, pos + cnrl_offset)
+            if nn_offset > 0x14 and cnrl_offset + 0x18 <= size:
+                # the offset of the Unicode net name follows
+                nn_offset, = self.st_ulong.unpack_from(data, pos + cnrl_offset + 0x14)
+                netname = self._UnicodeString(data, pos + cnrl_offset + nn_offset, end)
+            else:
+                netname = self._CString(data, pos + cnrl_offset + nn_offset, end)
+            if not path:
+                path = netname
+        if suffix:
+            path = path + u"\\" + suffix if path and not path.endswith(u"\\") else path + suffix
+        return [path, serial, drive_type, label, netname]
+
+    def Parse(self, blobs):
+        """
+        Parses LNK files and appends their rows to the columns.
+
+        :param blobs: iterable of (source, data) tuples, see BlobsFromFiles and BlobsFromJumpList
+        :return: the number of LNK files parsed (int)
+        """
+        count = 0
+        columns = [self.columns[name] for name in self.column_names]
+        for source, data in blobs:
+            for column, value in zip(columns, self._Row(source, data)):
+                column.append(value)
+            count += 1
+        return count
+
+    def Rows(self, blobs=None):
+        """
+        Yields rows, either parsing the blobs given or from the columns already parsed.
+
+        :param blobs: iterable of (source, data) tuples, or None for the stored columns
+        :return: generator of rows, in the order of column_names (generator of lists)
+        """
+        if blobs is None:
+            columns = [self.columns[name] for name in self.column_names]
+            for index in xrange(len(columns[0])):
+                yield [column[index] for column in columns]
+        else:
+            for source, data in blobs:
+                yield self._Row(source, data)
+
+    def WriteCSV(self, fd, blobs=None):
+        """
+        Writes a CSV file with a header line, encoded as UTF-8. With blobs, every LNK is written as
+        soon as it's parsed and nothing is stored.
+
+        :param fd: file open for writing (file)
+        :param blobs: iterable of (source, data) tuples, or None to write the stored columns
+        """
+        writer = csv.writer(fd)
+        writer.writerow(self.column_names)
+        for row in self.Rows(blobs):
+            writer.writerow([v.encode("utf-8") if type(v) == unicode else v for v in row])
+
+    def WriteJSONL(self, fd, blobs=None):
+        """
+        Writes one JSON object per line. With blobs, every LNK is written as soon as it's parsed
+        and nothing is stored.
+
+        :param fd: file open for writing (file)
+        :param blobs: iterable of (source, data) tuples, or None to write the stored columns
+        """
+        for row in self.Rows(blobs):
+            if type(row[0]) == str:
+                row[0] = row[0].decode("utf-8", "replace")
+            fd.write(json.dumps(dict(zip(self.column_names, row))))
+            fd.write("\n")
+
+    def BlobsFromFiles(self, paths):
+        """
+        Reads LNK files from disk, one at a time.
+
+        :param paths: iterable of paths (strings)
+        :return: generator of (path, data) tuples (generator)
+        """
+        for path in paths:
+            with open(path, "rb") as fd:
+                yield path, fd.read()
+
+    def BlobsFromJumpList(self, fd, source=""):
+        """
+        Reads the LNK streams of an *.automaticDestinations-ms jump list, an MS-OLE file with one
+        stream per entry plus the DestList stream, which is skipped.
+
+        :param fd: the jump list (file or str)
+        :param source: prefix for the stream names in the source column (string)
+        :return: generator of ("source:stream", data) tuples (generator)
+        """
+        data = fd.read() if type(fd) == file else fd
+        for name, stream in self._OLEStreams(data):
+            if name != u"DestList":
+                yield "%s:%s" % (source, name.encode("utf-8")), stream
+
+    def _OLEStreams(self, data):
+        """
+        Minimal MS-OLE reader: follows the FAT and mini FAT chains of every stream in the root
+        storage. Chains are cut short on bad sector numbers or loops, the validation of the
+        container itself is MSOLEValidator's job.
+
+        :param data: MS-OLE file (string)
+        :return: generator of (name, data) tuples (generator)
+        """
+        if len(data) < 512 or data[0:8] != "\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1":
+            return
+        sector_shift, mini_shift = struct.unpack_from("<HH", data, 30)
+        dir_start, = struct.unpack_from("<l", data, 48)
+        mini_cutoff, minifat_start = struct.unpack_from("<Ll", data, 56)
+        difat_start, = struct.unpack_from("<l", data, 68)
+        if not 7 <= sector_shift <= 16 or mini_shift >= sector_shift:
+            return
+        sector_size = 1 << sector_shift
+        per_sector = sector_size / 4
+        st_sector = struct.Struct("<%dl" % per_sector)
+        max_sector = (len(data) >> sector_shift) - 1
+
+        def Sector(number):
+            return data[(number + 1) << sector_shift: (number + 2) << sector_shift]
+
+        def Ints(number):
+            raw = Sector(number)
+            return st_sector.unpack(raw) if len(raw) == sector_size else ()
+
+        difat = list(struct.unpack_from("<109l", data, 76))
+        sector = difat_start
+        for x in xrange(max_sector + 1):
+            if not 0 <= sector <= max_sector:
+                break
+            ints = Ints(sector)
+            if not ints:
+                break
+            difat.extend(ints[:-1])
+            sector = ints[-1]
+        fat = []
+        for sector in difat:
+            if 0 <= sector <= max_sector:
+                fat.extend(Ints(sector))
+
+        def Chain(start, table, read):
+            parts = []
+            sector = start
+            for x in xrange(len(table)):
+                if not 0 <= sector < len(table):
+                    break
+                parts.append(read(sector))
+                sector = table[sector]
+            return "".join(parts)
+
+        directory = Chain(dir_start, fat, Sector)
+        if len(directory) < 128:
+            return
+        root_start, = struct.unpack_from("<l", directory, 116)
+        mini_stream = Chain(root_start, fat, Sector)
+        minifat_raw = Chain(minifat_start, fat, Sector)
+        minifat = struct.unpack("<%dl" % (len(minifat_raw) / 4), minifat_raw)
+        mini_size = 1 << mini_shift
+
+        def MiniSector(number):
+            return mini_stream[number * mini_size: (number + 1) * mini_size]
+
+        for pos in xrange(128, len(directory) - 127, 128):
+            name_len, entry_type = struct.unpack_from("<HB", directory, pos + 64)
+            start, size = struct.unpack_from("<lL", directory, pos + 116)
+            if entry_type != 2 or not 2 <= name_len <= 64:
+                continue
+            name = directory[pos: pos + name_len - 2].decode("utf-16-le", "replace")
+            if size < mini_cutoff:
+                stream = Chain(start, minifat, MiniSector)
+            else:
+                stream = Chain(start, fat, Sector)
+            yield name, stream[:size]
@@ -17,6 +17,9 @@
 import datetime
 import struct
 
+from collections import namedtuple
+
+from FileTime import FileTime
 from Validator import Validator
 
 
@@ -186,15 +189,120 @@ class LNKValidator(Validator):
         """
         Calls Validator.__init__() and sets some internal attributes for the validation process.
 
+        :var st_header: ShellLinkHeader, 76 bytes. (struct.Struct)
+        :var link_flags: names and bits of the LinkFlags field. (list of tuples)
+        :var file_attributes: names and bits of the FileAttributes field. (list of tuples)
         """
         super(LNKValidator, self).__init__()
         self.data = ""
         self.pos = 0
-        self.details = {}
+        self.details = None
+        self.header = None
+        self.sections = []
+        self.linkinfo_offset = -1
+        self.extra_blocks = []
+        self.extra_data_length = 0
         self.magic = "L\x00\x00\x00\x01\x14\x02\x00\x00\x00\x00\x00\xc0\x00\x00\x00\x00\x00\x00F"
+        self.filetime = FileTime()
+        self.st_header = struct.Struct("<20sLLQQQLLL2sHLL")
+        self.st_ushort = struct.Struct("<H")
+        self.st_ulong = struct.Struct("<L")
+        self.st_linkinfo = struct.Struct("<LLLL")
+        self.nt_header = namedtuple("ShellLinkHeader",
+            "magic flags file_attributes ctime atime wtime file_size icon_index show_command "
+            "hotkey reserved1 reserved2 reserved3")
+        self.link_flags = [
+            ("HasLinkTargetIDList", 0x00000001),
+            ("HasLinkInfo", 0x00000002),
+            ("HasName", 0x00000004),
+            ("HasRelativePath", 0x00000008),
+            ("HasWorkingDir", 0x00000010),
+            ("HasArguments", 0x00000020),
+            ("HasIconLocation", 0x00000040),
+            ("IsUnicode", 0x00000080),
+            ("ForceNoLinkInfo", 0x00000100),
+            ("HasExpString", 0x00000200),
+            ("RunInSeparateProcess", 0x00000400),
+            ("UNUSED1", 0x00000800),
+            ("HasDarwinID", 0x00001000),
+            ("RunAsUser", 0x00002000),
+            ("HasExpIcon", 0x00004000),
+            ("NoPidlAlias", 0x00008000),
+            ("UNUSED2", 0x00010000),
+            ("RunWithShimLayer", 0x00020000),
+            ("ForceNoLinkTrack", 0x00040000),
+            ("EnableTargetMetadata", 0x00080000),
+            ("DisableLinkPathTracking", 0x00100000),
+            ("DisableKnownFolderTracking", 0x00200000),
+            ("DisableKnownFolderAlias", 0x00400000),
+            ("AllowLinkToLink", 0x00800000),
+            ("UnaliasOnSave", 0x01000000),
+            ("PreferEnvironmentPath", 0x02000000),
+            ("KeepLocalIDListForUNCTarget", 0x04000000),
+        ]
+        self.file_attributes = [
+            ("ReadOnly", 0x0001),
+            ("Hidden", 0x0002),
+            ("System", 0x0004),
+            ("RESERVED1", 0x0008),
+            ("Directory", 0x0010),
+            ("Archive", 0x0020),
+            ("RESERVED2", 0x0040),
+            ("Normal", 0x0080),
+            ("Temporary", 0x0100),
+            ("Sparse", 0x0200),
+            ("ReparsePoint", 0x0400),
+            ("Compressed", 0x0800),
+            ("Offline", 0x1000),
+            ("NotContentIndexed", 0x2000),
+            ("Encrypted", 0x4000),
+        ]
+        # the flags of the strings in the StringData section, in the order they are stored
+        self.string_flags = [0x00000004, 0x00000008, 0x00000010, 0x00000020, 0x00000040]
+        self.block_methods = {
+            "\x02\x00\x00\xa0": self._ExtraConsole,
+            "\x04\x00\x00\xa0": self._ExtraConsoleFe,
+            "\x06\x00\x00\xa0": self._ExtraDarwin,
+            "\x01\x00\x00\xa0": self._ExtraEnvironment,
+            "\x07\x00\x00\xa0": self._ExtraIcon,
+            "\x0b\x00\x00\xa0": self._ExtraKnownFolder,
+            "\x09\x00\x00\xa0": self._ExtraProperty,
+            "\x08\x00\x00\xa0": self._ExtraShim,
+            "\x05\x00\x00\xa0": self._ExtraSpecialFolder,
+            "\x03\x00\x00\xa0": self._ExtraTracker,
+            "\x0c\x00\x00\xa0": self._ExtraVista,
+        }  # "jump-dictionary", probably the sanest way to parse the ExtraData block.
+        # smallest size of each block, as defined by MS-SHLLINK, so the parsers always get enough
+        self.block_min_sizes = {
+            "\x02\x00\x00\xa0": 0xcc,
+            "\x04\x00\x00\xa0": 0x0c,
+            "\x06\x00\x00\xa0": 0x314,
+            "\x01\x00\x00\xa0": 0x314,
+            "\x07\x00\x00\xa0": 0x314,
+            "\x0b\x00\x00\xa0": 0x1c,
+            "\x09\x00\x00\xa0": 0x0c,
+            "\x08\x00\x00\xa0": 0x88,
+            "\x05\x00\x00\xa0": 0x10,
+            "\x03\x00\x00\xa0": 0x60,
+            "\x0c\x00\x00\xa0": 0x0a,
+        }
 
-    def _ConvertBytes(self, value):
-        pass
+    def _Cleanup(self):
+        """
+        Cleans up all the internal attributes that are set by the Validate method when a file is
+        analyzed.
+        """
+        self.pos = 0
+        self.is_valid = False
+        self.eof = False
+        self.end = False
+        self.bytes_last_valid = 0
+        self.details = None
+        self.header = None
+        self.sections = []
+        self.linkinfo_offset = -1
+        self.extra_blocks = []
+        self.extra_data_length = 0
 
     def _Read(self, length):
         ret = self.data[self.pos: self.pos + length]
@@ -207,10 +315,47 @@ class LNKValidator(Validator):
         """
         Returns dictionary with important information from the recently-validated file.
 
+        Validate only looks at the raw values it needs to decide if the file is valid, the
+        dictionary (flags, GUIDs, timestamps, strings and extra data blocks) is built here the
+        first time it's asked for.
+
         :return: dictionary {}
         """
+        if self.details is None:
+            self._BuildDetails()
         return self.details
 
+    def _BuildDetails(self):
+        """
+        Internal method! Called from GetDetails to parse the sections that Validate found.
+        """
+        self._CleanDetails()
+        header = self.header
+        if header is None:
+            return
+        self.details["HeaderSize"] = header.magic[0:4].encode("hex")
+        self.details["LinkCLSID"] = GUID(header.magic[4:20])
+        self.details["ATime"] = self.filetime.ToDatetime(header.atime)
+        self.details["CTime"] = self.filetime.ToDatetime(header.ctime)
+        self.details["WTime"] = self.filetime.ToDatetime(header.wtime)
+        self.details["FileSize"] = header.file_size
+        self.details["IconIndex"] = header.icon_index
+        self.details["ShowCommand"] = header.show_command
+        self.details["Hotkey"] = header.hotkey
+        self.details["Reserved1"] = header.reserved1
+        self.details["Reserved2"] = header.reserved2
+        self.details["Reserved3"] = header.reserved3
+        self.details["Flags"] = dict(
+            (name, bool(header.flags & bit)) for name, bit in self.link_flags)
+        self.details["FileAttributes"] = dict(
+            (name, bool(header.file_attributes & bit)) for name, bit in self.file_attributes)
+        eof = self.eof
+        for method, pos, args in self.sections:
+            self.pos = pos
+            method(*args)
+        self.eof = eof
+        self._ExtraData()
+
     def _CleanDetails(self):
         self.details = {
             "extensions": [".lnk"],
@@ -218,43 +363,43 @@ class LNKValidator(Validator):
 
     def _ExtraData(self):
         """
-        Internal method! Called from Validate to test if there's an ExtraData structure present. It
-        reads it and extracts data from it.
+        Internal method! Called from GetDetails to extract data from the ExtraData blocks that
+        _WalkExtraData found.
         """
-        block_methods = {
-            "\x02\x00\x00\xa0": self._ExtraConsole,
-            "\x04\x00\x00\xa0": self._ExtraConsoleFe,
-            "\x06\x00\x00\xa0": self._ExtraDarwin,
-            "\x01\x00\x00\xa0": self._ExtraEnvironment,
-            "\x07\x00\x00\xa0": self._ExtraIcon,
-            "\x0b\x00\x00\xa0": self._ExtraKnownFolder,
-            "\x09\x00\x00\xa0": self._ExtraProperty,
-            "\x08\x00\x00\xa0": self._ExtraShim,
-            "\x05\x00\x00\xa0": self._ExtraSpecialFolder,
-            "\x03\x00\x00\xa0": self._ExtraTracker,
-            "\x0c\x00\x00\xa0": self._ExtraVista,
-        }  # "jump-dictionary", probably the sanest way to parse the ExtraData block.
         tmp = []
-        edl = 0
-        size_raw = self._Read(4)
-        if len(size_raw) == 4:
-            edl = 4
-            block_size, = struct.unpack("<L", size_raw)
-            while block_size > 0:
-                extra_data = size_raw + self._Read(block_size - 4)
-                block_sign = extra_data[4:8]
-                op = block_methods[block_sign]
-                edl += len(extra_data)
-                extra_data = op(extra_data)
-                tmp.append(extra_data)
-                size_raw = self._Read(4)
-                block_size, = struct.unpack("<L", size_raw)
+        for pos, block_size in self.extra_blocks:
+            extra_data = self.data[pos: pos + block_size]
+            op = self.block_methods[extra_data[4:8]]
+            tmp.append(op(extra_data))
         # The problem with ExtraData is that it is a list of ExtraDataBlocks at the end of the file,
         # which is entirely optional and can be cut off from it. It has its own structure, so we
         # parse it and store it apart from the MS-SHLLINK structure.
         # Final length of the file is the valid bytes + extra data length.
         self.details["ExtraData"] = tmp
-        self.details["ExtraDataLength"] = edl
+        self.details["ExtraDataLength"] = self.extra_data_length
+
+    def _WalkExtraData(self, pos):
+        """
+        Internal method! Called from Validate to find the ExtraData blocks, by their sizes and
+        signatures only. A block with an unknown signature, or that doesn't fit in the data, ends
+        the walk.
+
+        :param pos: offset where the ExtraData section starts (int)
+        """
+        data = self.data
+        if pos + 4 > len(data):
+            return
+        edl = 4
+        block_size, = self.st_ulong.unpack_from(data, pos)
+        while block_size >= 4:
+            if pos + block_size + 4 > len(data) or \
+                    block_size < self.block_min_sizes.get(data[pos + 4: pos + 8], 0xffffffff):
+                break
+            self.extra_blocks.append((pos, block_size))
+            edl += block_size
+            pos += block_size
+            block_size, = self.st_ulong.unpack_from(data, pos)
+        self.extra_data_length = edl
 
     def _ExtraConsole(self, block):
         bsize, bsign, fillat, popatt, scrnbuffx, scrnbuffy = struct.unpack("<LLHHHH", block[0:16])
@@ -379,7 +524,7 @@ class LNKValidator(Validator):
         }
 
     def _ExtraShim(self, block):
-        bsize, bsign = struct.unpack("<LL", block)
+        bsize, bsign = struct.unpack("<LL", block[0:8])
         layername = block[8:]
         if len(layername) % 2 != 0:
             layername = layername[:-1]  # bad? fix to avoid exceptions in case of bad data
@@ -442,16 +587,35 @@ class LNKValidator(Validator):
         Internal method! Called from Validate when a IDList structure is present. It reads it and
         extracts data from it.
         """
-        valid_delta = 2
         tmp = []
         itemid_size, = struct.unpack("<H", self._Read(2))
         while itemid_size > 0:
-            valid_delta += itemid_size
             item = self._Read(itemid_size - 2)
             tmp.append(item)
             itemid_size, = struct.unpack("<H", self._Read(2))
         self.details["IDList"] = tmp
-        self._CountValidBytes(valid_delta)
+
+    def _WalkIDList(self, pos):
+        """
+        Internal method! Called from Validate to skip the LinkTargetIDList structure.
+
+        :param pos: offset where the structure starts (int)
+        :return: offset right after the structure, or -1 if it doesn't fit in the data (int)
+        """
+        data = self.data
+        start = pos
+        while pos + 2 <= len(data):
+            itemid_size, = self.st_ushort.unpack_from(data, pos)
+            pos += 2
+            if itemid_size == 0:
+                self.sections.append((self._IDList, start, ()))
+                return pos
+            if itemid_size < 2:
+                self.is_valid = False
+                return -1
+            pos += itemid_size - 2
+        self.eof = True
+        return -1
 
     def _LinkInfo(self):
         """
@@ -479,8 +643,8 @@ class LNKValidator(Validator):
         commonpath = commonpath[:commonpath.find("\x00")]
         tmp["CommonPathSuffix"] = commonpath
         if cps_offsetu > 0:
-            commonpath_unicode = linkinfo[cps_offsetu]
-            commonpath_unicode = commonpath_unicode.decode("utf-16")
+            commonpath_unicode = linkinfo[cps_offsetu:]
+            commonpath_unicode = commonpath_unicode.decode("utf-16", "replace")
             commonpath_unicode = commonpath_unicode[:commonpath_unicode.find("\x00")]
             tmp["CommonPathSuffixUnicode"] = commonpath_unicode
         if flags["VolumeID"]:  # and Local Base Path
@@ -497,11 +661,11 @@ class LNKValidator(Validator):
             is_unicode = False
             if label_offset == 0x00000014:
                 is_unicode = True
-                label_offset = struct.unpack("<L", rawvid[16:20])
+                label_offset, = struct.unpack("<L", rawvid[16:20])
                 volumeid["VolumeLabelOffsetUnicode"] = label_offset
             data = rawvid[label_offset:]
             if is_unicode:
-                data = data.decode("utf-16")
+                data = data.decode("utf-16", "replace")
             data = data[:-1]  # the strings are NULL terminated, always
             volumeid["Data"] = data
             # that's all for the VolumeID Structure, now to the LocalBasePath
@@ -513,12 +677,8 @@ class LNKValidator(Validator):
                 lb_offset = lbpath_offset
             localbasepath = linkinfo[lb_offset:]
             if lb_unicode:
-                localbasepath.decode("utf-16")
+                localbasepath.decode("utf-16", "replace")
             localbasepath = localbasepath[:localbasepath.find("\x00")]
-            # done parsing, now some checks
-            # only valid drive types defined
-            self.is_valid = self.is_valid and dtype in {0, 1, 2, 3, 4, 5, 6}
-            # should add checks for the offsets
             # and now we add to the dictionary
             tmp["VolumeID"] = volumeid
             tmp["LocalBasePath"] = localbasepath
@@ -554,24 +714,48 @@ class LNKValidator(Validator):
             }
             if cnrl_unicode:
                 netnameu = rawcnrl[nn_offset_u:]
-                netnameu = netnameu.decode("utf-16")
+                netnameu = netnameu.decode("utf-16", "replace")
                 netnameu = netnameu[:netnameu.find("\x00")]
                 devicenameu = rawcnrl[dn_offset_u:]
-                devicenameu = devicenameu.decode("utf-16")
+                devicenameu = devicenameu.decode("utf-16", "replace")
                 devicenameu = devicenameu[:devicenameu.find("\x00")]
                 cnrl["NetNameOffsetUnicode"] = nn_offset_u
                 cnrl["NetNameUnicode"] = netnameu
                 cnrl["DeviceNameUnicode"] = devicenameu
                 cnrl["DeviceOffsetUnicode"] = dn_offset_u
             tmp["CommonNetworkRelativeLink"] = cnrl
-        # have to add some checks for the whole structure
-        self.is_valid = (
-            self.is_valid and
-            flagsr < 4 and  # only active bits are b0 and b1, the rest should always be 0.
-            True  # dummy value, will get removed later
-        )
         self.details["LinkInfo"] = tmp
-        self._CountValidBytes(linkinfo_size)
+
+    def _WalkLinkInfo(self, pos):
+        """
+        Internal method! Called from Validate to check and skip the LinkInfo structure.
+
+        :param pos: offset where the structure starts (int)
+        :return: offset right after the structure, or -1 if it doesn't fit in the data (int)
+        """
+        data = self.data
+        if pos + self.st_linkinfo.size + 4 > len(data):
+            self.eof = True
+            return -1
+        linkinfo_size, linkinfo_header_size, flagsr, vid_offset = \
+            self.st_linkinfo.unpack_from(data, pos)
+        if pos + linkinfo_size > len(data):
+            self.eof = True
+            return -1
+        # only active bits are b0 and b1, the rest should always be 0.
+        self.is_valid = self.is_valid and flagsr < 4 and linkinfo_size >= 28
+        if self.is_valid and flagsr & 0x00000001:
+            # only valid drive types defined
+            if vid_offset + 8 > linkinfo_size:
+                self.is_valid = False
+            else:
+                dtype, = self.st_ulong.unpack_from(data, pos + vid_offset + 4)
+                self.is_valid = dtype in {0, 1, 2, 3, 4, 5, 6}
+            # should add checks for the offsets
+        if self.is_valid:
+            self.sections.append((self._LinkInfo, pos, ()))
+            self.linkinfo_offset = pos
+        return pos + linkinfo_size
 
     def _Strings(self, string_flags, is_unicode):
         """
@@ -589,7 +773,6 @@ class LNKValidator(Validator):
             "IconLocation",
         ]  # this might be moved to an attribute
         tmp = {}
-        valid_delta = 0
         size_mult = 1
         if is_unicode:
             size_mult = 2
@@ -599,32 +782,35 @@ class LNKValidator(Validator):
                 size *= size_mult
                 string = self._Read(size)
                 if is_unicode:
-                    string = string.decode("utf16")
+                    string = string.decode("utf16", "replace")
                 name = string_names[index]
                 tmp[name] = string
-                valid_delta += 2 + size
-        self._CountValidBytes(valid_delta)
         self.details["Strings"] = tmp
 
-    def _MSTimestamp(self, timestamp):
+    def _WalkStrings(self, pos, flags):
         """
-        Converts a MS Timestamp into a datetime object.
-        :param timestamp: 64 bit MS timestap (string)
-        :return:
+        Internal method! Called from Validate to skip the StringData structures.
+
+        :param pos: offset where the first string starts (int)
+        :param flags: LinkFlags from the header (int)
+        :return: offset right after the last string, or -1 if they don't fit in the data (int)
         """
-        tics, = struct.unpack("<Q", timestamp)
-        days = tics / 864000000000
-        rem = tics - days * 864000000000
-        hours = rem / 36000000000
-        rem -= hours * 36000000000
-        minutes = rem / 600000000
-        rem -= minutes * 600000000
-        seconds = rem / 10000000
-        rem -= seconds * 10000000
-        microseconds = rem / 100
-        td = datetime.timedelta(days)  # this way its easier to handle leap years
-        date = datetime.datetime(1601, 1, 1, hours, minutes, seconds, microseconds) + td
-        return date
+        data = self.data
+        start = pos
+        size_mult = 2 if flags & 0x00000080 else 1
+        string_flags = [bool(flags & bit) for bit in self.string_flags]
+        for value in string_flags:
+            if value:
+                if pos + 2 > len(data):
+                    self.eof = True
+                    return -1
+                size, = self.st_ushort.unpack_from(data, pos)
+                pos += 2 + size * size_mult
+        if pos > len(data):
+            self.eof = True
+            return -1
+        self.sections.append((self._Strings, start, (string_flags, bool(flags & 0x00000080))))
+        return pos
 
     def Validate(self, fd):
         """
@@ -633,111 +819,43 @@ class LNKValidator(Validator):
         :param fd: file-like object open for binary reading (file-like)
         :return: True on a valid LNK file, False otherwise (bool)
         """
+        self._Cleanup()
         if type(fd) == file:
             self.data = fd.read()
         elif type(fd) == str:
             self.data = fd
         else:
             raise Exception("Argument must be either a file or a string.")
-        # this first section has to change, for all validators
-        self.pos = 0
-        self.is_valid = True
-        self.eof = False
-        self.end = False
-        self._SetValidBytes(0)
-        self._CleanDetails()
-        # and this top section could go to Validator, perhaps?
-        # now we start with the header validation, this could go to a separate method, but it then
-        # calling of
-        shlheader = self._Read(76)
-        magic_header = shlheader[0:20]
-        flags_raw, fileatt_raw = struct.unpack("<LL", shlheader[20:28])
-        self.details["HeaderSize"] = magic_header[0:4].encode("hex")
-        self.details["LinkCLSID"] = GUID(magic_header[4:20])
-        self.details["ATime"] = self._MSTimestamp(shlheader[28:36])
-        self.details["CTime"] = self._MSTimestamp(shlheader[36:44])
-        self.details["WTime"] = self._MSTimestamp(shlheader[44:52])
-        fsize, icoindex, shwcmd, hotkey = struct.unpack("<LLL2s", shlheader[52:66])
-        reserve1, reserve2, reserve3 = struct.unpack("<HLL", shlheader[66:76])
-        self.details["FileSize"] = fsize
-        self.details["IconIndex"] = icoindex
-        self.details["ShowCommand"] = shwcmd
-        self.details["Hotkey"] = hotkey
-        self.details["Reserved1"] = reserve1
-        self.details["Reserved2"] = reserve2
-        self.details["Reserved3"] = reserve3
-        flags = {
-            "HasLinkTargetIDList": bool(flags_raw & 0x00000001),
-            "HasLinkInfo": bool(flags_raw & 0x00000002),
-            "HasName": bool(flags_raw & 0x00000004),
-            "HasRelativePath": bool(flags_raw & 0x00000008),
-            "HasWorkingDir": bool(flags_raw & 0x00000010),
-            "HasArguments": bool(flags_raw & 0x00000020),
-            "HasIconLocation": bool(flags_raw & 0x00000040),
-            "IsUnicode": bool(flags_raw & 0x00000080),
-            "ForceNoLinkInfo": bool(flags_raw & 0x00000100),
-            "HasExpString": bool(flags_raw & 0x00000200),
-            "RunInSeparateProcess": bool(flags_raw & 0x00000400),
-            "UNUSED1": bool(flags_raw & 0x00000800),
-            "HasDarwinID": bool(flags_raw & 0x00001000),
-            "RunAsUser": bool(flags_raw & 0x00002000),
-            "HasExpIcon": bool(flags_raw & 0x00004000),
-            "NoPidlAlias": bool(flags_raw & 0x00008000),
-            "UNUSED2": bool(flags_raw & 0x00010000),
-            "RunWithShimLayer": bool(flags_raw & 0x00020000),
-            "ForceNoLinkTrack": bool(flags_raw & 0x00040000),
-            "EnableTargetMetadata": bool(flags_raw & 0x00080000),
-            "DisableLinkPathTracking": bool(flags_raw & 0x00100000),
-            "DisableKnownFolderTracking": bool(flags_raw & 0x00200000),
-            "DisableKnownFolderAlias": bool(flags_raw & 0x00400000),
-            "AllowLinkToLink": bool(flags_raw & 0x00800000),
-            "UnaliasOnSave": bool(flags_raw & 0x01000000),
-            "PreferEnvironmentPath": bool(flags_raw & 0x02000000),
-            "KeepLocalIDListForUNCTarget": bool(flags_raw & 0x04000000),
-        }
-        self.details["Flags"] = flags
-        self.details["FileAttributes"] = {
-            "ReadOnly": bool(fileatt_raw & 0x0001),
-            "Hidden": bool(fileatt_raw & 0x0002),
-            "System": bool(fileatt_raw & 0x0004),
-            "RESERVED1": bool(fileatt_raw & 0x0008),
-            "Directory": bool(fileatt_raw & 0x0010),
-            "Archive": bool(fileatt_raw & 0x0020),
-            "RESERVED2": bool(fileatt_raw & 0x0040),
-            "Normal": bool(fileatt_raw & 0x0080),
-            "Temporary": bool(fileatt_raw & 0x0100),
-            "Sparse": bool(fileatt_raw & 0x0200),
-            "ReparsePoint": bool(fileatt_raw & 0x0400),
-            "Compressed": bool(fileatt_raw & 0x0800),
-            "Offline": bool(fileatt_raw & 0x1000),
-            "NotContentIndexed": bool(fileatt_raw & 0x2000),
-            "Encrypted": bool(fileatt_raw & 0x4000),
-        }
-        hks = struct.unpack("<BB", hotkey)
+        if len(self.data) < self.st_header.size:
+            self.eof = True
+            return self.is_valid
+        # the header is decided from the raw values alone, the details are built by GetDetails
+        header = self.nt_header._make(self.st_header.unpack_from(self.data, 0))
+        self.header = header
+        hks = (ord(header.hotkey[0]), ord(header.hotkey[1]))
         self.is_valid = (  # this way we can comment each line :)
-            magic_header == self.magic and
-            fileatt_raw < 32768 and
-            shwcmd in {0x01, 0x03, 0x07} and  # might be a bit too strict
+            header.magic == self.magic and
+            header.file_attributes < 32768 and
+            header.show_command in {0x01, 0x03, 0x07} and  # might be a bit too strict
             (hks == (0, 0) or (0x30 <= hks[0] <= 0x91 and hks[1] in {1, 2, 4})) and
-            reserve1 == 0 and
-            reserve2 == 0 and
-            reserve3 == 0
+            header.reserved1 == 0 and
+            header.reserved2 == 0 and
+            header.reserved3 == 0
         )
-            #(hotkey == "\x00\00" or (0x30 <= ord(hotkey[0]) <= 0x91 and \
-            #    hotkey[1] in {"\x01", "\x02", "\x04"}))
-        self._CountValidBytes(76)
-        if flags["HasLinkTargetIDList"]:
-            self._IDList()
-        if flags["HasLinkInfo"]:
-            self._LinkInfo()
-        string_flags = [
-            flags["HasName"],
-            flags["HasRelativePath"],
-            flags["HasWorkingDir"],
-            flags["HasArguments"],
-            flags["HasIconLocation"],
+        pos = self.st_header.size
+        self._SetValidBytes(pos)
+        sections = [
+            (0x00000001, self._WalkIDList, ()),
+            (0x00000002, self._WalkLinkInfo, ()),
+            (0x0000007c, self._WalkStrings, (header.flags,)),
         ]
-        if any(string_flags):
-            self._Strings(string_flags, flags["IsUnicode"])
-        self._ExtraData()
-        return self.is_valid  # still working on the proper algorithm
\ No newline at end of file
+        for flag, method, args in sections:
+            if pos < 0 or not self.is_valid:
+                break
+            if header.flags & flag:
+                pos = method(pos, *args)
+                if pos >= 0:
+                    self._SetValidBytes(pos)
+        if pos >= 0 and self.is_valid:
+            self._WalkExtraData(pos)
+        return self.is_valid
@@ -0,0 +1,194 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import mmap
+import re
+
+from collections import namedtuple
+from EMLValidator import EMLValidator
+
+
+class MBoxParser(object):
+    """
+    Splits an mbox or MMDF mailbox into its messages and validates each one with EMLValidator.
+
+    The mailbox is memory mapped and the separators are found with find(): "From " lines for mbox
+    (the blank line that comes before them isn't part of the message) and lines of four 0x01 bytes
+    around every message for MMDF. Messages of a mailbox given as a string are validated in place,
+    with EMLValidator.ValidateSpan; those of a mapped file are sliced from the map one at a time,
+    so the mailbox is never held whole in memory and never split into files.
+
+    Messages are yielded as MBoxMessage namedtuples, with the message offsets in the mailbox, the
+    verdict and the key_headers found in the message headers.
+    """
+
+    def __init__(self, deep=False):
+        """
+        Sets the validator and some internal attributes.
+
+        :param deep: decode the parts of every message and validate their attachments, see
+            EMLValidator. (bool)
+        :var validator: the validator of each message. (EMLValidator)
+        :var key_headers: headers that are returned with every message, the first of each is
+            kept. (tuple of strings)
+        """
+        self.validator = EMLValidator(deep)
+        self.key_headers = ("From", "To", "Cc", "Date", "Subject", "Message-ID")
+        self.re_key_headers = re.compile(
+            r"^(%s)[ \t]*:[ \t]*([^\r\n]*)" % "|".join(re.escape(h) for h in self.key_headers),
+            re.MULTILINE | re.IGNORECASE)
+        self.key_header_names = dict((h.lower(), h) for h in self.key_headers)
+        self.re_headers_end = re.compile(r"\n\r?\n")
+        self.mmdf_separator = "\x01\x01\x01\x01\n"
+        self.nt_message = namedtuple("MBoxMessage",
+            "number offset length envelope is_valid eof diagnostics headers")
+        self.data = ""
+        self.mapped = False
+        self.format = None
+
+    def Open(self, fd):
+        """
+        Maps the mailbox and tells its format from its first bytes.
+
+        :param fd: the mailbox (file or str)
+        :return: "mbox", "mmdf" or None if it's neither (string)
+        """
+        self.Close()
+        if type(fd) == file:
+            fd.seek(0, 2)
+            if fd.tell():
+                self.data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+                self.mapped = True
+        elif type(fd) == str:
+            self.data = fd
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        if self.data[:5] == "From ":
+            self.format = "mbox"
+        elif self.data[:5] == self.mmdf_separator:
+            self.format = "mmdf"
+        return self.format
+
+    def Close(self):
+        """
+        Unmaps the data, if it was mapped by Open.
+        """
+        if self.mapped:
+            self.data.close()
+        self.data = ""
+        self.mapped = False
+        self.format = None
+
+    def _MBoxSpans(self):
+        """
+        :return: generator of (separator offset, message offset, message end) (generator of tuples)
+        """
+        data = self.data
+        data_len = len(data)
+        pos = 0
+        while pos < data_len:
+            eol = data.find("\n", pos)
+            start = data_len if eol < 0 else eol + 1
+            found = data.find("\n\nFrom ", start - 1)
+            if found < 0:
+                stop = data_len
+                if data[stop - 2: stop] == "\n\n" and stop - 1 > start:
+                    # the blank line after the last message
+                    stop -= 1
+                yield pos, start, stop
+                return
+            # the message ends with its line break, the blank line belongs to the separator
+            yield pos, start, found + 1
+            pos = found + 2
+
+    def _MMDFSpans(self):
+        """
+        :return: generator of (separator offset, message offset, message end) (generator of tuples)
+        """
+        data = self.data
+        data_len = len(data)
+        separator = self.mmdf_separator
+        pos = 0
+        while pos < data_len:
+            if data[pos: pos + 5] != separator:
+                # garbage between messages, up to the next separator
+                found = data.find("\n" + separator, pos)
+                if found < 0:
+                    return
+                pos = found + 1
+                continue
+            start = pos + 5
+            found = data.find("\n" + separator, start - 1)
+            stop = data_len if found < 0 else found + 1
+            yield pos, start, stop
+            # the separator that closes the message, then the one that opens the next
+            pos = stop + 5
+
+    def _Headers(self, data, start, stop):
+        """
+        :param data: buffer that holds the message (string)
+        :param start: offset of the message (int)
+        :param stop: end of the message (int)
+        :return: the first value of each of the key_headers found (dict)
+        """
+        end = self.re_headers_end.search(data, start, stop)
+        headers = {}
+        names = self.key_header_names
+        for match in self.re_key_headers.finditer(data, start, stop if end is None else end.end()):
+            name = names[match.group(1).lower()]
+            if name not in headers:
+                headers[name] = match.group(2).strip()
+        return headers
+
+    def Messages(self):
+        """
+        Validates the messages of the mailbox opened by Open, one at a time.
+
+        :return: generator of messages (generator of MBoxMessage)
+        """
+        if self.format == "mbox":
+            spans = self._MBoxSpans()
+        elif self.format == "mmdf":
+            spans = self._MMDFSpans()
+        else:
+            return
+        data = self.data
+        validator = self.validator
+        for number, (separator, start, stop) in enumerate(spans):
+            envelope = data[separator: start].rstrip("\r\n") if self.format == "mbox" else ""
+            if self.mapped:
+                message = data[start: stop]
+                validator.ValidateSpan(message, 0, len(message))
+                headers = self._Headers(message, 0, len(message))
+            else:
+                validator.ValidateSpan(data, start, stop)
+                headers = self._Headers(data, start, stop)
+            yield self.nt_message(
+                number, start, stop - start, envelope, validator.is_valid, validator.eof,
+                validator.diagnostics, headers)
+
+    def Parse(self, fd):
+        """
+        Opens a mailbox and validates its messages.
+
+        :param fd: the mailbox (file or str)
+        :return: generator of messages (generator of MBoxMessage)
+        """
+        self.Open(fd)
+        try:
+            for message in self.Messages():
+                yield message
+        finally:
+            self.Close()
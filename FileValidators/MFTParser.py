@@ -0,0 +1,399 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import mmap
+import multiprocessing
+import os
+import struct
+
+from collections import namedtuple
+from MFTPathIndex import MFTPathIndex
+from NTFSFileRecordValidator import NTFSFileRecordValidator
+
+
+_worker_parsers = {}
+
+
+def _ParseRangeWorker(args):
+    """
+    Worker process side of MFTParser._ParallelRanges: maps the $MFT once per process and parses
+    the range of records it gets.
+
+    This is a function and not an MFTParser method so it can be sent to worker processes.
+
+    :param args: tuple of (path, offset, length, record_size, start, stop, build_index)
+    :return: the records of the range as plain tuples (see MFTParser._Flatten), or the path index
+        of the range when build_index is True (list or MFTPathIndex)
+    """
+    path, offset, length, record_size, start, stop, build_index = args
+    key = (path, offset, length, record_size)
+    if key not in _worker_parsers:
+        for parser in _worker_parsers.values():
+            parser.Close()
+        _worker_parsers.clear()
+        parser = MFTParser(record_size)
+        with open(path, "rb") as fd:
+            parser.Open(fd, offset, length)
+        _worker_parsers[key] = parser
+    parser = _worker_parsers[key]
+    if build_index:
+        return parser.BuildIndex(start, stop)
+    return [parser._Flatten(record) for record in parser.Records(start, stop)]
+
+
+class MFTParser(object):
+    """
+    Parses a whole $MFT (or the region of a disk image that holds it) record by record.
+
+    The data is memory mapped and walked with a fixed stride. Each FILE record is copied into a
+    single reusable buffer, its update sequence fixups are applied there, and the header,
+    $STANDARD_INFORMATION and $FILE_NAME attributes are read with the structs of
+    NTFSFileRecordValidator, without building its details dictionaries.
+
+    With workers > 1, an $MFT opened from a file on disk is split into ranges of chunk_records
+    records that worker processes parse from their own mapping of the file, so no record data is
+    sent to them. Records still come out in record number order, and the path indexes of the
+    ranges are merged in that same order, so the results don't depend on the number of workers.
+
+    Carve() looks for FILE and BAAD records at a fixed alignment anywhere in the data, for the
+    records left in unallocated space by deleted or reformatted volumes.
+
+    Records are yielded as MFTRecord namedtuples. Timestamps are kept as raw FILETIME ticks, use
+    the parser's FileTime (self.filetime) to convert the ones needed. File references are split
+    into record number and sequence number.
+    """
+
+    def __init__(self, record_size=None, workers=1):
+        """
+        :param record_size: size of the FILE records, None to take it from the first record, or
+            1024 if the first record doesn't say (int)
+        :param workers: number of processes used to parse big $MFTs opened from a file (int)
+        :var validator: the validator whose fixup code and structs are used.
+            (NTFSFileRecordValidator)
+        :var st_att_header: type and length of an attribute, common to all of them. (struct.Struct)
+        :var st_att_resident: content length and offset of a resident attribute. (struct.Struct)
+        :var st_stdinfo: timestamps and file attributes of $STANDARD_INFORMATION, the part that
+            NT 4 records (0x30 bytes long) also have. (struct.Struct)
+        """
+        self.validator = NTFSFileRecordValidator()
+        self.filetime = self.validator.filetime
+        self.record_size = record_size
+        self.workers = workers
+        self.parallel_min_records = 1 << 16  # starting the worker processes costs more than parsing
+        self.chunk_records = 1 << 14  # records per task sent to a worker
+        self.st_att_header = struct.Struct("<LL")
+        self.st_att_resident = struct.Struct("<LH")
+        self.st_stdinfo = struct.Struct("<QQQQL")
+        self.nt_record = namedtuple("MFTRecord",
+            "number offset sequence lsn flags hardlink_count base_record base_sequence fixups_ok "
+            "std_info file_names attributes")
+        self.nt_stdinfo = namedtuple("StandardInformation", "ctime atime mtime rtime fileperm")
+        self.nt_filename = namedtuple("FileName",
+            "parent parent_sequence ctime atime mtime rtime size_alloc size_real flags namespace "
+            "name")
+        self.data = ""
+        self.base = 0
+        self.length = 0
+        self.buffer = bytearray()
+        self.mapped = False
+        self.path = None
+        self.offset = 0
+
+    def Open(self, fd, offset=0, length=0):
+        """
+        Maps the $MFT. For a disk image, offset and length select the region of the $MFT.
+
+        :param fd: the $MFT or disk image (file or str)
+        :param offset: where the first record is (int)
+        :param length: bytes to parse, 0 for everything after offset (int)
+        """
+        self.Close()
+        if type(fd) == file:
+            # mmap offsets must be a multiple of the allocation granularity
+            aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+            size = length + offset - aligned if length else 0
+            self.data = mmap.mmap(fd.fileno(), size, access=mmap.ACCESS_READ, offset=aligned)
+            self.base = offset - aligned
+            self.mapped = True
+            self.path = fd.name
+        elif type(fd) == str:
+            self.data = fd
+            self.base = offset
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        self.offset = offset
+        available = max(0, len(self.data) - self.base)
+        self.length = min(length, available) if length else available
+        if self.record_size is None:
+            self.record_size = 1024
+            if self.length >= 48 and self.data[self.base: self.base + 4] == "FILE":
+                header = self.validator.st_header.unpack_from(self.data, self.base)
+                if header[9] in (1024, 4096):
+                    self.record_size = header[9]
+        self.buffer = bytearray(self.record_size)
+
+    def Close(self):
+        """
+        Unmaps the data, if it was mapped by Open.
+        """
+        if self.mapped:
+            self.data.close()
+        self.data = ""
+        self.mapped = False
+        self.path = None
+        self.offset = 0
+        self.base = 0
+        self.length = 0
+
+    def GetRecordCount(self):
+        """
+        :return: number of record slots in the mapped data, used or not (int)
+        """
+        return self.length / self.record_size if self.record_size else 0
+
+    def _ParseRecord(self, buff, number, offset):
+        """
+        Applies the fixups to a FILE record and reads its header and name and time attributes.
+        Attributes are walked by their lengths while they stay within the used part of the record.
+
+        :param buff: the record, modified in place by the fixups (bytearray)
+        :param number: record number (int)
+        :param offset: offset of the record from the start of the $MFT (int)
+        :return: the record (MFTRecord)
+        """
+        validator = self.validator
+        size = len(buff)
+        header = validator.nt_header._make(validator.st_header.unpack_from(buff, 0))
+        fixups_ok = validator._ApplyFixups(buff, size)
+        std_info = None
+        file_names = []
+        attributes = []
+        st_att_header = self.st_att_header
+        st_att_resident = self.st_att_resident
+        end = min(header.size_real, size)
+        pos = header.offset_attribute
+        while pos + 16 <= end:
+            att_type, att_len = st_att_header.unpack_from(buff, pos)
+            if att_type == 0xffffffff or att_len < 16 or pos + att_len > end:
+                break
+            non_resident = buff[pos + 8]
+            attributes.append((att_type, bool(non_resident), pos, att_len))
+            if not non_resident and att_len >= 24:
+                content_len, content_offset = st_att_resident.unpack_from(buff, pos + 16)
+                start = pos + content_offset
+                if start + content_len > pos + att_len:
+                    content_len = 0
+                if att_type == 0x10 and content_len >= 0x30:
+                    std_info = self.nt_stdinfo._make(self.st_stdinfo.unpack_from(buff, start))
+                elif att_type == 0x30 and content_len >= 0x42:
+                    values = validator.st_att_filename.unpack_from(buff, start)
+                    name_end = min(start + 0x42 + 2 * values[9], start + content_len)
+                    name = str(buff[start + 0x42: name_end]).decode("utf-16-le", "replace")
+                    file_names.append(self.nt_filename(
+                        values[0] & 0xffffffffffff, values[0] >> 48, values[1], values[2],
+                        values[3], values[4], values[5], values[6], values[7], values[10], name))
+            pos += att_len
+        return self.nt_record(
+            number, offset, header.sequence_number, header.lsn, header.flags,
+            header.hardlink_count, header.base_record & 0xffffffffffff, header.base_record >> 48,
+            fixups_ok, std_info, file_names, attributes)
+
+    def _Flatten(self, record):
+        """
+        Turns a record into plain tuples and lists, which unlike the namedtuples of this instance
+        can be pickled to send them back from a worker process.
+
+        :param record: the record (MFTRecord)
+        :return: the record (tuple)
+        """
+        std_info = tuple(record.std_info) if record.std_info else None
+        file_names = [tuple(file_name) for file_name in record.file_names]
+        return tuple(record[:9]) + (std_info, file_names, record.attributes)
+
+    def _Unflatten(self, values):
+        """
+        :param values: a record flattened by _Flatten (tuple)
+        :return: the record (MFTRecord)
+        """
+        std_info = self.nt_stdinfo._make(values[9]) if values[9] else None
+        file_names = [self.nt_filename._make(file_name) for file_name in values[10]]
+        return self.nt_record._make(values[:9] + (std_info, file_names, values[11]))
+
+    def _UseWorkers(self, start, stop):
+        """
+        :param start: first record number (int)
+        :param stop: record number to stop at (int)
+        :return: True if the range is worth parsing in parallel (bool)
+        """
+        return self.workers > 1 and self.path is not None and os.path.isfile(self.path) and \
+            stop - start >= self.parallel_min_records
+
+    def _ParallelRanges(self, start, stop, build_index):
+        """
+        Splits a range of records among self.workers processes.
+
+        :param start: first record number (int)
+        :param stop: record number to stop at (int)
+        :param build_index: True for path indexes instead of records (bool)
+        :return: generator of the results of _ParseRangeWorker, in record number order
+        """
+        tasks = [(self.path, self.offset, self.length, self.record_size, first,
+                  min(first + self.chunk_records, stop), build_index)
+                 for first in xrange(start, stop, self.chunk_records)]
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            for result in pool.imap(_ParseRangeWorker, tasks):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def Record(self, number):
+        """
+        Parses a single record.
+
+        :param number: record number (int)
+        :return: the record, or None if there's no FILE record in that slot (MFTRecord)
+        """
+        if not 0 <= number < self.GetRecordCount():
+            return None
+        offset = self.base + number * self.record_size
+        if self.data[offset: offset + 4] != "FILE":
+            return None
+        buff = self.buffer
+        buff[:] = self.data[offset: offset + self.record_size]
+        return self._ParseRecord(buff, number, offset - self.base)
+
+    def Records(self, start=0, stop=None):
+        """
+        Yields the FILE records between two record numbers. Empty slots and records with other
+        signatures are skipped.
+
+        :param start: first record number (int)
+        :param stop: record number to stop at, None for the end of the data (int)
+        :return: generator of records (generator of MFTRecord)
+        """
+        count = self.GetRecordCount()
+        start = max(start, 0)
+        stop = count if stop is None else min(stop, count)
+        if self._UseWorkers(start, stop):
+            for records in self._ParallelRanges(start, stop, False):
+                for values in records:
+                    yield self._Unflatten(values)
+            return
+        data = self.data
+        size = self.record_size
+        base = self.base
+        buff = self.buffer
+        for number in xrange(start, stop):
+            offset = base + number * size
+            if data[offset: offset + 4] != "FILE":
+                continue
+            buff[:] = data[offset: offset + size]
+            yield self._ParseRecord(buff, number, offset - base)
+
+    def BuildIndex(self, start=0, stop=None, index=None):
+        """
+        Parses the records between two record numbers into a path index.
+
+        :param start: first record number (int)
+        :param stop: record number to stop at, None for the end of the data (int)
+        :param index: index to add the records to, None for a new one (MFTPathIndex)
+        :return: the index (MFTPathIndex)
+        """
+        if index is None:
+            index = MFTPathIndex()
+        count = self.GetRecordCount()
+        start = max(start, 0)
+        stop = count if stop is None else min(stop, count)
+        if self._UseWorkers(start, stop):
+            for range_index in self._ParallelRanges(start, stop, True):
+                index.Merge(range_index)
+        else:
+            index.AddRecords(self.Records(start, stop))
+        return index
+
+    def _CarveCheck(self, offset, magic):
+        """
+        Cheap checks on a candidate record, straight from the data: header values that make sense
+        and a consistent update sequence array. Every sector of a FILE record must end with the
+        update sequence number; BAAD records are the ones where that failed, so only the geometry
+        of their array is checked.
+
+        :param offset: offset of the candidate in the data (int)
+        :param magic: "FILE" or "BAAD" (string)
+        :return: the record header, or None if it's not a record (tuple)
+        """
+        data = self.data
+        st_header = self.validator.st_header
+        if offset + st_header.size > len(data):
+            return None
+        header = st_header.unpack_from(data, offset)
+        usa_offset, usa_count, offset_attribute, size_real, size = \
+            header[1], header[2], header[6], header[8], header[9]
+        if size not in (1024, 4096) or offset + size > len(data) or usa_count < 2 or \
+                size % (usa_count - 1) or size / (usa_count - 1) < 512 or usa_offset < 0x28 or \
+                usa_offset + 2 * usa_count > offset_attribute or offset_attribute >= size or \
+                size_real > size:
+            return None
+        if magic == "FILE":
+            stride = size / (usa_count - 1)
+            usn = data[offset + usa_offset: offset + usa_offset + 2]
+            for end in xrange(offset + stride, offset + size + 1, stride):
+                if data[end - 2: end] != usn:
+                    return None
+        return header
+
+    def Carve(self, alignment=1024, start=0, stop=None):
+        """
+        Scans the data for FILE and BAAD records at a fixed alignment, and parses the ones that
+        pass _CarveCheck. The signatures are searched with find(), so the data between records
+        costs next to nothing. The record size is taken from each record's header.
+
+        :param alignment: records are looked for at multiples of this, relative to the offset
+            given to Open (int)
+        :param start: where to start, relative to the offset given to Open (int)
+        :param stop: where to stop, None for the end of the data (int)
+        :return: generator of (offset, signature, record) tuples, offsets relative to the offset
+            given to Open, records numbered as their headers say (generator)
+        """
+        data = self.data
+        base = self.base
+        end = base + (self.length if stop is None else min(stop, self.length))
+        pos = base + max(start, 0)
+        buffers = {}
+        hits = {}
+        for magic in ("FILE", "BAAD"):
+            hits[magic] = data.find(magic, pos, end)
+        while True:
+            candidates = [(hit, magic) for magic, hit in hits.items() if hit >= 0]
+            if not candidates:
+                break
+            offset, magic = min(candidates)
+            remainder = (offset - base) % alignment
+            if remainder:
+                # not aligned, look again from the next aligned offset
+                hits[magic] = data.find(magic, offset + alignment - remainder, end)
+                continue
+            hits[magic] = data.find(magic, offset + alignment, end)
+            header = self._CarveCheck(offset, magic)
+            if header is None or offset + header[9] > end:
+                continue
+            size = header[9]
+            if size not in buffers:
+                buffers[size] = bytearray(size)
+            buff = buffers[size]
+            buff[:] = data[offset: offset + size]
+            yield offset - base, magic, self._ParseRecord(buff, header[13], offset - base)
@@ -0,0 +1,193 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+
+
+class MFTPathIndex(object):
+    """
+    Index of MFT records by number, (parent, parent sequence, sequence, name, in use), that turns
+    the parent references of $FILE_NAME into full paths.
+
+    Paths are resolved iteratively and every directory path found on the way is cached, so
+    resolving all the records of an $MFT visits each record a constant number of times.
+
+    A record whose parent isn't in the index is an orphan; one whose parent reference has a
+    different sequence number than the parent record is a sequence mismatch: the directory was
+    deleted and its record reused. Both get paths under orphan_prefix. A deleted parent that
+    hasn't been reused yet (not in use, sequence one higher than the reference) is still followed.
+    """
+    # Windows long names are preferred over DOS 8.3 names, namespaces are POSIX (0), Win32 (1),
+    # DOS (2) and Win32 & DOS (3)
+    namespace_preference = {1: 0, 3: 0, 0: 1, 2: 2}
+
+    def __init__(self, root=5, separator=u"\\", orphan_prefix=u"$OrphanFiles"):
+        """
+        :param root: record number of the root directory (int)
+        :param separator: path separator (unicode)
+        :param orphan_prefix: first component of the paths of orphans and sequence mismatches
+            (unicode)
+        :var entries: [parent, parent sequence, sequence, name, in use, namespace] by record
+            number. (dict of lists)
+        """
+        self.root = root
+        self.separator = separator
+        self.orphan_prefix = orphan_prefix
+        self.entries = {}
+        self.paths = {}
+        self.orphans = set()
+        self.mismatches = set()
+
+    def Add(self, record):
+        """
+        Adds a record from MFTParser. Extension records only give their names to the base record,
+        its sequence number and in use flag come from the base record itself.
+
+        :param record: the record (MFTRecord)
+        """
+        number = record.number
+        sequence = record.sequence
+        in_use = bool(record.flags & 0x0001)
+        if record.base_record:
+            number = record.base_record
+            sequence = None
+        entry = self.entries.get(number)
+        if entry is None:
+            entry = self.entries[number] = [-1, -1, -1, None, in_use, 4]
+        if sequence is not None:
+            entry[2] = sequence
+            entry[4] = in_use
+        preference = self.namespace_preference
+        for file_name in record.file_names:
+            rank = preference.get(file_name.namespace, 3)
+            if rank < entry[5]:
+                entry[0:2] = [file_name.parent, file_name.parent_sequence]
+                entry[3] = file_name.name
+                entry[5] = rank
+        # anything resolved so far may go through this record
+        if self.paths:
+            self.paths = {}
+            self.orphans = set()
+            self.mismatches = set()
+
+    def AddRecords(self, records):
+        """
+        :param records: records from MFTParser.Records (iterable of MFTRecord)
+        :return: number of records added (int)
+        """
+        count = 0
+        for record in records:
+            self.Add(record)
+            count += 1
+        return count
+
+    def Merge(self, other):
+        """
+        Adds the entries of another index, built over a different range of records. Entries for
+        the same record are merged like Add does, so merging the indexes of consecutive ranges in
+        order gives the same index as adding all the records to one.
+
+        :param other: the index to merge (MFTPathIndex)
+        """
+        for number in sorted(other.entries):
+            theirs = other.entries[number]
+            entry = self.entries.get(number)
+            if entry is None:
+                self.entries[number] = list(theirs)
+                continue
+            if theirs[2] >= 0:
+                entry[2] = theirs[2]
+                entry[4] = theirs[4]
+            if theirs[5] < entry[5]:
+                entry[0:2] = theirs[0:2]
+                entry[3] = theirs[3]
+                entry[5] = theirs[5]
+        self.paths = {}
+        self.orphans = set()
+        self.mismatches = set()
+
+    def _ParentStatus(self, entry):
+        """
+        :param entry: the index entry of a record (list)
+        :return: 0 if the parent can be followed, 1 if it's missing, 2 if it was reused (int)
+        """
+        parent = self.entries.get(entry[0])
+        if parent is None or parent[2] < 0:
+            return 1
+        if parent[2] == entry[1] or (not parent[4] and parent[2] == entry[1] + 1):
+            return 0
+        return 2
+
+    def GetPath(self, number):
+        """
+        Returns the full path of a record, resolving and caching the paths of its ancestors.
+
+        :param number: record number (int)
+        :return: the path, or None for records without a name (unicode)
+        """
+        paths = self.paths
+        if number in paths:
+            return paths[number]
+        entries = self.entries
+        root = self.root
+        separator = self.separator
+        # walk up until a cached path, the root or a broken link
+        chain = []
+        seen = set()
+        current = number
+        base = None
+        while True:
+            if current == root:
+                base = u""
+                paths[root] = separator
+                break
+            if current in paths:
+                base = paths[current]
+                break
+            entry = entries.get(current)
+            if entry is None or entry[3] is None:
+                if not chain:
+                    return None
+                base = self.orphan_prefix
+                self.orphans.add(chain[-1])
+                break
+            if current in seen:
+                # a loop of parent references, cut it at the record that closed it
+                base = self.orphan_prefix
+                self.orphans.add(chain[-1])
+                break
+            seen.add(current)
+            chain.append(current)
+            status = self._ParentStatus(entry)
+            if status:
+                base = self.orphan_prefix
+                (self.orphans if status == 1 else self.mismatches).add(current)
+                break
+            current = entry[0]
+        # and down again, caching every path on the way
+        path = base
+        for current in reversed(chain):
+            path = path + separator + entries[current][3]
+            paths[current] = path
+        return paths[number]
+
+    def Resolve(self):
+        """
+        Resolves every record in the index.
+
+        :return: paths by record number, None for records without a name (dict)
+        """
+        for number in sorted(self.entries):
+            self.GetPath(number)
+        return dict((number, self.paths.get(number)) for number in self.entries)
@@ -14,10 +14,12 @@
 
 # coding=utf-8
 
-import datetime
+import array
 import struct
 
 from collections import namedtuple
+from FileTime import FileTime
+from LNKValidator import GUID
 from Validator import Validator
 
 
@@ -38,10 +40,19 @@ class NTFSFileRecordValidator(Validator):
         self.data = ""
         self.pos = 0
         self.details = {}
+        self.filetime = FileTime()
         # some structures to easy up everything later on
         self.st_long = struct.Struct("<H")
+        self.st_fixup = struct.Struct("<HH")
         self.st_header = struct.Struct("<4sHHQHHHHLLQHHL")
-        # self.st_att_header = struct.Struct("<")
+        self.st_att_header = struct.Struct("<LLBBHHH")
+        self.st_att_resident = struct.Struct("<LHBB")
+        self.st_att_nonresident = struct.Struct("<QQHH4sQQQ")
+        self.st_att_list_entry = struct.Struct("<LHBBQQH")
+        self.st_index_root = struct.Struct("<LLLB3s")
+        self.st_index_node = struct.Struct("<LLLB3s")
+        self.st_index_entry = struct.Struct("<QHHL")
+        self.st_ulonglong = struct.Struct("<Q")
         self.st_att_stdinfo = struct.Struct("<QQQQLLLLLLQQ")
         self.st_att_filename = struct.Struct("<QQQQQQQLLBB")
         self.nt_header = namedtuple("Header",
@@ -72,8 +83,15 @@ class NTFSFileRecordValidator(Validator):
         }
         self.attribute_parsers = {
             0x10: self._AttStdInfo,
+            0x20: self._AttAttributeList,
             0x30: self._AttFilename,
+            0x40: self._AttObjectID,
+            0x80: self._AttData,
+            0x90: self._AttIndexRoot,
         }
+        # data runs are kept in arrays of machine longs when they are 64 bits wide, cluster numbers
+        # don't fit in 32 bits on big volumes
+        self.run_typecode = "l" if array.array("l").itemsize >= 8 else "d"
 
     def _AttStdInfo(self, att):
         """
@@ -82,14 +100,16 @@ class NTFSFileRecordValidator(Validator):
         :param att: attribute data, without the header.
         :return: dictionary with the attribute data.
         """
-        values = self.nt_att_stdinfo._make(self.st_att_stdinfo.unpack(att[0:0x48]))
+        # NT 4 records only have the first 0x30 bytes
+        values = self.nt_att_stdinfo._make(
+            self.st_att_stdinfo.unpack(att[0:0x48].ljust(0x48, "\x00")))
         ret = {
             "TypeName": "$STANDARD_INFORMATION",
             "Parsed": True,
-            "CTime": self._MSTimestamp(values.ctime),
-            "ATime": self._MSTimestamp(values.atime),
-            "MTime": self._MSTimestamp(values.mtime),
-            "RTime": self._MSTimestamp(values.rtime),
+            "CTime": self.filetime.ToDatetime(values.ctime),
+            "ATime": self.filetime.ToDatetime(values.atime),
+            "MTime": self.filetime.ToDatetime(values.mtime),
+            "RTime": self.filetime.ToDatetime(values.rtime),
             "Permissions": {
                 "ReadOnly": bool(values.fileperm & 0x0001),
                 "Hidden": bool(values.fileperm & 0x0002),
@@ -122,19 +142,20 @@ class NTFSFileRecordValidator(Validator):
         :param att: attribute data, without the header.
         :return: dictionary with the attribute data.
         """
-        values = self.nt_att_filename._make(self.st_att_filename.unpack(att[0:0x42]))
+        values = self.nt_att_filename._make(
+            self.st_att_filename.unpack(att[0:0x42].ljust(0x42, "\x00")))
         filename = ""
         if values.filename_len > 0:
             count = values.filename_len * 2
-            filename = att[0x42:0x42 + count].decode("utf-16")
+            filename = att[0x42:0x42 + count].decode("utf-16-le", "replace")
         ret = {
             "TypeName": "$FILENAME",
             "Parsed": True,
             "ParentDirectory": values.parent_dir,
-            "CTime": self._MSTimestamp(values.ctime),
-            "ATime": self._MSTimestamp(values.atime),
-            "MTime": self._MSTimestamp(values.mtime),
-            "RTime": self._MSTimestamp(values.rtime),
+            "CTime": self.filetime.ToDatetime(values.ctime),
+            "ATime": self.filetime.ToDatetime(values.atime),
+            "MTime": self.filetime.ToDatetime(values.mtime),
+            "RTime": self.filetime.ToDatetime(values.rtime),
             "Flags": {
                 "ReadOnly": bool(values.flags & 0x0001),
                 "Hidden": bool(values.flags & 0x0002),
@@ -157,6 +178,281 @@ class NTFSFileRecordValidator(Validator):
         }
         return ret
 
+    def _AttHeader(self, att):
+        """
+        Parses the header of an attribute, common to all of them, plus the resident or
+        non-resident part. The data runs of non-resident attributes are decoded.
+
+        :param att: attribute data, with the header.
+        :return: dictionary with the header data.
+        """
+        att_type, length, non_resident, name_len, name_offset, flags, att_id = \
+            self.st_att_header.unpack_from(att, 0)
+        name = u""
+        if name_len:
+            name = att[name_offset: name_offset + 2 * name_len].decode("utf-16-le", "replace")
+        ret = {
+            "Type": att_type,
+            "Length": length,
+            "NonResident": bool(non_resident),
+            "Name": name,
+            "Flags": {
+                "Compressed": bool(flags & 0x0001),
+                "Encrypted": bool(flags & 0x4000),
+                "Sparse": bool(flags & 0x8000),
+            },
+            "AttributeID": att_id,
+        }
+        if not non_resident and len(att) >= 24:
+            content_len, content_offset, indexed, padding = \
+                self.st_att_resident.unpack_from(att, 16)
+            ret.update({
+                "ContentLength": content_len,
+                "ContentOffset": content_offset,
+                "Indexed": bool(indexed),
+            })
+        elif non_resident and len(att) >= 64:
+            start_vcn, last_vcn, runs_offset, compression_unit, padding, size_alloc, size_real, \
+                size_init = self.st_att_nonresident.unpack_from(att, 16)
+            ret.update({
+                "StartVCN": start_vcn,
+                "LastVCN": last_vcn,
+                "CompressionUnit": compression_unit,
+                "AllocatedSize": size_alloc,
+                "RealSize": size_real,
+                "InitializedSize": size_init,
+                "DataRuns": self.DecodeDataRuns(att, runs_offset),
+            })
+        return ret
+
+    def DecodeDataRuns(self, data, pos=0):
+        """
+        Decodes a data run list. Each run starts with a byte whose low nibble is the size of the
+        run length and the high nibble the size of the run offset, a signed cluster delta from the
+        previous run. Runs without an offset are sparse. The list ends with a 0 byte, or when a run
+        doesn't fit in the data.
+
+        :param data: buffer with the run list (string)
+        :param pos: offset of the run list in the buffer (int)
+        :return: starting clusters, -1 for sparse runs, and lengths in clusters of the runs (tuple
+            of two arrays)
+        """
+        lcns = array.array(self.run_typecode)
+        lengths = array.array(self.run_typecode)
+        end = len(data)
+        lcn = 0
+        while pos < end:
+            header = ord(data[pos])
+            length_size = header & 0x0f
+            offset_size = header >> 4
+            if not header or not length_size or length_size > 8 or offset_size > 8 or \
+                    pos + 1 + length_size + offset_size > end:
+                break
+            pos += 1
+            length = int(data[pos: pos + length_size][::-1].encode("hex"), 16)
+            pos += length_size
+            if offset_size:
+                delta = int(data[pos: pos + offset_size][::-1].encode("hex"), 16)
+                if delta >> (offset_size * 8 - 1):
+                    delta -= 1 << (offset_size * 8)
+                lcn += delta
+                pos += offset_size
+                lcns.append(lcn)
+            else:
+                lcns.append(-1)
+            lengths.append(length)
+        return lcns, lengths
+
+    def RunExtents(self, runs, cluster_size, size=None):
+        """
+        Turns decoded data runs into byte extents, so the content of a non-resident attribute can
+        be read straight from a volume image.
+
+        :param runs: starting clusters and lengths, as returned by DecodeDataRuns (tuple)
+        :param cluster_size: bytes per cluster (int)
+        :param size: real size of the attribute, extents are cut at it (int)
+        :return: generator of (offset in the volume or None for sparse runs, length) tuples
+        """
+        remaining = size
+        for lcn, length in zip(*runs):
+            length = int(length) * cluster_size
+            if remaining is not None:
+                if remaining <= 0:
+                    break
+                length = min(length, remaining)
+                remaining -= length
+            yield (None if lcn < 0 else int(lcn) * cluster_size), length
+
+    def _AttAttributeList(self, att):
+        """
+        Parses an $ATTRIBUTE_LIST attribute, the attributes of a file that are spread over more
+        than one FILE record.
+
+        :param att: attribute data, without the header.
+        :return: dictionary with the attribute data.
+        """
+        entries = []
+        pos = 0
+        while pos + self.st_att_list_entry.size <= len(att):
+            att_type, length, name_len, name_offset, start_vcn, reference, att_id = \
+                self.st_att_list_entry.unpack_from(att, pos)
+            if length < self.st_att_list_entry.size:
+                break
+            name = u""
+            if name_len:
+                name = att[pos + name_offset: pos + name_offset + 2 * name_len].decode(
+                    "utf-16-le", "replace")
+            entries.append({
+                "Type": att_type,
+                "Name": name,
+                "StartVCN": start_vcn,
+                "Record": reference & 0xffffffffffff,
+                "RecordSequence": reference >> 48,
+                "AttributeID": att_id,
+            })
+            pos += length
+        return {
+            "TypeName": "$ATTRIBUTE_LIST",
+            "Parsed": True,
+            "Entries": entries,
+        }
+
+    def _AttObjectID(self, att):
+        """
+        Parses an $OBJECT_ID attribute, the object ID and the optional birth volume, birth object
+        and domain IDs, as used by the link tracking service.
+
+        :param att: attribute data, without the header.
+        :return: dictionary with the attribute data.
+        """
+        ret = {
+            "TypeName": "$OBJECT_ID",
+            "Parsed": True,
+        }
+        names = ["ObjectID", "BirthVolumeID", "BirthObjectID", "DomainID"]
+        for x, name in enumerate(names):
+            value = att[16 * x: 16 * x + 16]
+            ret[name] = "%r" % GUID(value) if len(value) == 16 else None
+        return ret
+
+    def _AttData(self, att):
+        """
+        Parses a resident $DATA attribute. The stream name is in the attribute header, named
+        streams are alternate data streams.
+
+        :param att: attribute data, without the header.
+        :return: dictionary with the attribute data.
+        """
+        return {
+            "TypeName": "$DATA",
+            "Parsed": True,
+            "Size": len(att),
+        }
+
+    def _IndexEntry(self, data, pos, indexed_type):
+        """
+        Parses an index entry.
+
+        :param data: buffer with the entry (string)
+        :param pos: offset of the entry (int)
+        :param indexed_type: type of the indexed attribute, the keys of $FILE_NAME (0x30) indexes
+            are parsed (int)
+        :return: dictionary with the entry
+        """
+        size = self.st_index_entry.size
+        reference, length, content_len, flags = self.st_index_entry.unpack_from(data, pos)
+        entry = {
+            "FileReference": reference & 0xffffffffffff,
+            "SequenceNumber": reference >> 48,
+            "HasSubnode": bool(flags & 0x01),
+            "Last": bool(flags & 0x02),
+        }
+        if flags & 0x01 and length >= size + 8:
+            entry["SubnodeVCN"], = self.st_ulonglong.unpack_from(data, pos + length - 8)
+        if not flags & 0x02 and indexed_type == 0x30 and content_len >= 0x42 and \
+                size + content_len <= length:
+            entry["FileName"] = self._AttFilename(data[pos + size: pos + size + content_len])
+        return entry
+
+    def _IndexEntries(self, data, pos, end, indexed_type):
+        """
+        Walks the entries of an index node, in an $INDEX_ROOT attribute or an INDX record.
+
+        :param data: buffer with the node (string)
+        :param pos: offset of the first entry (int)
+        :param end: end of the entries (int)
+        :param indexed_type: type of the indexed attribute, the keys of $FILE_NAME (0x30) indexes
+            are parsed (int)
+        :return: list of dictionaries with the entries
+        """
+        entries = []
+        size = self.st_index_entry.size
+        end = min(end, len(data))
+        while pos + size <= end:
+            reference, length, content_len, flags = self.st_index_entry.unpack_from(data, pos)
+            if length < size or pos + length > end:
+                break
+            entries.append(self._IndexEntry(data, pos, indexed_type))
+            pos += length
+            if flags & 0x02:
+                break
+        return entries
+
+    def _AttIndexRoot(self, att):
+        """
+        Parses an $INDEX_ROOT attribute, the root node of a directory (or other) index.
+
+        :param att: attribute data, without the header.
+        :return: dictionary with the attribute data.
+        """
+        ret = {
+            "TypeName": "$INDEX_ROOT",
+            "Parsed": True,
+            "Entries": [],
+        }
+        if len(att) < self.st_index_root.size + self.st_index_node.size:
+            return ret
+        indexed_type, collation, record_size, clusters, padding = \
+            self.st_index_root.unpack_from(att, 0)
+        node = self.st_index_root.size
+        entries_offset, entries_size, entries_alloc, flags, padding = \
+            self.st_index_node.unpack_from(att, node)
+        ret.update({
+            "IndexedType": indexed_type,
+            "CollationRule": collation,
+            "IndexRecordSize": record_size,
+            "ClustersPerIndexRecord": clusters,
+            "LargeIndex": bool(flags & 0x01),
+            "Entries": self._IndexEntries(att, node + entries_offset, node + entries_size,
+                                          indexed_type),
+        })
+        return ret
+
+    def _ApplyFixups(self, buff, size):
+        """
+        Applies the update sequence array fixups to a record, in place. NTFS replaces the last two
+        bytes of every sector with the update sequence number when the record is written, and keeps
+        the original bytes in the array, so a record must be fixed up before its attributes can be
+        read.
+
+        :param buff: the record (bytearray)
+        :param size: record size (int)
+        :return: True if every sector ended with the update sequence number, False for torn or
+            corrupt records (bool)
+        """
+        usa_offset, usa_count = self.st_fixup.unpack_from(buff, 4)
+        if usa_count < 2 or usa_offset + usa_count * 2 > size or size % (usa_count - 1):
+            return False
+        stride = size / (usa_count - 1)
+        usn = buff[usa_offset: usa_offset + 2]
+        ok = True
+        for x in xrange(1, usa_count):
+            end = x * stride
+            if buff[end - 2: end] != usn:
+                ok = False
+            buff[end - 2: end] = buff[usa_offset + 2 * x: usa_offset + 2 * x + 2]
+        return ok
+
     def _Read(self, length):
         ret = self.data[self.pos: self.pos + length]
         if len(ret) < length:
@@ -177,27 +473,6 @@ class NTFSFileRecordValidator(Validator):
             "extensions": [".filerecord"],
         }
 
-    def _MSTimestamp(self, timestamp):
-        """
-        Converts a MS Timestamp into a datetime object.
-        :param timestamp: 64 bit MS timestap (string)
-        :return:
-        """
-        # tics, = struct.unpack("<Q", timestamp)
-        tics = timestamp
-        days = tics / 864000000000
-        rem = tics - days * 864000000000
-        hours = rem / 36000000000
-        rem -= hours * 36000000000
-        minutes = rem / 600000000
-        rem -= minutes * 600000000
-        seconds = rem / 10000000
-        rem -= seconds * 10000000
-        microseconds = rem / 100
-        td = datetime.timedelta(days)  # this way its easier to handle leap years
-        date = datetime.datetime(1601, 1, 1, hours, minutes, seconds, microseconds) + td
-        return date
-
     def Validate(self, fd):
         """
         Validates a file-like object to determine if its a valid NTFS FILE Record (from the MFT).
@@ -223,6 +498,10 @@ class NTFSFileRecordValidator(Validator):
         # calling of
         ############################################################################################
         data = self.data
+        if len(data) < 48:
+            self.eof = True
+            self.is_valid = False
+            return False
         ############################################################################################
         # Parse the record header.
         # Parse the Attributes header
@@ -239,7 +518,18 @@ class NTFSFileRecordValidator(Validator):
             header["offset_attribute"] < 1016
         if not self.is_valid:
             return False
+        # fixups go over a copy of the record, the attributes are parsed from it
+        size = header["size_alloc"] if header["size_alloc"] in (1024, 4096) else 1024
+        buff = bytearray(data[:size])
+        self.details["FixupsOK"] = self._ApplyFixups(buff, len(buff))
+        self.is_valid = self.details["FixupsOK"] and len(buff) == size
+        if not self.is_valid:
+            self.eof = len(buff) < size
+            return False
+        data = str(buff)
         self.details["Attributes"] = []
+        # names of the $DATA attributes, u"" for the unnamed one, the rest are alternate streams
+        self.details["Streams"] = []
         attlist = self.details["Attributes"]
         pos = header["offset_attribute"]
         att_type, att_len = struct.unpack("<LL", data[pos: pos + 8])
@@ -248,23 +538,22 @@ class NTFSFileRecordValidator(Validator):
             #      (att_type, att_len, struct.unpack("<L", data[pos + 0x10: pos + 0x14]),
             #      bool(struct.unpack("<B", data[pos + 0x08])[0]))
             att_data = data[pos: pos + att_len]
-            resident = att_data[0x08] == "\x00"
-            if resident and att_type in self.attribute_parsers:
-                att_offset, = self.st_long.unpack(att_data[0x14:0x16])
-                parser = self.attribute_parsers[att_type]
-                att = parser(att_data[att_offset:])
+            if len(att_data) < 16:
+                break
+            att = self._AttHeader(att_data)
+            if not att["NonResident"] and att_type in self.attribute_parsers:
+                start = att.get("ContentOffset", 0)
+                content = att_data[start: start + att.get("ContentLength", 0)]
+                att.update(self.attribute_parsers[att_type](content))
             else:
-                att = self.attribute_types[att_type]
-            att.update({"Type": att_type})
+                att.update(self.attribute_types[att_type])
+            if att_type == 0x80:
+                self.details["Streams"].append(att["Name"])
             attlist.append(att)
-            # here we have to add the attribute header and attribute structures parsing code
-            # for now, we just add the name of the attribute so we can test the code and see if
-            # we're parsing the attribute list correctly.
             pos += att_len
-            if pos > 1016:
+            if pos > size - 8:
                 break  # gotta decide whether this is bad behaviour
             att_type, att_len = struct.unpack("<LL", data[pos: pos + 8])
             # print "Next: (%d, %d)" % (att_type, att_len)
-        if self.is_valid:
-            self.bytes_last_valid = 1024
+        self._SetValidBytes(size)
         return self.is_valid  # still working on the proper algorithm
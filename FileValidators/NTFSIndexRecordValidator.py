@@ -0,0 +1,221 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import re
+import struct
+
+from NTFSFileRecordValidator import NTFSFileRecordValidator
+
+
+class NTFSIndexRecordValidator(NTFSFileRecordValidator):
+    """
+    Class that validates an object to determine if it is a valid NTFS INDX record, a node of the
+    $INDEX_ALLOCATION of an index, usually a directory ($I30).
+
+    Validate only applies the fixups and walks the entries by their lengths, and looks for the
+    $FILE_NAME entries of deleted files in the slack space, between the used and allocated size of
+    the node. The details are built the first time GetDetails is called.
+    """
+
+    def __init__(self):
+        """
+        Calls NTFSFileRecordValidator.__init__() and sets some internal attributes for the
+        validation process.
+
+        :var st_indx_header: INDX record header, up to the index node header. (struct.Struct)
+        :var st_slack_filename: the fields of a $FILE_NAME that are checked on slack candidates:
+            parent reference, creation time, name length and namespace. (struct.Struct)
+        """
+        super(NTFSIndexRecordValidator, self).__init__()
+        self.st_indx_header = struct.Struct("<4sHHQQLLLB3s")
+        self.st_slack_filename = struct.Struct("<QQ48xBB")
+        # slack entries must have a creation time between 1980-01-01 and 2100-01-01
+        self.slack_min_ticks = 119600064000000000
+        self.slack_max_ticks = 157469184000000000
+        # and so the most significant byte of that creation time is 1 or 2
+        self.re_slack_marks = re.compile("[\x01\x02]")
+        self._Cleanup()
+
+    def _Cleanup(self):
+        """
+        Cleans up all the internal attributes that are set by the Validate method when a file is
+        analyzed.
+        """
+        self.is_valid = False
+        self.eof = False
+        self.end = False
+        self.bytes_last_valid = 0
+        self.data = ""
+        self.record = ""
+        self.header = None
+        self.fixups_ok = False
+        self.entries = []
+        self.slack_entries = []
+        self.details = None
+
+    def _WalkEntries(self, pos, end):
+        """
+        Walks the entries of the node, up to the last entry.
+
+        :param pos: offset of the first entry (int)
+        :param end: end of the used part of the node (int)
+        :return: True if the walk reached the last entry inside the used part (bool)
+        """
+        record = self.record
+        st_index_entry = self.st_index_entry
+        size = st_index_entry.size
+        while pos + size <= end:
+            reference, length, content_len, flags = st_index_entry.unpack_from(record, pos)
+            if length < size or length % 8 or pos + length > end or size + content_len > length:
+                return False
+            self.entries.append(pos)
+            pos += length
+            if flags & 0x02:
+                return True
+        return False
+
+    def _SlackEntry(self, pos, end):
+        """
+        Checks if there's a deleted $FILE_NAME entry at an offset of the slack space. Entry lengths
+        must be consistent with the name length, and the name namespace and creation time must make
+        sense.
+
+        :param pos: offset of the candidate (int)
+        :param end: end of the slack space (int)
+        :return: length of the entry, 0 if there's none (int)
+        """
+        record = self.record
+        size = self.st_index_entry.size
+        if pos + size + 0x42 > end:
+            return 0
+        reference, length, content_len, flags = self.st_index_entry.unpack_from(record, pos)
+        if content_len < 0x44 or length % 8 or length < size + content_len or \
+                length > size + content_len + 16 or pos + size + content_len > end:
+            return 0
+        parent, ctime, name_len, namespace = self.st_slack_filename.unpack_from(record, pos + size)
+        if content_len != 0x42 + 2 * name_len or namespace > 3 or \
+                not self.slack_min_ticks <= ctime < self.slack_max_ticks:
+            return 0
+        return length
+
+    def _WalkSlack(self, pos, end):
+        """
+        Looks for deleted entries in the slack space, at every 8 byte boundary. Entries found are
+        skipped as a whole.
+
+        Only the boundaries where the last byte of the $FILE_NAME creation time would be 1 or 2 are
+        checked: those bytes are taken with a single extended slice and searched with a regular
+        expression, so slack full of zeros or old data costs almost nothing.
+
+        :param pos: start of the slack space (int)
+        :param end: end of the slack space (int)
+        """
+        # the creation time ends 32 bytes into the entry
+        marks = self.record[pos + 31: end: 8]
+        next_pos = pos
+        for match in self.re_slack_marks.finditer(marks):
+            candidate = pos + 8 * match.start()
+            if candidate < next_pos:
+                continue
+            length = self._SlackEntry(candidate, end)
+            if length:
+                self.slack_entries.append(candidate)
+                next_pos = candidate + length
+
+    def _BuildDetails(self):
+        """
+        Builds the details dictionary from the positions found by Validate.
+        """
+        self.details = {
+            "extensions": [".indx"],
+        }
+        if self.header is None:
+            return
+        magic, usa_offset, usa_count, lsn, vcn, entries_offset, used, allocated, flags, padding = \
+            self.header
+        self.details["Header"] = {
+            "magic": magic,
+            "offset_update": usa_offset,
+            "size_update": usa_count,
+            "lsn": lsn,
+            "vcn": vcn,
+            "offset_entries": entries_offset,
+            "size_used": used,
+            "size_alloc": allocated,
+            "flags": {
+                "HasChildren": bool(flags & 0x01),
+            },
+        }
+        self.details["FixupsOK"] = self.fixups_ok
+        self.details["Entries"] = []
+        self.details["SlackEntries"] = []
+        for key, positions in (("Entries", self.entries), ("SlackEntries", self.slack_entries)):
+            for pos in positions:
+                entry = self._IndexEntry(self.record, pos, 0x30)
+                entry["Offset"] = pos
+                self.details[key].append(entry)
+
+    def GetDetails(self):
+        """
+        Returns dictionary with important information from the recently-validated file.
+
+        :return: dictionary {}
+        """
+        if self.details is None:
+            self._BuildDetails()
+        return self.details
+
+    def Validate(self, fd):
+        """
+        Validates a file-like object to determine if its a valid NTFS INDX record.
+
+        :param fd: file-like object open for binary reading (file-like)
+        :return: True on a valid INDX record, False otherwise (bool)
+        """
+        self._Cleanup()
+        if type(fd) == file:
+            self.data = fd.read()
+        elif type(fd) == str:
+            self.data = fd
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        data = self.data
+        if len(data) < self.st_indx_header.size:
+            self.eof = True
+            return False
+        header = self.st_indx_header.unpack_from(data, 0)
+        magic, usa_offset, usa_count, lsn, vcn, entries_offset, used, allocated, flags, padding = \
+            header
+        # the node header starts at 0x18, its offsets are relative to it
+        size = 0x18 + allocated
+        if magic != "INDX" or size % 512 or usa_offset < 0x28 or \
+                usa_offset + 2 * usa_count > 0x18 + entries_offset or entries_offset > used or \
+                used > allocated:
+            return False
+        self.header = header
+        if len(data) < size:
+            self.eof = True
+            return False
+        buff = bytearray(data[:size])
+        self.fixups_ok = self._ApplyFixups(buff, size)
+        if not self.fixups_ok:
+            return False
+        self.record = str(buff)
+        self.is_valid = self._WalkEntries(0x18 + entries_offset, 0x18 + used)
+        if self.is_valid:
+            self._WalkSlack(0x18 + ((used + 7) & ~7), size)
+            self._SetValidBytes(size)
+            self.end = True
+        return self.is_valid
@@ -0,0 +1,239 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import mmap
+import struct
+
+from NTFSFileRecordValidator import NTFSFileRecordValidator
+from Validator import Validator
+
+
+class NTFSLogFileValidator(Validator):
+    """
+    Class that validates an object to determine if it is a valid NTFS $LogFile.
+
+    The $LogFile starts with two restart pages (RSTR, or CHKD after a chkdsk), followed by the
+    logging area: two buffer pages and then the circular log of record pages (RCRD). Pages that
+    were never written are filled with 0xff. Every page is protected by update sequence fixups.
+
+    Record pages are checked at page stride straight from the (memory mapped) data: signature,
+    header values and a consistent update sequence array, without copying them. Their LSNs must
+    grow from page to page, except once, where the circular log wraps around.
+    """
+
+    def __init__(self):
+        """
+        Calls Validator.__init__() and sets some internal attributes for the validation process.
+
+        :var st_restart_page: restart page header. (struct.Struct)
+        :var st_restart_area: restart area, at the restart offset of the restart page.
+            (struct.Struct)
+        :var st_record_page: record page header. (struct.Struct)
+        """
+        super(NTFSLogFileValidator, self).__init__()
+        self.record_validator = NTFSFileRecordValidator()
+        self.st_restart_page = struct.Struct("<4sHHQLLHhh")
+        self.st_restart_area = struct.Struct("<QHHHHLHHQLHHL")
+        self.st_record_page = struct.Struct("<4sHHQLHHH6sQ")
+        self.buffer_pages = 2  # pages between the restart pages and the circular log
+        self.data = ""
+        self._CleanDetails()
+        self._Cleanup()
+
+    def _Cleanup(self):
+        """
+        Cleans up all the internal attributes that are set by the Validate method when a file is
+        analyzed.
+        """
+        self.is_valid = False
+        self.bytes_last_valid = 0
+        self.eof = False
+        self.end = False
+        if type(self.data) == mmap.mmap:
+            self.data.close()
+        self.data = ""
+
+    def _CleanDetails(self):
+        self.details = {
+            "extensions": [".logfile"],
+        }
+
+    def _CheckFixups(self, offset, size):
+        """
+        Checks, without applying them, that every sector of a page ends with the update sequence
+        number.
+
+        :param offset: offset of the page (int)
+        :param size: page size (int)
+        :return: True if the update sequence array is consistent (bool)
+        """
+        data = self.data
+        usa_offset, usa_count = self.record_validator.st_fixup.unpack_from(data, offset + 4)
+        if usa_count < 2 or usa_offset + 2 * usa_count > size or size % (usa_count - 1):
+            return False
+        stride = size / (usa_count - 1)
+        usn = data[offset + usa_offset: offset + usa_offset + 2]
+        for end in xrange(offset + stride, offset + size + 1, stride):
+            if data[end - 2: end] != usn:
+                return False
+        return True
+
+    def _ValidateRestartPage(self, offset):
+        """
+        Validates a restart page and parses its restart area.
+
+        :param offset: offset of the page (int)
+        :return: dictionary with the page data, or None if it's not valid
+        """
+        data = self.data
+        if offset + self.st_restart_page.size > len(data):
+            self.eof = True
+            return None
+        magic, usa_offset, usa_count, chkdsk_lsn, system_page_size, log_page_size, \
+            restart_offset, minor, major = self.st_restart_page.unpack_from(data, offset)
+        if magic not in ("RSTR", "CHKD") or not 512 <= system_page_size <= 65536 or \
+                system_page_size & (system_page_size - 1) or not 512 <= log_page_size <= 65536 or \
+                log_page_size & (log_page_size - 1) or \
+                restart_offset + self.st_restart_area.size > system_page_size:
+            return None
+        if offset + system_page_size > len(data):
+            self.eof = True
+            return None
+        buff = bytearray(data[offset: offset + system_page_size])
+        if not self.record_validator._ApplyFixups(buff, system_page_size):
+            return None
+        current_lsn, log_clients, client_free_list, client_in_use_list, flags, seq_number_bits, \
+            area_length, client_array_offset, file_size, last_lsn_data_length, \
+            record_header_length, page_data_offset, open_count = \
+            self.st_restart_area.unpack_from(buff, restart_offset)
+        return {
+            "Offset": offset,
+            "magic": magic,
+            "chkdsk_lsn": chkdsk_lsn,
+            "system_page_size": system_page_size,
+            "log_page_size": log_page_size,
+            "version": (major, minor),
+            "current_lsn": current_lsn,
+            "log_clients": log_clients,
+            "flags": {
+                "CleanDismount": bool(flags & 0x0002),
+            },
+            "seq_number_bits": seq_number_bits,
+            "file_size": file_size,
+            "record_header_length": record_header_length,
+            "page_data_offset": page_data_offset,
+        }
+
+    def _ValidateRecordPages(self, offset, page_size):
+        """
+        Walks the logging area at page stride, up to the first page that isn't consistent.
+
+        :param offset: offset of the first page of the logging area (int)
+        :param page_size: log page size (int)
+        """
+        data = self.data
+        data_len = len(data)
+        st_record_page = self.st_record_page
+        empty = "\xff\xff\xff\xff"
+        circular_start = offset + self.buffer_pages * page_size
+        last_lsn = -1
+        wraps = 0
+        record_pages = 0
+        empty_pages = 0
+        while offset + page_size <= data_len:
+            magic = data[offset: offset + 4]
+            if magic == empty:
+                empty_pages += 1
+            elif magic == "RCRD":
+                magic, usa_offset, usa_count, lsn, flags, page_count, page_position, \
+                    next_record_offset, reserved, last_end_lsn = \
+                    st_record_page.unpack_from(data, offset)
+                if next_record_offset > page_size or not self._CheckFixups(offset, page_size):
+                    break
+                if offset >= circular_start:
+                    if lsn < last_lsn:
+                        # the circular log wraps around only once
+                        wraps += 1
+                        if wraps > 1:
+                            break
+                    last_lsn = lsn
+                record_pages += 1
+            else:
+                break
+            offset += page_size
+            self._SetValidBytes(offset)
+        else:
+            self.eof = offset < data_len
+        self.details.update({
+            "RecordPages": record_pages,
+            "EmptyPages": empty_pages,
+            "LastLSN": last_lsn,
+            "LSNWraps": wraps,
+        })
+        if offset + page_size <= data_len:
+            self.details["BadPage"] = offset
+            self.is_valid = False
+
+    def GetDetails(self):
+        """
+        Returns dictionary with important information from the recently-validated file.
+
+        :return: dictionary {}
+        """
+        return self.details
+
+    def Validate(self, fd):
+        """
+        Validates a file-like object to determine if its a valid NTFS $LogFile. Files are memory
+        mapped, and unmapped before returning.
+
+        :param fd: file-like object open for binary reading (file-like)
+        :return: True on a valid $LogFile, False otherwise (bool)
+        """
+        self._Cleanup()
+        self._CleanDetails()
+        if type(fd) == file:
+            fd.seek(0, 2)
+            if fd.tell():
+                self.data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        elif type(fd) == str:
+            self.data = fd
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        try:
+            self._ValidateData()
+        finally:
+            # the details are all built, the map isn't needed past this point
+            if type(self.data) == mmap.mmap:
+                self.data.close()
+            self.data = ""
+        return self.is_valid
+
+    def _ValidateData(self):
+        """
+        Validates the $LogFile in self.data, which Validate has already set.
+        """
+        first = self._ValidateRestartPage(0)
+        if first is None:
+            return
+        second = self._ValidateRestartPage(first["system_page_size"])
+        if second is None:
+            return
+        self.details["RestartPages"] = [first, second]
+        self.details["PageSize"] = first["log_page_size"]
+        self.is_valid = True
+        self._SetValidBytes(2 * first["system_page_size"])
+        self._ValidateRecordPages(2 * first["system_page_size"], first["log_page_size"])
+        self.end = self.is_valid and not self.eof
@@ -0,0 +1,148 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import struct
+
+from Validator import Validator
+
+
+class SQLiteJournalValidator(Validator):
+    """
+    Class that validates an object to determine if it is a valid SQLite 3 rollback journal
+    (-journal) file.
+    """
+
+    def __init__(self):
+        """
+        Calls Validator.__init__() and sets some internal attributes for the validation process.
+
+        :var st_header: journal header without the padding up to the sector size. (struct.Struct)
+        """
+        super(SQLiteJournalValidator, self).__init__()
+        self.magic = "\xd9\xd5\x05\xf9\x20\xa1\x63\xd7"
+        self.st_header = struct.Struct(">8sLLLLL")
+        self.st_ulong = struct.Struct(">L")
+        self.data = ""
+        self._Cleanup()
+
+    def _Cleanup(self):
+        """
+        Cleans up all the internal attributes that are set by the Validate method when a file is
+        analyzed.
+        """
+        self.is_valid = False
+        self.bytes_last_valid = 0
+        self.eof = False
+        self.end = False
+        self.page_size = -1
+        self.sector_size = -1
+        self.database_size = -1
+        self.segments = []
+        self.records = 0
+        self.data = ""
+
+    def _ValidateSegment(self, offset):
+        """
+        Validates a journal header and the page records that follow it.
+
+        :param offset: offset of the journal header, a multiple of the sector size (int)
+        :return: offset of the next journal header, or -1 if the walk must stop (int)
+        """
+        data = self.data
+        magic, record_count, nonce, db_size, sector_size, page_size = \
+            self.st_header.unpack_from(data, offset)
+        valid_header = (
+            magic == self.magic and
+            32 <= sector_size <= 65536 and sector_size & (sector_size - 1) == 0 and
+            512 <= page_size <= 65536 and page_size & (page_size - 1) == 0
+        )
+        if self.segments:
+            # every segment of a journal shares the page and sector sizes of the first one
+            valid_header = valid_header and (sector_size, page_size) == \
+                (self.sector_size, self.page_size)
+        if not valid_header:
+            return -1
+        self.is_valid = True
+        self.sector_size = sector_size
+        self.page_size = page_size
+        if not self.segments:
+            self.database_size = db_size
+        record_size = page_size + 8
+        offset += sector_size
+        if record_count == 0xffffffff or (record_count == 0 and not self.segments):
+            # the count was never written (or wasn't synced yet), the records go up to the end of
+            # the file and only the ones with a valid checksum will be counted
+            record_count = (len(data) - offset) / record_size
+        self.segments.append((offset - sector_size, record_count, nonce, db_size))
+        for x in xrange(record_count):
+            if offset + record_size > len(data):
+                self.eof = True
+                return -1
+            page_num, = self.st_ulong.unpack_from(data, offset)
+            checksum, = self.st_ulong.unpack_from(data, offset + 4 + page_size)
+            # the checksum is the nonce plus every 200th byte of the page, counted from the end
+            page = data[offset + 4: offset + 4 + page_size]
+            sampled = bytearray(page[page_size - 200: 0: -200])
+            if page_num == 0 or (nonce + sum(sampled)) & 0xffffffff != checksum:
+                return -1
+            offset += record_size
+            self.records += 1
+            self._SetValidBytes(offset)
+        # the next header, if any, starts at the next sector boundary
+        return ((offset + sector_size - 1) / sector_size) * sector_size
+
+    def GetDetails(self):
+        """
+        Returns a dictionary with detailed information about the last validated file.
+
+        :return: dict of:
+            * page_size (int)
+            * sector_size (int)
+            * database_size (int) -- size in pages of the database before the transaction
+            * segments (list of tuples of (offset, record count, nonce, database size))
+            * records (int) -- page records with a valid checksum
+        """
+        return {
+            'page_size': self.page_size,
+            'sector_size': self.sector_size,
+            'database_size': self.database_size,
+            'segments': self.segments,
+            'records': self.records,
+            'extensions': ['.sqlite-journal'],
+        }
+
+    def Validate(self, fd):
+        """
+        Validates a file-like object to determine if its a valid SQLite 3 rollback journal.
+
+        :param fd: file descriptor (file-like)
+        :return: True on valid journal, False otherwise (bool)
+        """
+        self._Cleanup()
+        if type(fd) == file:
+            self.data = fd.read()
+        elif type(fd) == str:
+            self.data = fd
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        offset = 0
+        while offset + self.st_header.size <= len(self.data):
+            offset = self._ValidateSegment(offset)
+            if offset < 0:
+                break
+        if not self.bytes_last_valid:
+            self._SetValidBytes(self.sector_size)
+        self.end = self.is_valid and not self.eof
+        return self.is_valid
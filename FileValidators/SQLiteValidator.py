@@ -13,29 +13,113 @@
 # write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 
 # coding=utf-8
-import array
+import mmap
+import multiprocessing
+import os
+import struct
 
+from collections import namedtuple
 from Validator import Validator
 
 
+_st_page_type = struct.Struct(">B7xL")
+_st_ulong = struct.Struct(">L")
+_worker_maps = {}
+
+
+def _CheckPages(data, page_types, first_page, page_size, page_count):
+    """
+    Checks a range of pages, which have to be either b-tree pages or cell payload overflow pages
+    (CPOP) unless page_types says otherwise. Pages don't depend on each other for this check, so
+    any range can be checked on its own.
+
+    This is a function and not a SQLiteValidator method so it can be sent to worker processes.
+
+    :param data: the whole database (string or mmap)
+    :param page_types: one byte for each page of the range, non-zero for ptrMap, freelist trunk
+        and freelist leaf pages, which aren't checked (bytearray)
+    :param first_page: page number of the first page of the range (int)
+    :param page_size: size of the pages (int)
+    :param page_count: page count of the database (int)
+    :return: the page number of the first invalid page, or 0 if all of them are valid (int)
+    """
+    offset = (first_page - 1) * page_size
+    for page_num, page_type in enumerate(page_types, first_page):
+        if not page_type:
+            # it's either a B-tree page or a CPOP, first we test for a B-tree page
+            flag, right_child = _st_page_type.unpack_from(data, offset)
+            if flag in (2, 5):
+                valid_page = right_child <= page_count
+            else:
+                valid_page = flag in (10, 13)
+            if not valid_page:
+                # ok, does it look like a CPOP?
+                valid_page = _st_ulong.unpack_from(data, offset)[0] <= page_count
+            if not valid_page:
+                return page_num
+        offset += page_size
+    return 0
+
+
+def _CheckPagesWorker(args):
+    """
+    Worker process side of _CheckPages: maps the database file once per process and checks the
+    range of pages it gets.
+
+    :param args: tuple of (path, page_types, first_page, page_size, page_count)
+    :return: same as _CheckPages
+    """
+    path, page_types, first_page, page_size, page_count = args
+    if path not in _worker_maps:
+        _worker_maps.clear()
+        fd = open(path, "rb")
+        _worker_maps[path] = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        fd.close()
+    return _CheckPages(_worker_maps[path], page_types, first_page, page_size, page_count)
+
+
 class SQLiteValidator(Validator):
     """
     Class that validates an object to determine if it is a valid SQLite 3 file.
     """
-    def __init__(self):
+    def __init__(self, structural=False, workers=1):
         """
         Calls Validator.__init__() and sets some internal attributes for the validation process.
+
+        :param structural: when True, Validate() also walks every b-tree starting from the schema
+            table in page 1, checking cells, payload sizes and overflow chains, and reports the
+            pages that no structure references. Slower, but it catches corruption that the page
+            by page walk cannot see. (bool)
+        :param workers: number of processes used to check the pages of big databases. Only files
+            on disk are checked in parallel, workers map the file instead of receiving its data.
+            The results are the same as with a single process. (int)
         """
         super(SQLiteValidator, self).__init__()
+        self.structural = structural
+        self.workers = workers
+        self.parallel_min_pages = 1 << 16  # starting the worker processes costs more than checking
+        # a small DB, so only DBs with at least this many pages are split among them.
+        self.max_page_visits = 1 << 22  # every chain the validator follows (ptrMap, freelist,
+        # b-trees, overflow pages) is bounded by the page count and checked for cycles, but a
+        # corrupt or crafted header can still claim billions of pages. This caps the pages visited
+        # per file so a single file can't stall a worker; 4M visits covers DBs of several GiB.
+
+        # the whole 100 bytes header is decoded in a single call, every other field is read with
+        # unpack_from straight from self.data, without slicing pages out of it.
+        self.st_header = struct.Struct(">16sHBBBBBBLLLLLL4sLL4sL24sLL")
+        self.nt_header = namedtuple("Header",
+            "magic page_size file_format_write_version file_format_read_version "
+            "reserved_bytes_per_page maximum_payload_fraction minimum_payload_fraction "
+            "leaf_payload_fraction file_change_counter page_count first_freelist_trunk "
+            "freelist_total_count schema_cookie schema_format_number page_cache_size "
+            "largest_root_vacuum database_encoding user_version incremental_vacuum "
+            "reserved_for_expansion version_valid_for_number sqlite_version_number")
+        self.st_btree_header = struct.Struct(">BHHHB")
+        self.st_freelist_trunk = struct.Struct(">LL")
+        self.st_ulong = struct.Struct(">L")
         self.data = ""
         self._Cleanup()
 
-    def _ConvertBytes(self, value, size, big_endian=True):
-        ret_value = array.array(size, value)
-        if big_endian:
-            ret_value.byteswap()
-        return ret_value[0]
-
     def _Cleanup(self):
         """
         Cleans up all the internal attributes that are set by the Validate method(s) when a file is
@@ -67,7 +151,13 @@ class SQLiteValidator(Validator):
         self.user_version = ""
         self.incremental_vacuum = -1
         self.version_valid_for_number = -1
+        self.page_map = bytearray()
+        self.root_pages = []
+        self.orphan_pages = []
+        self.page_visits = 0
+        self.work_exceeded = False
         self.data = ""
+        self.path = None
         self.pos = 0
 
     def _Read(self, length):
@@ -77,48 +167,63 @@ class SQLiteValidator(Validator):
         self.pos += length
         return ret
 
+    def _Visit(self, pages=1):
+        """
+        Accounts for pages visited while following any of the file structures, and invalidates the
+        file once self.max_page_visits is exceeded.
+
+        :param pages: amount of pages visited (int)
+        :return: True if the walk can go on, False otherwise (bool)
+        """
+        self.page_visits += pages
+        if self.page_visits > self.max_page_visits:
+            self.work_exceeded = True
+            self.is_valid = False
+        return not self.work_exceeded
+
     def _ValidateHeader(self):
         """
         Validates the header of a SQLite 3 Format file. Returns nothing, just changes internal
         attributes of the object.
         """
-        header = self._Read(100)
-        header_descriptor = header[0:16]
-        self.page_size = self._ConvertBytes(header[16:18], "H")
-        self.file_format_write_version = self._ConvertBytes(header[18:19], "B")
-        self.file_format_read_version = self._ConvertBytes(header[19:20], "B")
-        self.reserved_bytes_per_page = self._ConvertBytes(header[20:21], "B")
-        self.maximum_payload_fraction = self._ConvertBytes(header[21:22], "B")
-        self.minimum_payload_fraction = self._ConvertBytes(header[22:23], "B")
-        self.leaf_payload_fraction = self._ConvertBytes(header[23:24], "B")
-        self.file_change_counter = self._ConvertBytes(header[24:28], "L")
-        self.page_count = self._ConvertBytes(header[28:32], "L")
-        self.freelist_trunks = [self._ConvertBytes(header[32:36], "L")]
-        self.freelist_total_count = self._ConvertBytes(header[36:40], "L")
-        self.schema_format_number = self._ConvertBytes(header[44:48], "L")
-        self.page_cache_size = header[48:52]
-        self.largest_root_vacuum = self._ConvertBytes(header[52:56], "L")
-        self.database_encoding = self._ConvertBytes(header[56:60], "L")
-        self.user_version = header[60:64]
-        self.incremental_vacuum = self._ConvertBytes(header[64:68], "L") != 0
-        reserved_for_expansion = header[68:92]
-        self.version_valid_for_number = self._ConvertBytes(header[92:96], "L")
+        if len(self.data) < self.st_header.size:
+            self.eof = True
+            return
+        header = self.nt_header._make(self.st_header.unpack_from(self.data, 0))
+        self.pos = self.st_header.size
+        self.page_size = header.page_size
+        if self.page_size == 1:
+            self.page_size = 65536  # doesn't fit in 16 bits, so it's stored as 1
+        self.file_format_write_version = header.file_format_write_version
+        self.file_format_read_version = header.file_format_read_version
+        self.reserved_bytes_per_page = header.reserved_bytes_per_page
+        self.maximum_payload_fraction = header.maximum_payload_fraction
+        self.minimum_payload_fraction = header.minimum_payload_fraction
+        self.leaf_payload_fraction = header.leaf_payload_fraction
+        self.file_change_counter = header.file_change_counter
+        self.page_count = header.page_count
+        self.freelist_trunks = [header.first_freelist_trunk]
+        self.freelist_total_count = header.freelist_total_count
+        self.schema_format_number = header.schema_format_number
+        self.page_cache_size = header.page_cache_size
+        self.largest_root_vacuum = header.largest_root_vacuum
+        self.database_encoding = header.database_encoding
+        self.user_version = header.user_version
+        self.incremental_vacuum = header.incremental_vacuum != 0
+        self.version_valid_for_number = header.version_valid_for_number
         # following line is VERY important
         self.is_valid_page_count = (self.page_count > 0) and\
                                    (self.file_change_counter == self.version_valid_for_number)
-        # debugging for a valid page count:
-        #print "self.page_count: %d" % (self.page_count)
-        #print "file_change_counter: %d" % (file_change_counter)
-        #print "version_valid_for_number: %d" % (version_valid_for_number)
-        self.is_valid = ((header_descriptor == "SQLite format 3\x00") and
-            (self.file_format_write_version in [1, 2]) and
-            (self.file_format_read_version in [1, 2]) and
+        self.is_valid = ((header.magic == "SQLite format 3\x00") and
+            (self.page_size >= 512) and (self.page_size & (self.page_size - 1) == 0) and
+            (self.file_format_write_version in (1, 2)) and
+            (self.file_format_read_version in (1, 2)) and
             (self.maximum_payload_fraction == 64) and
             (self.minimum_payload_fraction == 32) and
             (self.leaf_payload_fraction == 32) and
-            (self.schema_format_number in [1, 2, 3, 4]) and
-            (self.database_encoding in [1, 2, 3]) and
-            (reserved_for_expansion == ('\x00' * 24)))
+            (self.schema_format_number in (1, 2, 3, 4)) and
+            (self.database_encoding in (1, 2, 3)) and
+            (header.reserved_for_expansion == ('\x00' * 24)))
         # end of _ValidateHeader, does not return anything.
 
     def _ValidatePages(self):
@@ -130,126 +235,88 @@ class SQLiteValidator(Validator):
             return
         # we only work on pages if header validation was successful
         # if header was valid, we consider the whole first page valid.
-        #print "Still valid? ", self.is_valid
-        #print "Page count: ", self.page_count
-        self._CountValidBytes(self.page_size)
-        self.usable_page_size = self.page_size - self.reserved_bytes_per_page
+        data = self.data
+        data_len = len(data)
+        page_size = self.page_size
+        st_ulong = self.st_ulong
+        self._CountValidBytes(page_size)
+        self.usable_page_size = page_size - self.reserved_bytes_per_page
         ptr_map_pages_pointers = self.usable_page_size / 5
-        ptr_map_pages = []
+        has_ptr_map = False
         if self.largest_root_vacuum > 0:
             if not self.is_valid_page_count:
                 # we have ptrMap pages, so we can find out the real page_count and fix it
-                #self.fd.seek(self.page_size)
-                self.pos = self.page_size
-                page = self._Read(self.page_size)
+                page_offset = page_size
                 ptr_page = 3 + ptr_map_pages_pointers
                 ptr_map_eof = False
                 new_page_count = 2
                 new_ptr_page = False
-                valid_record_types = ['\x01', '\x02', '\x03', '\x04', '\x05']
+                empty_record = '\x00' * 5
+                valid_record_types = ('\x01', '\x02', '\x03', '\x04', '\x05')
                 while not ptr_map_eof:
                     # we seek the end of the ptrMap chain and count all the pages referenced
                     # by them
+                    if page_offset + page_size > data_len:
+                        # no more data, so there's no next ptrMap page either
+                        break
+                    if not self._Visit():
+                        break
                     if new_ptr_page:
                         new_ptr_page = False
                         new_page_count += 1
                     record_num = 0
+                    record_offset = page_offset
                     while not ptr_map_eof and (record_num < ptr_map_pages_pointers):
-                        ptr_record = page[record_num * 5: (record_num * 5) + 5]
-                        record_type = ptr_record[0]
+                        record_type = data[record_offset]
                         # it it's an empty record, that means end of ptr map chain
-                        ptr_map_eof = ptr_record == ('\x00' * 5)
+                        ptr_map_eof = data[record_offset: record_offset + 5] == empty_record
                         if ptr_map_eof and (record_num == 0):
                             # miss-identified content as a ptrPage
                             new_page_count -= 1
                         if (not ptr_map_eof and (record_num != 0)
                                 and not record_type in valid_record_types):
                             # we found a corrupt ptr_map_page -- whole DB is corrupt
-                            #print "Corrupt ptr_map_page."
-                            #print ptr_record.encode("hex")
                             self.is_valid = False
                         if not ptr_map_eof and (record_type in valid_record_types):
                             # it's a valid pages record
                             new_page_count += 1
                         record_num += 1
-                    #self.fd.seek((ptr_page - 1) * self.page_size)
-                    self.pos = (ptr_page - 1) * self.page_size
-                    page = self._Read(self.page_size)
+                        record_offset += 5
+                    page_offset = (ptr_page - 1) * page_size
                     ptr_page += ptr_map_pages_pointers + 1
                     new_ptr_page = True
                 #end while not(ptr_map_eof)
                 self.page_count = new_page_count
-                #print "New page count: ", new_page_count
                 self.is_valid_page_count = True
-            ptr_map_pages = [2]
+            has_ptr_map = True
         if self.is_valid_page_count:
-            #print "valid page count!"
             # header page count was valid, so we rely on it
-            if ptr_map_pages:
-                ptr_page = 3 + ptr_map_pages_pointers
-                while ptr_page < self.page_count:
-                    ptr_map_pages.append(ptr_page)
-                    ptr_page += ptr_map_pages_pointers + 1
-                # now we know the location of all ptr_map_pages and can ignore them
-            free_pages = []
-            freelist_trunks = self.freelist_trunks
-            current_page = 1
-            #self.fd.seek(self.page_size)
-            self.pos = self.page_size
-            page = "true"
-            while self.is_valid and page and (current_page < self.page_count):
-                page = self._Read(self.page_size)
-                current_page += 1
-                #print "Page: ", current_page
-                # we walk all the DBs pages validating them
-                if current_page in ptr_map_pages:
-                    #print "ptrMap page"
-                    # we ignore it, since it provides no valuable data
-                    self._CountValidBytes(self.page_size)
-                    continue
-                if current_page in free_pages:
-                    #print "free page"
-                    # we have to ignore it
-                    self._CountValidBytes(self.page_size)
-                    continue
-                if current_page in freelist_trunks:
-                    #print "freelist trunk page"
-                    # we have to analyze to find if there's a following freelist_trunk
-                    # and add all the free pages to the freelist (so we can ignore them)
-                    next_freelist_trunk = self._ConvertBytes(page[0:4], "L")
-                    if next_freelist_trunk:
-                        freelist_trunks.append(next_freelist_trunk)
-                    freelist_records = self._ConvertBytes(page[4:8], "L")
-                    record_pos = 8
-                    for x in xrange(freelist_records):
-                        free_pages.append(self._ConvertBytes(page[record_pos: record_pos + 4], "L"))
-                        record_pos += 4
-                    self._CountValidBytes(self.page_size)
-                    continue
-                # so its not a prtMap, not a freelist trunk or a free page.
-                # its either a B-tree page or an cell payload overflow page
-                # first we test for a B-tree page, then for a CPOP, if neither, then we call it
-                # invalid and cut the validation
-                #print "b-tree or cell payload overflow page"
-                page_subheader = page[0:12]
-                #print "Page subheader:", page_subheader.encode("hex")
-                page_type_flag = self._ConvertBytes(page_subheader[0:1], "B")
-                valid_page = page_type_flag in [2, 5, 10, 13]
-                if page_type_flag in [2, 5]:
-                    valid_page = self._ConvertBytes(page_subheader[8:12], "L") <= self.page_count
-                if not valid_page:
-                    # ok, does it look like a CPOP?
-                    next_overflow_chain_page = self._ConvertBytes(page[0:4], "L")
-                    valid_page = next_overflow_chain_page <= self.page_count
-                self.is_valid = valid_page
-                self._CountValidBytes(self.page_size)
-            # end while
-            if not page and (current_page < self.page_count):
-                self.eof = True
+            # pages past the end of the data can't be checked, the walk stops there with eof
+            walk_pages = min(self.page_count, data_len / page_size)
+            over_budget = walk_pages - 1 > self.max_page_visits - self.page_visits
+            if over_budget:
+                walk_pages = self.max_page_visits - self.page_visits + 1
+            page_types, first_invalid = self._PageTypes(walk_pages, has_ptr_map)
+            if self.workers > 1 and self.path and walk_pages >= self.parallel_min_pages:
+                first_invalid_page = self._CheckPagesParallel(page_types, walk_pages)
+            else:
+                first_invalid_page = _CheckPages(data, page_types[2:], 2, page_size,
+                                                 self.page_count)
+            if first_invalid_page and (not first_invalid or first_invalid_page < first_invalid):
+                first_invalid = first_invalid_page
+            if first_invalid:
+                self._SetValidBytes((first_invalid - 1) * page_size)
+                self.is_valid = False
+            else:
+                self._SetValidBytes(walk_pages * page_size)
+                self.eof = self.is_valid and walk_pages < self.page_count and not over_budget
+            self._Visit(walk_pages - 1)
+            if over_budget:
+                self.work_exceeded = True
+                self.is_valid = False
         else:
             # header page count is not reliable, so we have to guess DB size
-            #print "not valid page count!"
-            if ptr_map_pages:
+            if has_ptr_map:
                 # we have ptrMap pages to get the actual DB size in pages
                 pass
             else:
@@ -261,16 +328,336 @@ class SQLiteValidator(Validator):
 
     # end of _ValidatePages, does not return anything.
 
+    def _PageTypes(self, walk_pages, has_ptr_map):
+        """
+        Finds the pages that aren't part of a b-tree: ptrMap pages and the freelist trunk and leaf
+        pages, following the freelist trunk chain.
+
+        :param walk_pages: amount of pages that will be walked (int)
+        :param has_ptr_map: True if the database has ptrMap pages (bool)
+        :return: tuple of (page types, first invalid page), page types is a bytearray with one
+            byte per page (plus a dummy for page 0) that is 5 for ptrMap pages, 3 for freelist
+            trunks, 4 for freelist leaves and 0 for the rest. First invalid page is the page
+            that holds the corrupt freelist pointer, or 0. (tuple)
+        """
+        data = self.data
+        page_types = bytearray(walk_pages + 1)
+        if has_ptr_map:
+            # ptrMap pages are page 2 and then one every (usable_page_size / 5) + 1 pages, so
+            # there's no need to build a list of them.
+            ptr_map_stride = (self.usable_page_size / 5) + 1
+            ptr_map_count = len(xrange(2, walk_pages + 1, ptr_map_stride))
+            page_types[2::ptr_map_stride] = "\x05" * ptr_map_count
+        max_freelist_records = (self.usable_page_size / 4) - 2
+        freelist_pages = 0
+        referrer = 1  # the first trunk is in the header
+        trunk = self.freelist_trunks[0]
+        while trunk:
+            if trunk > self.page_count or (trunk <= walk_pages and page_types[trunk]):
+                # the chain leaves the DB, loops or runs into another structure
+                return page_types, referrer
+            if trunk > walk_pages:
+                break  # the walk will stop before getting to this page anyway
+            if not self._Visit():
+                return page_types, trunk
+            page_types[trunk] = 3
+            offset = (trunk - 1) * self.page_size
+            next_trunk, freelist_records = self.st_freelist_trunk.unpack_from(data, offset)
+            freelist_pages += freelist_records + 1
+            if freelist_records > max_freelist_records or \
+                    freelist_pages > self.freelist_total_count:
+                return page_types, trunk
+            for leaf in struct.unpack_from(">%dL" % freelist_records, data, offset + 8):
+                if leaf > self.page_count or (leaf <= walk_pages and page_types[leaf]):
+                    return page_types, trunk
+                if leaf <= walk_pages:
+                    page_types[leaf] = 4
+            if next_trunk:
+                self.freelist_trunks.append(next_trunk)
+            referrer = trunk
+            trunk = next_trunk
+        return page_types, 0
+
+    def _CheckPagesParallel(self, page_types, walk_pages):
+        """
+        Splits the pages among self.workers processes, each one maps the database file on its
+        own, so no page data is sent to them.
+
+        :param page_types: as returned by _PageTypes (bytearray)
+        :param walk_pages: amount of pages that will be walked (int)
+        :return: same as _CheckPages
+        """
+        chunks = self.workers * 4
+        chunk_pages = max(1, (walk_pages - 1 + chunks - 1) / chunks)
+        tasks = [(self.path, page_types[first: first + chunk_pages], first, self.page_size,
+                  self.page_count) for first in xrange(2, walk_pages + 1, chunk_pages)]
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            results = pool.map(_CheckPagesWorker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+        # ranges are in order, so the first invalid page of the first range that has one is the
+        # same a single process would have found
+        for first_invalid in results:
+            if first_invalid:
+                return first_invalid
+        return 0
+
     def _ValidateDecompress(self):
         """
         Validates the structure of a SQLite 3 Format file. Returns nothing, just changes internal
         attributes of the object.
 
-        Still not implemented.
+        Only runs when the validator was created with structural=True. Every page reachable from
+        the schema table is marked in self.page_map as it is visited, so a page referenced twice
+        is a corrupt file and the pages left unmarked after the walk are the orphans.
         """
-        pass
+        if not (self.structural and self.is_valid and self.is_valid_page_count):
+            return
+        if len(self.data) < self.page_count * self.page_size:
+            # the structures may point anywhere in the file, so a truncated DB can't be walked
+            self.eof = True
+            return
+        self.page_map = bytearray(self.page_count + 1)
+        self.page_map[0] = 1  # there's no page 0
+        self._MarkPtrMapPages()
+        if self.is_valid:
+            self._MarkFreelist()
+        if self.is_valid:
+            schema = self._WalkBTree(1, True)
+            if self.is_valid:
+                self.root_pages = self._SchemaRootPages(schema)
+        for root_page in self.root_pages:
+            if not self.is_valid:
+                break
+            self._WalkBTree(root_page, False)
+        if self.is_valid:
+            self.orphan_pages = [x for x in xrange(1, self.page_count + 1) if not self.page_map[x]]
+            self.is_valid = not self.orphan_pages
+            self.end = self.is_valid
     # end of _ValidateDecompress, does not return anything.
 
+    def _MarkPage(self, page_num, page_type):
+        """
+        Marks a page as used by a structure. Invalidates the file if the page is out of range or
+        was already used by another structure.
+
+        :param page_num: page number, first page is 1 (int)
+        :param page_type: any non-zero value, tells which kind of structure uses the page (int)
+        :return: True if the page could be marked, False otherwise (bool)
+        """
+        if page_num < 1 or page_num > self.page_count or self.page_map[page_num]:
+            self.is_valid = False
+            return False
+        if not self._Visit():
+            return False
+        self.page_map[page_num] = page_type
+        return True
+
+    def _MarkPtrMapPages(self):
+        """
+        Marks the pointer map pages of an auto-vacuum database, and the lock-byte page of databases
+        bigger than 1 GiB.
+        """
+        lock_byte_page = (1073741824 / self.page_size) + 1
+        if lock_byte_page <= self.page_count:
+            self._MarkPage(lock_byte_page, 5)
+        if self.largest_root_vacuum > 0:
+            ptr_page = 2
+            while ptr_page <= self.page_count and self.is_valid:
+                self._MarkPage(ptr_page, 5)
+                ptr_page += (self.usable_page_size / 5) + 1
+                if ptr_page == lock_byte_page:
+                    ptr_page += 1
+
+    def _MarkFreelist(self):
+        """
+        Walks the freelist trunk chain, marking trunk and leaf pages.
+        """
+        data = self.data
+        page_size = self.page_size
+        trunk = self.freelist_trunks[0] if self.freelist_trunks else 0
+        while trunk and self._MarkPage(trunk, 3):
+            offset = (trunk - 1) * page_size
+            next_trunk, leaf_count = self.st_freelist_trunk.unpack_from(data, offset)
+            if leaf_count > (self.usable_page_size / 4) - 2:
+                self.is_valid = False
+                break
+            for leaf in struct.unpack_from(">%dL" % leaf_count, data, offset + 8):
+                if not self._MarkPage(leaf, 4):
+                    break
+            trunk = next_trunk
+
+    def _ReadVarint(self, page, offset):
+        """
+        Decodes a SQLite variable-length integer.
+
+        :param page: page data (string)
+        :param offset: offset of the varint within page (int)
+        :return: tuple of (value, offset of the first byte after the varint) or (-1, -1) if the
+            varint runs past the end of the page (tuple of ints)
+        """
+        value = 0
+        end = min(offset + 8, len(page))
+        while offset < end:
+            byte = ord(page[offset])
+            offset += 1
+            value = (value << 7) | (byte & 0x7f)
+            if byte < 0x80:
+                return value, offset
+        if offset == len(page):
+            return -1, -1
+        return (value << 8) | ord(page[offset]), offset + 1
+
+    def _WalkOverflow(self, page_num, length, collect=False):
+        """
+        Follows a cell payload overflow chain, marking its pages.
+
+        :param page_num: first page of the chain (int)
+        :param length: payload bytes stored in the chain (int)
+        :param collect: when True, the payload bytes are read from the chain and returned (bool)
+        :return: the payload bytes stored in the chain if collect is True, "" otherwise (string)
+        """
+        data = self.data
+        page_size = self.page_size
+        chunk_size = self.usable_page_size - 4
+        chunks = []
+        while length > 0:
+            if not self._MarkPage(page_num, 2):
+                return ""
+            offset = (page_num - 1) * page_size
+            page_num, = self.st_ulong.unpack_from(data, offset)
+            if collect:
+                chunks.append(data[offset + 4: offset + 4 + min(length, chunk_size)])
+            length -= chunk_size
+        if page_num:
+            # the chain is longer than the payload needs
+            self.is_valid = False
+        return "".join(chunks)
+
+    def _WalkBTree(self, root_page, collect):
+        """
+        Walks a whole b-tree starting from its root page, checking each page header, the cell
+        pointer array, the bounds of every cell and the overflow chains of their payloads.
+
+        :param root_page: page number of the root of the b-tree (int)
+        :param collect: when True, the payloads of the leaf cells are returned (bool)
+        :return: list of payloads if collect is True, empty list otherwise (list of strings)
+        """
+        data = self.data
+        page_size = self.page_size
+        usable = self.usable_page_size
+        max_local_table = usable - 35
+        max_local_index = ((usable - 12) * 64 / 255) - 23
+        min_local = ((usable - 12) * 32 / 255) - 23
+        payloads = []
+        stack = [(root_page, None)]
+        while stack and self.is_valid:
+            page_num, expected_leaf_type = stack.pop()
+            if not self._MarkPage(page_num, 1):
+                break
+            offset = (page_num - 1) * page_size
+            page = data[offset: offset + usable]
+            header_offset = 100 if page_num == 1 else 0
+            page_type, freeblock, cell_count, content_start, fragmented = \
+                self.st_btree_header.unpack_from(page, header_offset)
+            is_leaf = page_type in (10, 13)
+            if page_type not in (2, 5, 10, 13) or (expected_leaf_type is not None and
+                                                   page_type | 8 != expected_leaf_type):
+                # interior pages are 2 or 5 and their children must be of the same kind of tree
+                self.is_valid = False
+                break
+            if content_start == 0:
+                content_start = 65536
+            cell_array = header_offset + (8 if is_leaf else 12)
+            if cell_array + cell_count * 2 > content_start or content_start > usable or \
+                    fragmented > 60 or (freeblock and freeblock < content_start):
+                self.is_valid = False
+                break
+            if not is_leaf:
+                right_child, = self.st_ulong.unpack_from(page, header_offset + 8)
+                stack.append((right_child, page_type | 8))
+            max_local = max_local_table if page_type == 13 else max_local_index
+            for cell_pointer in struct.unpack_from(">%dH" % cell_count, page, cell_array):
+                if cell_pointer < content_start or cell_pointer + 4 > usable:
+                    self.is_valid = False
+                    break
+                cell = cell_pointer
+                if not is_leaf:
+                    left_child, = self.st_ulong.unpack_from(page, cell)
+                    stack.append((left_child, page_type | 8))
+                    cell += 4
+                payload_size, cell = self._ReadVarint(page, cell)
+                if page_type == 13 and cell > 0:
+                    rowid, cell = self._ReadVarint(page, cell)
+                if cell < 0:
+                    self.is_valid = False
+                    break
+                if page_type == 5:
+                    continue  # table interior cells have no payload, only the integer key
+                local = payload_size
+                if payload_size > max_local:
+                    local = min_local + ((payload_size - min_local) % (usable - 4))
+                    if local > max_local:
+                        local = min_local
+                if cell + local + (4 if local < payload_size else 0) > usable:
+                    self.is_valid = False
+                    break
+                keep = collect and page_type == 13
+                if local < payload_size:
+                    overflow_page, = self.st_ulong.unpack_from(page, cell + local)
+                    overflow = self._WalkOverflow(overflow_page, payload_size - local, keep)
+                    if not self.is_valid:
+                        break
+                    if keep:
+                        payloads.append(page[cell: cell + local] + overflow)
+                elif keep:
+                    payloads.append(page[cell: cell + local])
+        return payloads
+
+    def _SchemaRootPages(self, records):
+        """
+        Extracts the root pages from the records of the sqlite_master table. Each record is
+        (type, name, tbl_name, rootpage, sql); views and triggers have no b-tree (rootpage 0).
+
+        :param records: record payloads of the sqlite_master table (list of strings)
+        :return: root page numbers (list of ints)
+        """
+        int_sizes = {1: 1, 2: 2, 3: 3, 4: 4, 5: 6, 6: 8}
+        root_pages = []
+        for record in records:
+            header_size, pos = self._ReadVarint(record, 0)
+            serial_types = []
+            while 0 < pos < header_size and len(serial_types) < 4:
+                serial_type, pos = self._ReadVarint(record, pos)
+                serial_types.append(serial_type)
+            if len(serial_types) < 4:
+                self.is_valid = False
+                break
+            body = header_size
+            for serial_type in serial_types[:3]:
+                if serial_type >= 12:
+                    body += (serial_type - 12) / 2
+                else:
+                    body += int_sizes.get(serial_type, 8 if serial_type == 7 else 0)
+            serial_type = serial_types[3]
+            if serial_type in int_sizes:
+                size = int_sizes[serial_type]
+                raw = record[body: body + size]
+                if len(raw) < size:
+                    self.is_valid = False
+                    break
+                root_page = int(raw.encode("hex"), 16)
+            elif serial_type in (0, 8, 9):
+                root_page = serial_type & 1  # NULL, constant 0 and constant 1
+            else:
+                self.is_valid = False
+                break
+            if root_page:
+                root_pages.append(root_page)
+        return root_pages
+
     def GetDetails(self):
         """
         Returns a dictionary with detailed information about the last validated file.
@@ -296,6 +683,10 @@ class SQLiteValidator(Validator):
             * user_version (string)
             * incremental_vacuum (int)
             * version_valid_for_number (int)
+            * root_pages (list of ints) -- only with structural=True
+            * orphan_pages (list of ints) -- only with structural=True
+            * page_visits (int) -- pages visited while following the file structures
+            * work_exceeded (bool) -- validation stopped after max_page_visits
         """
         return {
             'bytes_last_valid ': self.bytes_last_valid,
@@ -318,13 +709,23 @@ class SQLiteValidator(Validator):
             'user_version ': self.user_version,
             'incremental_vacuum ': self.incremental_vacuum,
             'version_valid_for_number ': self.version_valid_for_number,
+            'root_pages': self.root_pages,
+            'orphan_pages': self.orphan_pages,
+            'page_visits': self.page_visits,
+            'work_exceeded': self.work_exceeded,
             'extensions': ['.sqlite'],
         }
 
     def Validate(self, fd):
         self._Cleanup()
         if type(fd) == file:
-            self.data = fd.read()
+            if self.workers > 1 and fd.tell() == 0 and os.path.isfile(fd.name) and \
+                    os.path.getsize(fd.name) > 0:
+                # the workers map the same file, so there's no point in reading it into memory
+                self.path = os.path.abspath(fd.name)
+                self.data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = fd.read()
         elif type(fd) == str:
             self.data = fd
         else:
@@ -0,0 +1,196 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import itertools
+import struct
+
+from Validator import Validator
+
+
+class SQLiteWALValidator(Validator):
+    """
+    Class that validates an object to determine if it is a valid SQLite 3 write-ahead log (-wal)
+    file.
+    """
+
+    def __init__(self):
+        """
+        Calls Validator.__init__() and sets some internal attributes for the validation process.
+
+        :var st_header: WAL header, 32 bytes. (struct.Struct)
+        :var st_frame_header: WAL frame header, 24 bytes. (struct.Struct)
+        :var st_page_words: structs that unpack a whole page into 32-bit words for _Checksum,
+            indexed by (length, big endian). (dict of struct.Struct)
+        """
+        super(SQLiteWALValidator, self).__init__()
+        self.st_header = struct.Struct(">LLLLLLLL")
+        self.st_frame_header = struct.Struct(">LLLLLL")
+        self.st_page_words = {}
+        self.data = ""
+        self._Cleanup()
+
+    def _Cleanup(self):
+        """
+        Cleans up all the internal attributes that are set by the Validate method when a file is
+        analyzed.
+        """
+        self.is_valid = False
+        self.bytes_last_valid = 0
+        self.eof = False
+        self.end = False
+        self.big_endian_checksum = False
+        self.file_format_version = -1
+        self.page_size = -1
+        self.checkpoint_sequence = -1
+        self.salts = (-1, -1)
+        self.frames = 0
+        self.committed_frames = 0
+        self.database_size = -1
+        self.data = ""
+
+    def _Checksum(self, words, s0, s1):
+        """
+        Calculates the cumulative WAL checksum over a sequence of 32-bit words.
+
+        The words come from a single unpack_from call per page, so the loop only does additions.
+        Every step depends on the previous one, so this is as tight as it gets in pure Python.
+
+        :param words: the words to sum, an even amount of them (tuple of ints)
+        :param s0: first checksum value of the previous frame or header (int)
+        :param s1: second checksum value of the previous frame or header (int)
+        :return: tuple of the new (s0, s1) (tuple of ints)
+        """
+        words = iter(words)
+        for x0, x1 in itertools.izip(words, words):
+            s0 = (s0 + x0 + s1) & 0xffffffff
+            s1 = (s1 + x1 + s0) & 0xffffffff
+        return s0, s1
+
+    def _ValidateHeader(self):
+        """
+        Validates the WAL header. Returns nothing, just changes internal attributes of the object.
+        """
+        if len(self.data) < 32:
+            self.eof = True
+            return
+        magic, version, page_size, checkpoint, salt1, salt2, checksum1, checksum2 = \
+            self.st_header.unpack_from(self.data, 0)
+        self.big_endian_checksum = magic == 0x377f0683
+        self.file_format_version = version
+        self.page_size = page_size
+        self.checkpoint_sequence = checkpoint
+        self.salts = (salt1, salt2)
+        self.is_valid = (
+            magic in (0x377f0682, 0x377f0683) and
+            version == 3007000 and
+            512 <= page_size <= 65536 and
+            page_size & (page_size - 1) == 0
+        )
+        if self.is_valid:
+            self.is_valid = self._Checksum(self._Words(0, 24), 0, 0) == (checksum1, checksum2)
+        self._SetValidBytes(32)
+
+    def _Words(self, offset, length):
+        """
+        Unpacks 32-bit words from the data buffer, in the byte order of the checksum.
+
+        :param offset: offset in the data buffer (int)
+        :param length: amount of bytes to unpack, multiple of 8 (int)
+        :return: tuple of ints
+        """
+        key = (length, self.big_endian_checksum)
+        if key not in self.st_page_words:
+            self.st_page_words[key] = struct.Struct(
+                "%s%dL" % (">" if self.big_endian_checksum else "<", length / 4))
+        return self.st_page_words[key].unpack_from(self.data, offset)
+
+    def _ValidateFrames(self):
+        """
+        Walks the WAL frames until one of them doesn't match the header salts or the cumulative
+        checksum. Only the frames up to the last commit frame are valid, the rest would be ignored
+        by SQLite when recovering the WAL.
+        """
+        if not self.is_valid:
+            return
+        data = self.data
+        data_len = len(data)
+        page_size = self.page_size
+        frame_size = 24 + page_size
+        salts = self.salts
+        s0, s1 = self.st_header.unpack_from(data, 0)[6:8]
+        offset = 32
+        while offset + frame_size <= data_len:
+            page_num, db_size, salt1, salt2, checksum1, checksum2 = \
+                self.st_frame_header.unpack_from(data, offset)
+            if page_num == 0 or (salt1, salt2) != salts:
+                break
+            s0, s1 = self._Checksum(self._Words(offset, 8), s0, s1)
+            s0, s1 = self._Checksum(self._Words(offset + 24, page_size), s0, s1)
+            if (s0, s1) != (checksum1, checksum2):
+                break
+            offset += frame_size
+            self.frames += 1
+            if db_size:
+                # a commit frame, everything up to here is part of a transaction
+                self.committed_frames = self.frames
+                self.database_size = db_size
+                self._SetValidBytes(offset)
+        else:
+            self.eof = offset < data_len
+        self.end = not self.eof
+
+    def GetDetails(self):
+        """
+        Returns a dictionary with detailed information about the last validated file.
+
+        :return: dict of:
+            * big_endian_checksum (bool)
+            * file_format_version (int)
+            * page_size (int)
+            * checkpoint_sequence (int)
+            * salts (tuple of ints)
+            * frames (int) -- frames with a valid checksum
+            * committed_frames (int) -- frames up to the last commit frame
+            * database_size (int) -- size in pages of the database after the last commit
+        """
+        return {
+            'big_endian_checksum': self.big_endian_checksum,
+            'file_format_version': self.file_format_version,
+            'page_size': self.page_size,
+            'checkpoint_sequence': self.checkpoint_sequence,
+            'salts': self.salts,
+            'frames': self.frames,
+            'committed_frames': self.committed_frames,
+            'database_size': self.database_size,
+            'extensions': ['.sqlite-wal'],
+        }
+
+    def Validate(self, fd):
+        """
+        Validates a file-like object to determine if its a valid SQLite 3 WAL file.
+
+        :param fd: file descriptor (file-like)
+        :return: True on valid WAL, False otherwise (bool)
+        """
+        self._Cleanup()
+        if type(fd) == file:
+            self.data = fd.read()
+        elif type(fd) == str:
+            self.data = fd
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        self._ValidateHeader()
+        self._ValidateFrames()
+        return self.is_valid
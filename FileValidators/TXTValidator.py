@@ -25,6 +25,8 @@
   a b c d e f g h i j k l m n o p q r s t u v w x y z { | } ~
 """
 
+import re
+
 from Validator import Validator
 
 
@@ -48,7 +50,10 @@ class TXTValidator(Validator):
         self.segments = []
         self.data = ""
         self.pos = 0
-        
+        # standard characters, \n and \t, and the extended characters from 128 to 168
+        valid_chars = "".join(chr(i) for i in range(32, 126 + 1)) + "\n\t" + \
+            "".join(chr(i) for i in range(128, 168 + 1))
+        self.re_invalid = re.compile("[^%s]" % re.escape(valid_chars))
 
 
     def _Read(self, length):
@@ -63,24 +68,23 @@ class TXTValidator(Validator):
         Returns dictionary with import information from the recently-validated file.
 
         :return: dictionary {
-            'segments': a list of tuples of the following format:
-                (segid (string), offset (int), length (int), CRC-32 (long), CRC-32 calc (long))
-                Segment segid is found at offset bytes in the file, takes up length bytes (count
-                from the segid offset including the CRC-32 and the calculated CRC-32)
+            'diagnostics': the first invalid character, as a list of tuples of the following
+                format: (offset (int), rule (string), excerpt (string))
         }
         """
         return {
+            'diagnostics': self.diagnostics,
             'extensions': ['txt'],
         }
 
     def Validate(self, fd):
         """
-        Validates a file-like object to determine if its a valid PNG file.
+        Validates a file-like object to determine if its a valid TXT file. The data is searched
+        for the first invalid character at once, nothing is printed.
 
         :param fd: file descriptor (file-like)
         :return: True on valid TXT, False otherwise (bool)
         """
-        valid_list = []
         self.pos = 0
         if type(fd) == file:
             self.data = fd.read()
@@ -88,34 +92,20 @@ class TXTValidator(Validator):
             self.data = fd
         else:
             raise Exception("Argument must be either a file or a string.")
-        """
-            Standar Character
-        """
-        for i in range(32, 126+1):
-            valid_list.append(chr(i)),
-        valid_list.append("\n")
-        valid_list.append("\t")
-
-        """
-            Extended Character
-        """
-        for i in range(128, 168+1):
-            valid_list.append(chr(i)),
-
-            self.is_valid = True
-            self._SetValidBytes(0)
-            self.eof = False
-            self.end = False
-        print "Start \n"
-        text = self._Read(1)
-
-        while self.is_valid and not self.eof and not self.end:
-            print "%s " % (text)
-            if text in valid_list:
-                self.is_valid = True
-                self._CountValidBytes(1)
-            else:
-                self.is_valid = False
-                text = self._Read(1)
-
+        self.is_valid = True
+        self._SetValidBytes(0)
+        self.eof = False
+        self.end = False
+        self.diagnostics = []
+        match = self.re_invalid.search(self.data)
+        if match is None:
+            self._SetValidBytes(len(self.data))
+            self.pos = len(self.data)
+            self.eof = True
+        else:
+            self._SetValidBytes(match.start())
+            self.pos = match.start()
+            self.is_valid = False
+            excerpt = self.data[match.start(): match.start() + 16]
+            self._Diagnostic(match.start(), "invalid_character", excerpt)
         return self.is_valid
@@ -0,0 +1,333 @@
+# CIRA File Validators
+# Copyright (C) 2014 InFo-Lab
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU
+# Lesser General Public License as published by the Free Software Foundation; either version 2 of
+# the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program; if not,
+# write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# coding=utf-8
+import mmap
+import re
+import struct
+
+from collections import namedtuple
+from FileTime import FileTime
+from Validator import Validator
+
+
+class USNJournalValidator(Validator):
+    """
+    Class that validates an object to determine if it is a valid NTFS change journal stream
+    ($Extend\\$UsnJrnl:$J), made of USN_RECORD_V2 and USN_RECORD_V3 records.
+
+    The $J stream is sparse: everything before the oldest record still kept reads as zeros, and
+    there are zero filled gaps between records. Zero runs are skipped with a regular expression
+    search for the next non-zero byte instead of record by record.
+
+    Records() yields the records one at a time as USNRecord namedtuples, files are memory mapped
+    so multi-GB streams are parsed in a single pass without reading them whole. Timestamps are
+    kept as raw FILETIME ticks, see self.filetime.
+    """
+
+    def __init__(self):
+        """
+        Calls Validator.__init__() and sets some internal attributes for the validation process.
+
+        :var st_v2: USN_RECORD_V2 up to the file name, 64-bit file references. (struct.Struct)
+        :var st_v3: USN_RECORD_V3 up to the file name, 128-bit file references, unpacked as two
+            64-bit halves each. (struct.Struct)
+        :var reason_flags: names and bits of the reason field. (list of tuples)
+        :var reasons: cache of decoded reasons, by reason value. (dict of tuples)
+        """
+        super(USNJournalValidator, self).__init__()
+        self.st_v2 = struct.Struct("<LHHQQqQLLLLHH")
+        self.st_v3 = struct.Struct("<LHHQQQQqQLLLLHH")
+        self.st_ulong = struct.Struct("<L")
+        self.nt_record = namedtuple("USNRecord",
+            "offset usn version file_reference file_sequence parent_reference parent_sequence "
+            "timestamp reason reasons source_info security_id file_attributes name")
+        self.re_nonzero = re.compile("[^\x00]")
+        self.zero_block = "\x00" * (1 << 16)  # zero runs are skipped this many bytes at a time
+        self.filetime = FileTime()
+        self.reason_flags = [
+            ("DataOverwrite", 0x00000001),
+            ("DataExtend", 0x00000002),
+            ("DataTruncation", 0x00000004),
+            ("NamedDataOverwrite", 0x00000010),
+            ("NamedDataExtend", 0x00000020),
+            ("NamedDataTruncation", 0x00000040),
+            ("FileCreate", 0x00000100),
+            ("FileDelete", 0x00000200),
+            ("EAChange", 0x00000400),
+            ("SecurityChange", 0x00000800),
+            ("RenameOldName", 0x00001000),
+            ("RenameNewName", 0x00002000),
+            ("IndexableChange", 0x00004000),
+            ("BasicInfoChange", 0x00008000),
+            ("HardLinkChange", 0x00010000),
+            ("CompressionChange", 0x00020000),
+            ("EncryptionChange", 0x00040000),
+            ("ObjectIDChange", 0x00080000),
+            ("ReparsePointChange", 0x00100000),
+            ("StreamChange", 0x00200000),
+            ("TransactedChange", 0x00400000),
+            ("IntegrityChange", 0x00800000),
+            ("Close", 0x80000000),
+        ]
+        self.reasons = {}
+        self.data = ""
+        self._Cleanup()
+
+    def _Cleanup(self):
+        """
+        Cleans up all the internal attributes that are set by the Validate method when a file is
+        analyzed.
+        """
+        self.is_valid = False
+        self.bytes_last_valid = 0
+        self.eof = False
+        self.end = False
+        if type(self.data) == mmap.mmap:
+            self.data.close()
+        self.data = ""
+        self.records = 0
+        self.versions = {}
+        self.zero_bytes = 0
+        self.bad_records = 0
+        self.first_bad_offset = -1
+        self.usn_mismatches = 0
+        self.first_usn = -1
+        self.last_usn = -1
+        self.first_timestamp = 0
+        self.last_timestamp = 0
+
+    def DecodeReason(self, reason):
+        """
+        :param reason: reason field of a record (int)
+        :return: names of the reason flags set (tuple of strings)
+        """
+        names = self.reasons.get(reason)
+        if names is None:
+            names = tuple(name for name, bit in self.reason_flags if reason & bit)
+            self.reasons[reason] = names
+        return names
+
+    def _ParseRecord(self, pos):
+        """
+        Parses and checks the record at an offset: length (a multiple of 8 that holds the header
+        and the name), version and name offset and length.
+
+        :param pos: offset of the record, a multiple of 8 (int)
+        :return: the record, or None if it's not valid (USNRecord)
+        """
+        data = self.data
+        length, major = struct.unpack_from("<LH", data, pos)
+        if major == 2:
+            st = self.st_v2
+        elif major == 3:
+            st = self.st_v3
+        else:
+            return None
+        if length % 8 or length < st.size or pos + length > len(data):
+            return None
+        values = st.unpack_from(data, pos)
+        name_length, name_offset = values[-2:]
+        if name_offset != st.size or name_length % 2 or name_offset + name_length > length:
+            return None
+        if major == 2:
+            file_reference, parent_reference = values[3:5]
+            file_sequence = file_reference >> 48
+            file_reference &= 0xffffffffffff
+            parent_sequence = parent_reference >> 48
+            parent_reference &= 0xffffffffffff
+            usn, timestamp, reason, source_info, security_id, file_attributes = values[5:11]
+        else:
+            # 128-bit references, NTFS ones have the 64-bit reference in the low half
+            file_low, file_high, parent_low, parent_high = values[3:7]
+            file_sequence = 0 if file_high else file_low >> 48
+            file_reference = file_low | file_high << 64 if file_high else file_low & 0xffffffffffff
+            parent_sequence = 0 if parent_high else parent_low >> 48
+            parent_reference = parent_low | parent_high << 64 if parent_high else \
+                parent_low & 0xffffffffffff
+            usn, timestamp, reason, source_info, security_id, file_attributes = values[7:13]
+        name = data[pos + name_offset: pos + name_offset + name_length].decode(
+            "utf-16-le", "replace")
+        return self.nt_record(
+            pos, usn, major, file_reference, file_sequence, parent_reference, parent_sequence,
+            timestamp, reason, self.DecodeReason(reason), source_info, security_id,
+            file_attributes, name)
+
+    def _SkipZeros(self, pos, end):
+        """
+        Finds the next non-zero byte. Whole blocks of zero_block bytes are compared at once, the
+        regular expression only searches the block where the zeros end.
+
+        :param pos: where to start (int)
+        :param end: where to stop (int)
+        :return: offset of the next non-zero byte, or end if there's none (int)
+        """
+        data = self.data
+        zero_block = self.zero_block
+        block_size = len(zero_block)
+        while pos < end:
+            block = data[pos: min(pos + block_size, end)]
+            if block == zero_block[:len(block)]:
+                pos += len(block)
+                continue
+            return pos + self.re_nonzero.search(block).start()
+        return end
+
+    def _Walk(self, resync=False):
+        """
+        Walks the records, skipping zero runs, and updates the internal attributes on the way.
+
+        :param resync: when True, invalid records are counted and the walk goes on at the next 8
+            byte boundary; otherwise the walk stops at the first one (bool)
+        :return: generator of records (generator of USNRecord)
+        """
+        data = self.data
+        data_len = len(data)
+        st_ulong = self.st_ulong
+        pos = 0
+        while pos + 8 <= data_len:
+            length, = st_ulong.unpack_from(data, pos)
+            if length == 0:
+                next_pos = self._SkipZeros(pos, data_len)
+                if next_pos >= data_len:
+                    self.zero_bytes += data_len - pos
+                    pos = data_len
+                    break
+                next_pos &= ~7
+                if next_pos > pos:
+                    self.zero_bytes += next_pos - pos
+                    pos = next_pos
+                    continue
+            record = None
+            if length:
+                record = self._ParseRecord(pos)
+            if record is None:
+                if pos + length > data_len and not length % 8 and \
+                        data[pos + 4: pos + 6] in ("\x02\x00", "\x03\x00"):
+                    # a record that was cut short
+                    self.eof = True
+                    break
+                self.bad_records += 1
+                if self.first_bad_offset < 0:
+                    self.first_bad_offset = pos
+                if not resync:
+                    break
+                pos += 8
+                continue
+            if record.usn != pos:
+                # the USN is the offset of the record in the $J stream, unless this is a fragment
+                self.usn_mismatches += 1
+            if not self.records:
+                self.first_usn = record.usn
+                self.first_timestamp = record.timestamp
+            self.last_usn = record.usn
+            self.last_timestamp = record.timestamp
+            self.records += 1
+            self.versions[record.version] = self.versions.get(record.version, 0) + 1
+            pos += length
+            if not self.bad_records:
+                self.is_valid = True
+                self._SetValidBytes(pos)
+            yield record
+        else:
+            # the last bytes are too few for a record length
+            self.eof = pos < data_len and data[pos:].strip("\x00") != ""
+        if self.bad_records and not resync:
+            self.is_valid = False
+        self.end = self.is_valid and not self.eof
+
+    def _Unload(self):
+        """
+        Unmaps the data once the walk is over, the status attributes and details stay.
+        """
+        if type(self.data) == mmap.mmap:
+            self.data.close()
+        self.data = ""
+
+    def _Load(self, fd):
+        """
+        Sets the data to walk, files are memory mapped.
+
+        :param fd: file descriptor or data (file or str)
+        """
+        self._Cleanup()
+        if type(fd) == file:
+            fd.seek(0, 2)
+            if fd.tell():
+                self.data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        elif type(fd) == str:
+            self.data = fd
+        else:
+            raise Exception("Argument must be either a file or a string.")
+
+    def Records(self, fd, resync=False):
+        """
+        Yields the records of a $J stream. The status attributes and GetDetails() are up to date
+        once the generator is exhausted, and a mapped file is unmapped then.
+
+        :param fd: file descriptor or data (file or str)
+        :param resync: when True, invalid records are skipped instead of ending the walk (bool)
+        :return: generator of records (generator of USNRecord)
+        """
+        self._Load(fd)
+        try:
+            for record in self._Walk(resync):
+                yield record
+        finally:
+            self._Unload()
+
+    def GetDetails(self):
+        """
+        Returns a dictionary with detailed information about the last validated file.
+
+        :return: dict of:
+            * records (int) -- valid records walked
+            * versions (dict) -- record count by major version
+            * zero_bytes (int) -- bytes skipped as zero runs
+            * bad_records (int) -- invalid records found, only more than 1 with resync
+            * first_bad_offset (int) -- offset of the first invalid record, -1 if none
+            * usn_mismatches (int) -- records whose USN isn't their offset, fragments of a $J
+              stream have one for every record
+            * first_usn, last_usn (int) -- -1 if there are no records
+            * first_timestamp, last_timestamp (int) -- FILETIME ticks, 0 if there are no records
+        """
+        return {
+            'records': self.records,
+            'versions': self.versions,
+            'zero_bytes': self.zero_bytes,
+            'bad_records': self.bad_records,
+            'first_bad_offset': self.first_bad_offset,
+            'usn_mismatches': self.usn_mismatches,
+            'first_usn': self.first_usn,
+            'last_usn': self.last_usn,
+            'first_timestamp': self.first_timestamp,
+            'last_timestamp': self.last_timestamp,
+            'extensions': ['.usnjrnl'],
+        }
+
+    def Validate(self, fd):
+        """
+        Validates a file-like object to determine if its a valid $J stream: at least one record,
+        and no invalid ones. A stream cut in the middle of a record is valid, with eof set.
+
+        :param fd: file descriptor, files are memory mapped while they are walked (file-like)
+        :return: True on valid $J stream, False otherwise (bool)
+        """
+        self._Load(fd)
+        try:
+            for record in self._Walk():
+                pass
+        finally:
+            self._Unload()
+        return self.is_valid
@@ -30,12 +30,16 @@ class Validator(object):
         :var is_valid: tells if the last file that was validated was valid. (bool)
         :var eof: tells if the validator reached EOF in the last file that was validated. (bool)
         :var bytes_last_valid: tells the last offset within the file that was valid. (int)
+        :var diagnostics: why the last file is not valid, for validators that explain it, see
+            _Diagnostic. (list of tuples)
         """
         self.is_valid = False
         self.eof = False
         self.bytes_last_valid = -1
         self.end = False
         self.fd = None
+        self.diagnostics = []
+        self.max_diagnostics = 100  # diagnostics kept per file, a broken file can have thousands
 
     def GetDetails(self):
         """
@@ -86,6 +90,18 @@ class Validator(object):
             self.bytes_last_valid += bytes_read
             #print self.bytes_last_valid,
 
+    def _Diagnostic(self, offset, rule, excerpt=""):
+        """
+        Records a failed check, nothing is printed. Only the first max_diagnostics are kept, the
+        list is reset by each validator's cleanup.
+
+        :param offset: offset in the file where the check failed (int)
+        :param rule: name of the check (string)
+        :param excerpt: the data that failed the check, cut to 80 bytes (string)
+        """
+        if len(self.diagnostics) < self.max_diagnostics:
+            self.diagnostics.append((offset, rule, excerpt[:80]))
+
     def _SetValidBytes(self, value):
         """
         Sets the internal accounting of valid bytes. USE WITH CARE!
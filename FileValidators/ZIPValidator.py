@@ -13,31 +13,651 @@
 # write to the Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 
 # coding=utf-8
-import zipfile
+# Based on the .ZIP File Format Specification (PKWARE APPNOTE.TXT). Overall .ZIP file format:
+#
+#   [local file header 1][file data 1][data descriptor 1]
+#   ...
+#   [local file header n][file data n][data descriptor n]
+#   [central directory header 1]
+#   ...
+#   [central directory header n]
+#   [end of central directory record]
+import bz2
+import struct
+import zlib
 
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 from Validator import Validator
 
 
 class ZIPValidator(Validator):
     """
-    Class that validates an object to determine if it is a valid ZIP file. Uses zipfile from the
-    python standard library.
+    Class that validates an object to determine if it is a valid ZIP file.
+
+    The end of central directory record (EOCD) is located first, then every central directory entry
+    is checked against the local file header it points to. The archive ends right after the EOCD
+    and its comment, so carved ZIPs can be cut at bytes_last_valid.
+
+    Carved ZIPs often lose their tail, and the central directory with it. When there's no EOCD the
+    local file headers are walked forward instead, and bytes_last_valid is the end of the last
+    complete member.
+
+    With deep=True every member is also decompressed and checked against the CRC-32 and size in
+    its central directory entry.
+
+    ZIP64 archives are supported. ValidateFromEOCD() validates an archive found by its EOCD inside
+    a bigger image, which is a much more selective anchor for carving than the local file headers.
     """
-    def __init__(self):
+
+    def __init__(self, deep=False, workers=1):
         """
-        Calls super().__init__() and then sets the Validate attribute to point at  zipfile's
-        is_zipfile() function.
-        :return:
+        Calls Validator.__init__() and sets some internal attributes for the validation process.
+
+        :param deep: decompress every member and check its CRC-32 and uncompressed size. (bool)
+        :param workers: threads used to decompress members when deep is set. zlib and bz2 release
+            the GIL while they work, so threads are enough. (int)
+        :var inflate_chunk: most bytes fed to or taken out of a decompressor at once, so members
+            are never held decompressed in memory. (int)
+        :var bz2_slice: bytes fed to a bzip2 decompressor at once. BZ2Decompressor has no output
+            limit and a bzip2 block of a few dozen bytes can expand to tens of MB, so it only gets
+            enough input to finish a block or two per call. (int)
+        :var st_eocd: end of central directory record, 22 bytes without the comment.
+            (struct.Struct)
+        :var st_central: central directory file header, 46 bytes without the variable fields.
+            (struct.Struct)
+        :var st_local: local file header, 30 bytes without the variable fields. (struct.Struct)
+        :var st_descriptor: data descriptor without its optional signature. (struct.Struct)
+        :var st_descriptor64: ZIP64 data descriptor without its optional signature.
+            (struct.Struct)
+        :var st_locator64: ZIP64 end of central directory locator, 20 bytes. (struct.Struct)
+        :var st_eocd64: ZIP64 end of central directory record, 56 bytes without the extensible
+            data. (struct.Struct)
+        :var st_extra: header of an extra field block, id and size. (struct.Struct)
         """
         super(ZIPValidator, self).__init__()
-        self.Validate = zipfile.is_zipfile
-        # Instead of writing a Validate() method, we take a function from zipfile module and use it.
-        
-    def GetStatus(self):
+        self.deep = deep
+        self.workers = workers
+        self.inflate_chunk = 1 << 20
+        self.bz2_slice = 64
+        self.sig_local = "PK\x03\x04"
+        self.sig_central = "PK\x01\x02"
+        self.sig_eocd = "PK\x05\x06"
+        self.st_eocd = struct.Struct("<4sHHHHLLH")
+        self.st_central = struct.Struct("<4sHHHHHHLLLHHHHHLL")
+        self.st_local = struct.Struct("<4sHHHHHLLLHH")
+        self.st_descriptor = struct.Struct("<LLL")
+        self.st_descriptor64 = struct.Struct("<LQQ")
+        self.st_locator64 = struct.Struct("<4sLQL")
+        self.st_eocd64 = struct.Struct("<4sQHHLLQQQQ")
+        self.st_extra = struct.Struct("<HH")
+        self.st_ulonglong = struct.Struct("<Q")
+        # ZIP based formats told apart by the members they have, see _GetExtension
+        self.ooxml_dirs = [("word", ".docx"), ("xl", ".xlsx"), ("ppt", ".pptx"),
+                           ("visio", ".vsdx")]
+        self.odf_mimetypes = {
+            "application/vnd.oasis.opendocument.text": ".odt",
+            "application/vnd.oasis.opendocument.spreadsheet": ".ods",
+            "application/vnd.oasis.opendocument.presentation": ".odp",
+            "application/vnd.oasis.opendocument.graphics": ".odg",
+            "application/epub+zip": ".epub",
+        }
+        self.nt_eocd = namedtuple("EndOfCentralDirectory",
+            "signature disk disk_cd disk_entries total_entries cd_size cd_offset comment_len")
+        self.nt_eocd64 = namedtuple("Zip64EndOfCentralDirectory",
+            "signature record_size version_made version_needed disk disk_cd disk_entries "
+            "total_entries cd_size cd_offset")
+        self.nt_central = namedtuple("CentralDirectoryEntry",
+            "signature version_made version_needed flags method mtime mdate crc csize usize "
+            "name_len extra_len comment_len disk_start internal_attr external_attr local_offset")
+        self.nt_local = namedtuple("LocalFileHeader",
+            "signature version_needed flags method mtime mdate crc csize usize name_len "
+            "extra_len")
+        self.data = ""
+        self._Cleanup()
+
+    def _Cleanup(self):
+        """
+        Cleans up all the internal attributes that are set by the Validate method when a file is
+        analyzed.
+        """
+        self.is_valid = False
+        self.bytes_last_valid = 0
+        self.eof = False
+        self.end = False
+        self.archive_offset = -1
+        self.eocd_offset = -1
+        self.cd_offset = -1
+        self.cd_size = -1
+        self.comment = ""
+        self.entries = []
+        self.bad_entries = []
+        self.forward_walk = False
+        self.zip64 = False
+        self.carve_offset = 0
+        self.extension = []
+        self.data = ""
+
+    def _FindEOCD(self):
+        """
+        Looks for a consistent end of central directory record: its central directory has to end
+        right where the record starts.
+
+        When the data starts with a local file header, the archive starts there too: the EOCD is
+        searched forward and the first one whose archive starts at offset 0 is taken. Carved data
+        often holds more archives after this one, their EOCDs are not this archive's.
+
+        Otherwise, a whole ZIP file has the EOCD within its last 65557 bytes (22 bytes plus a
+        comment of at most 65535 bytes), so that's searched backwards first. Carved data usually
+        goes on past the end of the archive, in that case the EOCD is searched forward.
+
+        :return: the EOCD as a namedtuple, or None if there's no valid one (namedtuple)
+        """
+        data = self.data
+        data_len = len(data)
+        if data.startswith(self.sig_local):
+            pos = data.find(self.sig_eocd)
+            while pos >= 0:
+                eocd = self._CheckEOCD(pos, 0)
+                if eocd:
+                    return eocd
+                pos = data.find(self.sig_eocd, pos + 1)
+            return None
+        pos = data.rfind(self.sig_eocd, max(0, data_len - 65557))
+        while pos >= 0:
+            eocd = self._CheckEOCD(pos)
+            if eocd:
+                return eocd
+            pos = data.rfind(self.sig_eocd, max(0, data_len - 65557), pos)
+        pos = data.find(self.sig_eocd)
+        while 0 <= pos < data_len - 65557:
+            eocd = self._CheckEOCD(pos)
+            if eocd:
+                return eocd
+            pos = data.find(self.sig_eocd, pos + 1)
+        return None
+
+    def _ParseEOCD(self, pos):
+        """
+        Parses the end of central directory record at a given offset, along with the ZIP64 locator
+        and record that come right before it, if there are any. The ZIP64 values replace the ones
+        in the EOCD.
+
+        :param pos: offset of a "PK\\x05\\x06" signature (int)
+        :return: tuple of (EOCD namedtuple, offset where the central directory ends, ZIP64 flag),
+            or None if the record doesn't fit in the data (tuple)
+        """
+        data = self.data
+        if pos < 0 or pos + self.st_eocd.size > len(data):
+            return None
+        eocd = self.nt_eocd._make(self.st_eocd.unpack_from(data, pos))
+        locator_pos = pos - self.st_locator64.size
+        if locator_pos < 0 or data[locator_pos: locator_pos + 4] != "PK\x06\x07":
+            return eocd, pos, False
+        record_offset = self.st_locator64.unpack_from(data, locator_pos)[2]
+        # the record usually has no extensible data, so it ends right at the locator. If it isn't
+        # there, the offset from the locator is tried, which is only right when the archive starts
+        # at the start of the data
+        record_pos = locator_pos - self.st_eocd64.size
+        if record_pos < 0 or data[record_pos: record_pos + 4] != "PK\x06\x06":
+            record_pos = record_offset
+        if data[record_pos: record_pos + 4] != "PK\x06\x06" or \
+                record_pos + self.st_eocd64.size > locator_pos:
+            return eocd, pos, False
+        record = self.nt_eocd64._make(self.st_eocd64.unpack_from(data, record_pos))
+        if record_pos + 12 + record.record_size != locator_pos:
+            return eocd, pos, False
+        eocd = eocd._replace(disk=record.disk, disk_cd=record.disk_cd,
+                             disk_entries=record.disk_entries, total_entries=record.total_entries,
+                             cd_size=record.cd_size, cd_offset=record.cd_offset)
+        return eocd, record_pos, True
+
+    def _CheckEOCD(self, pos, archive_start=None):
+        """
+        Checks whether there's a consistent end of central directory record at a given offset, and
+        if there is, sets the offsets of the archive and its central directory.
+
+        :param pos: offset of a "PK\\x05\\x06" signature (int)
+        :param archive_start: where the archive must start, None for anywhere (int)
+        :return: the EOCD as a namedtuple, or None if it isn't valid (namedtuple)
+        """
+        parsed = self._ParseEOCD(pos)
+        if parsed is None:
+            return None
+        eocd, cd_end, zip64 = parsed
+        archive_offset = cd_end - eocd.cd_size - eocd.cd_offset
+        if (eocd.disk != 0 or eocd.disk_cd != 0 or eocd.disk_entries != eocd.total_entries or
+                archive_offset < 0 or archive_start not in (None, archive_offset) or
+                eocd.total_entries * 46 > eocd.cd_size or
+                pos + self.st_eocd.size + eocd.comment_len > len(self.data)):
+            return None
+        cd_offset = archive_offset + eocd.cd_offset
+        if eocd.total_entries and self.data[cd_offset: cd_offset + 4] != self.sig_central:
+            return None
+        self.archive_offset = archive_offset
+        self.eocd_offset = pos
+        self.cd_offset = cd_offset
+        self.cd_size = eocd.cd_size
+        self.zip64 = zip64
+        return eocd
+
+    def _Zip64Extra(self, extra, usize, csize, offset):
+        """
+        Takes the 64-bit values out of the ZIP64 extended information extra field. Only the values
+        that are 0xffffffff in the header are stored there, always in this order.
+
+        :param extra: the extra field of a local or central directory header (string)
+        :param usize: uncompressed size from the header (int)
+        :param csize: compressed size from the header (int)
+        :param offset: local header offset from the header, 0 for local headers (int)
+        :return: tuple of (usize, csize, offset, whether there was a ZIP64 block) (tuple)
+        """
+        pos = 0
+        while pos + self.st_extra.size <= len(extra):
+            header_id, size = self.st_extra.unpack_from(extra, pos)
+            pos += self.st_extra.size
+            if header_id == 0x0001:
+                values = [usize, csize, offset]
+                block_end = min(pos + size, len(extra))
+                for i in xrange(3):
+                    if values[i] == 0xffffffff and pos + 8 <= block_end:
+                        values[i], = self.st_ulonglong.unpack_from(extra, pos)
+                        pos += 8
+                return values[0], values[1], values[2], True
+            pos += size
+        return usize, csize, offset, False
+
+    def _ValidateCentralDirectory(self, eocd):
+        """
+        Walks the central directory, checking that every entry matches its local file header.
+
+        :param eocd: as returned by _FindEOCD (namedtuple)
+        """
+        data = self.data
+        cd_end = self.cd_offset + self.cd_size
+        pos = self.cd_offset
+        for x in xrange(eocd.total_entries):
+            if pos + self.st_central.size > cd_end:
+                self.is_valid = False
+                return
+            entry = self.nt_central._make(self.st_central.unpack_from(data, pos))
+            name_pos = pos + self.st_central.size
+            name = data[name_pos: name_pos + entry.name_len]
+            extra_pos = name_pos + entry.name_len
+            pos = extra_pos + entry.extra_len + entry.comment_len
+            if entry.signature != self.sig_central or pos > cd_end:
+                self.is_valid = False
+                return
+            usize, csize, local_offset = entry.usize, entry.csize, entry.local_offset
+            if 0xffffffff in (usize, csize, local_offset):
+                usize, csize, local_offset = self._Zip64Extra(
+                    data[extra_pos: extra_pos + entry.extra_len], usize, csize, local_offset)[:3]
+            self.entries.append({
+                "name": name,
+                "offset": self.archive_offset + local_offset,
+                "method": entry.method,
+                "flags": entry.flags,
+                "crc": entry.crc,
+                "csize": csize,
+                "usize": usize,
+                "data_offset": -1,
+                "end": -1,
+                "crc_ok": None,
+            })
+        if pos != cd_end:
+            self.is_valid = False
+            return
+        # now every local file header, in the order they are in the file, so each one can be
+        # checked to end before the next one starts
+        entries = sorted(self.entries, key=lambda e: e["offset"])
+        last_end = self.archive_offset
+        for entry in entries:
+            entry["end"] = self._CheckLocalHeader(entry)
+            if entry["end"] < 0 or entry["offset"] < last_end or entry["end"] > self.cd_offset:
+                # the members before this one are still good, which is what a carver can use
+                self._SetValidBytes(last_end)
+                self.is_valid = False
+                return
+            last_end = entry["end"]
+
+    def _CheckLocalHeader(self, entry):
+        """
+        Checks a local file header against its central directory entry.
+
+        :param entry: central directory entry, as stored in self.entries (dict)
+        :return: offset where the entry's data (and data descriptor) ends, or -1 if the local
+            header doesn't match (int)
+        """
+        data = self.data
+        pos = entry["offset"]
+        if pos + self.st_local.size > len(data):
+            return -1
+        local = self.nt_local._make(self.st_local.unpack_from(data, pos))
+        name_pos = pos + self.st_local.size
+        if (local.signature != self.sig_local or local.method != entry["method"] or
+                data[name_pos: name_pos + local.name_len] != entry["name"]):
+            return -1
+        extra_pos = name_pos + local.name_len
+        usize, csize, offset, zip64 = self._Zip64Extra(
+            data[extra_pos: extra_pos + local.extra_len], local.usize, local.csize, 0)
+        if not local.flags & 0x08 and \
+                (local.crc, csize, usize) != (entry["crc"], entry["csize"], entry["usize"]):
+            return -1
+        entry["data_offset"] = extra_pos + local.extra_len
+        end = entry["data_offset"] + entry["csize"]
+        if local.flags & 0x08:
+            # data descriptor: crc, csize and usize (64-bit sizes for ZIP64 members), with an
+            # optional signature before them
+            if data[end: end + 4] == "PK\x07\x08":
+                end += 4
+            end += 20 if zip64 else 12
+        return end
+
+    def _WalkLocalHeaders(self):
+        """
+        Walks the local file headers forward from the start of the data, for archives whose
+        central directory is missing or cut short. Each member is skipped using its compressed
+        size, or for streamed members (flag bit 3) by looking for the data descriptor that closes
+        it. The members that are complete end up in self.entries.
+        """
+        data = self.data
+        data_len = len(data)
+        self.forward_walk = True
+        self.archive_offset = 0
+        self.is_valid = data.startswith(self.sig_local)
+        pos = 0
+        while self.is_valid:
+            if pos == data_len or data.startswith(self.sig_central, pos):
+                # cut right at the end of a member, or the central directory is there but its end
+                # record isn't
+                self.eof = True
+                break
+            if pos + self.st_local.size > data_len:
+                self.eof = True
+                break
+            local = self.nt_local._make(self.st_local.unpack_from(data, pos))
+            if local.signature != self.sig_local:
+                self.is_valid = False
+                break
+            name_pos = pos + self.st_local.size
+            extra_pos = name_pos + local.name_len
+            usize, csize, offset, zip64 = self._Zip64Extra(
+                data[extra_pos: extra_pos + local.extra_len], local.usize, local.csize, 0)
+            entry = {
+                "name": data[name_pos: extra_pos],
+                "offset": pos,
+                "method": local.method,
+                "flags": local.flags,
+                "crc": local.crc,
+                "csize": csize,
+                "usize": usize,
+                "data_offset": extra_pos + local.extra_len,
+                "end": -1,
+                "crc_ok": None,
+            }
+            if local.flags & 0x08:
+                entry["end"] = self._FindDataDescriptor(entry, zip64)
+            elif entry["data_offset"] + csize <= data_len:
+                entry["end"] = entry["data_offset"] + csize
+            if entry["end"] < 0:
+                self.eof = True
+                break
+            self.entries.append(entry)
+            pos = entry["end"]
+            self._SetValidBytes(pos)
+
+    def _FindDataDescriptor(self, entry, zip64):
+        """
+        Finds the data descriptor after a streamed member, and takes the CRC-32 and sizes from it.
+
+        The descriptor may or may not start with its "PK\\x07\\x08" signature. Every "PK" after the
+        member's data is a candidate: either the signature itself or the next header right after
+        an unsigned descriptor. The compressed size in the descriptor has to match the distance to
+        the data, which rules out "PK" found inside the compressed data.
+
+        :param entry: the member's entry, as built by _WalkLocalHeaders (dict)
+        :param zip64: whether the member has a ZIP64 extra field, and so 64-bit sizes in the data
+            descriptor (bool)
+        :return: offset right after the data descriptor, or -1 if it wasn't found (int)
+        """
+        data = self.data
+        st_descriptor = self.st_descriptor64 if zip64 else self.st_descriptor
+        size = st_descriptor.size
+        start = entry["data_offset"]
+        pos = data.find("PK", start)
+        while pos >= 0:
+            if data.startswith("PK\x07\x08", pos) and pos + 4 + size <= len(data):
+                crc, csize, usize = st_descriptor.unpack_from(data, pos + 4)
+                if csize == pos - start:
+                    entry["crc"], entry["csize"], entry["usize"] = crc, csize, usize
+                    return pos + 4 + size
+            if (data.startswith(self.sig_local, pos) or data.startswith(self.sig_central, pos)) \
+                    and pos - size >= start:
+                crc, csize, usize = st_descriptor.unpack_from(data, pos - size)
+                if csize == pos - size - start:
+                    entry["crc"], entry["csize"], entry["usize"] = crc, csize, usize
+                    return pos
+            pos = data.find("PK", pos + 1)
+        return -1
+
+    def _GetExtension(self):
+        """
+        Tells the ZIP based formats apart by the names of their members, like _GetExtension in
+        MSOLEValidator does with the stream names. Nothing is decompressed: the only content read
+        is the ODF "mimetype" member, which is always stored.
+        """
+        self.extension = []
+        if not self.is_valid:
+            return
+        names = set(entry["name"] for entry in self.entries)
+        top_dirs = set(name.split("/", 1)[0] for name in names if "/" in name)
+        if "[Content_Types].xml" in names:
+            for top_dir, extension in self.ooxml_dirs:
+                if top_dir in top_dirs:
+                    self.extension.append(extension)
+        mimetype = self.entries[0] if self.entries else None
+        if mimetype and mimetype["name"] == "mimetype" and mimetype["method"] == 0:
+            content = self.data[mimetype["data_offset"]: mimetype["data_offset"] +
+                                mimetype["csize"]].strip()
+            if content in self.odf_mimetypes:
+                self.extension.append(self.odf_mimetypes[content])
+        if "META-INF/MANIFEST.MF" in names or "AndroidManifest.xml" in names:
+            if "classes.dex" in names or "AndroidManifest.xml" in names:
+                self.extension.append(".apk")
+            else:
+                self.extension.append(".jar")
+        if not self.extension:
+            self.extension.append(".zip")
+
+    def _VerifyEntry(self, entry):
+        """
+        Decompresses a member and checks its CRC-32 and uncompressed size. Deflate input and
+        output go through in chunks of at most inflate_chunk bytes; bzip2 input goes in slices of
+        bz2_slice bytes, so its output is bounded by the few blocks a slice can finish. The output
+        is only used to update the CRC and then dropped, and decompression stops as soon as it
+        goes past the uncompressed size of the entry.
+
+        Stores the result in entry["crc_ok"]: True or False, or None when the member can't be
+        checked (encrypted or compressed with an unsupported method).
+
+        :param entry: central directory entry, as stored in self.entries (dict)
+        """
+        if entry["flags"] & 0x01:
+            return
+        if entry["method"] == 0:
+            decompressor = None
+        elif entry["method"] == 8:
+            decompressor = zlib.decompressobj(-15)
+        elif entry["method"] == 12:
+            decompressor = bz2.BZ2Decompressor()
+        else:
+            return
+        data = self.data
+        method = entry["method"]
+        usize = entry["usize"]
+        chunk = self.inflate_chunk
+        step = self.bz2_slice if method == 12 else chunk
+        crc = 0
+        size = 0
+        pos = entry["data_offset"]
+        data_end = pos + entry["csize"]
+        try:
+            while pos < data_end and size <= usize:
+                piece = data[pos: min(pos + step, data_end)]
+                pos += len(piece)
+                if method == 8:
+                    piece = decompressor.decompress(piece, chunk)
+                elif method == 12:
+                    piece = decompressor.decompress(piece)
+                crc = zlib.crc32(piece, crc)
+                size += len(piece)
+                # max_length keeps the deflate output bounded, whatever didn't fit is left in
+                # unconsumed_tail for the next round
+                while method == 8 and decompressor.unconsumed_tail and size <= usize:
+                    piece = decompressor.decompress(decompressor.unconsumed_tail, chunk)
+                    crc = zlib.crc32(piece, crc)
+                    size += len(piece)
+            if method == 8 and size <= usize:
+                piece = decompressor.flush()
+                crc = zlib.crc32(piece, crc)
+                size += len(piece)
+        except (zlib.error, IOError, EOFError):
+            entry["crc_ok"] = False
+            return
+        entry["crc_ok"] = crc & 0xffffffff == entry["crc"] and size == entry["usize"]
+
+    def _VerifyEntries(self):
+        """
+        Runs _VerifyEntry over every member, on a thread pool if there's more than one worker. If
+        any member fails, the archive is only valid up to the start of the first one that failed.
+        """
+        if self.workers > 1 and len(self.entries) > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                pool.map(self._VerifyEntry, self.entries)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for entry in self.entries:
+                self._VerifyEntry(entry)
+        self.bad_entries = [entry["name"] for entry in self.entries if entry["crc_ok"] is False]
+        if self.bad_entries:
+            self._SetValidBytes(min(entry["offset"] for entry in self.entries
+                                    if entry["crc_ok"] is False))
+            self.is_valid = False
+            self.end = False
+
+    def GetDetails(self):
+        """
+        Returns a dictionary with detailed information about the last validated file.
+
+        :return: dict of:
+            * archive_offset (int) -- where the archive starts, non-zero for self-extracting
+                archives and other data prepended to the ZIP
+            * cd_offset (int)
+            * cd_size (int)
+            * eocd_offset (int)
+            * comment (string)
+            * zip64 (bool) -- the sizes and offsets came from a ZIP64 end of central directory
+            * carve_offset (int) -- offset of the validated data in the image, for
+                ValidateFromEOCD. Every other offset is relative to the validated data
+            * entries (list of dicts of name, offset, method, flags, crc, csize, usize,
+                data_offset, end and crc_ok)
+            * forward_walk (bool) -- there was no EOCD, so entries are the complete members found
+                walking the local file headers, the ones that can be recovered
+            * bad_entries (list of strings) -- names of the members that failed the CRC-32 or size
+                check, only with deep=True
+        """
+        return {
+            'archive_offset': self.archive_offset,
+            'cd_offset': self.cd_offset,
+            'cd_size': self.cd_size,
+            'eocd_offset': self.eocd_offset,
+            'comment': self.comment,
+            'entries': self.entries,
+            'bad_entries': self.bad_entries,
+            'forward_walk': self.forward_walk,
+            'zip64': self.zip64,
+            'carve_offset': self.carve_offset,
+            'extensions': self.extension,
+        }
+
+    def Validate(self, fd):
+        """
+        Validates a file-like object to determine if its a valid ZIP file.
+
+        :param fd: file descriptor (file-like)
+        :return: True on valid ZIP, False otherwise (bool)
+        """
+        self._Cleanup()
+        if type(fd) == file:
+            self.data = fd.read()
+        elif type(fd) == str:
+            self.data = fd
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        return self._ValidateData()
+
+    def ValidateFromEOCD(self, fd, eocd_offset):
+        """
+        Validates a ZIP archive inside a bigger image, given the offset of its end of central
+        directory record. The start of the archive is worked out from the central directory's
+        offset and size, and only the archive itself is read and validated.
+
+        bytes_last_valid and every offset in GetDetails() are relative to the start of the archive,
+        which is GetDetails()['carve_offset'] in the image.
+
+        :param fd: the image, opened for binary reads (file or str)
+        :param eocd_offset: offset of a "PK\\x05\\x06" signature in the image (int)
+        :return: True on valid ZIP, False otherwise (bool)
+        """
+        self._Cleanup()
+        if type(fd) == file:
+            def Read(offset, length):
+                fd.seek(offset)
+                return fd.read(length)
+        elif type(fd) == str:
+            def Read(offset, length):
+                return fd[offset: offset + length]
+        else:
+            raise Exception("Argument must be either a file or a string.")
+        # the EOCD, its comment, and the ZIP64 record and locator that may come before it
+        tail_offset = max(0, eocd_offset - self.st_eocd64.size - self.st_locator64.size)
+        self.data = Read(tail_offset, eocd_offset - tail_offset + self.st_eocd.size + 65535)
+        parsed = self._ParseEOCD(eocd_offset - tail_offset)
+        if parsed is None or parsed[0].signature != self.sig_eocd:
+            self.eof = parsed is None
+            self.data = ""
+            return False
+        eocd, cd_end, zip64 = parsed
+        archive_offset = tail_offset + cd_end - eocd.cd_size - eocd.cd_offset
+        archive_end = eocd_offset + self.st_eocd.size + eocd.comment_len
+        if archive_offset < 0:
+            self.data = ""
+            return False
+        self.carve_offset = archive_offset
+        self.data = Read(archive_offset, archive_end - archive_offset)
+        return self._ValidateData()
+
+    def _ValidateData(self):
         """
-        Since Validate is replaced by zipfile's is_zipfile function, there's no real status we can
-        return. Just to make sure nobody changes the values, GetStatus returns a fixed result.
+        Validates the archive in self.data, which Validate and ValidateFromEOCD have already read.
 
-        :return: False, False, -1, False
+        :return: True on valid ZIP, False otherwise (bool)
         """
-        return False, False, -1, False
\ No newline at end of file
+        eocd = self._FindEOCD()
+        if eocd is None:
+            self._WalkLocalHeaders()
+        else:
+            self.is_valid = True
+            self._ValidateCentralDirectory(eocd)
+            if self.is_valid:
+                comment_pos = self.eocd_offset + self.st_eocd.size
+                self.comment = self.data[comment_pos: comment_pos + eocd.comment_len]
+                self._SetValidBytes(comment_pos + eocd.comment_len)
+                self.end = True
+        if self.is_valid and self.deep:
+            self._VerifyEntries()
+        self._GetExtension()
+        return self.is_valid
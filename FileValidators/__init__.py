@@ -5,10 +5,20 @@ from JPGValidator import JPGValidator
 from MSOLEValidator import MSOLEValidator
 from PNGValidator import PNGValidator
 from SQLiteValidator import SQLiteValidator
+from SQLiteWALValidator import SQLiteWALValidator
+from SQLiteJournalValidator import SQLiteJournalValidator
 from ZIPValidator import ZIPValidator
 from ICSValidator import ICSValidator
 from LNKValidator import LNKValidator
+from LNKBulkParser import LNKBulkParser
+from FileTime import FileTime
 from NTFSFileRecordValidator import NTFSFileRecordValidator
+from NTFSIndexRecordValidator import NTFSIndexRecordValidator
+from NTFSLogFileValidator import NTFSLogFileValidator
+from USNJournalValidator import USNJournalValidator
+from MFTParser import MFTParser
+from MFTPathIndex import MFTPathIndex
+from MBoxParser import MBoxParser
 from Validator import Validator
 
 __VER__ = "0.6.5"
@@ -28,7 +28,7 @@ Currently supported formats:
 * JPG
 * MS-OLE
 * SQLite 3
-* ZIP as a mock only -- it checks with zipfile.is_zipfile
+* ZIP
 """
 
 setup(